@@ -1,46 +1,142 @@
-from ytmusicapi import YTMusic
+import threading
+
+from core.cache import ResponseCache
+from core.trace import tracer
+from core.track import Track, split_artists
+
+def api_error(results: list):
+    """The message if a request failed, else None. Failures come back as a single [{"error": str}] entry."""
+    if len(results) == 1 and isinstance(results[0], dict):
+        return results[0].get("error")
+    return None
 
 class TusicAPI:
-    def __init__(self):
-        self.ytmusic = YTMusic()
+    def __init__(self, db=None, cache_size: int = 256, ttls: dict = None, ytmusic=None, http=None):
+        # A client can be passed in (the benchmarks use a fake one), otherwise it is built on first use
+        self._ytmusic = ytmusic
+        # Shared HttpClient, YTMusic then talks over its pooled keep-alive session
+        self.http = http
+        self._client_lock = threading.Lock()
+        self.db = db
+        self.cache = ResponseCache(max_entries=cache_size, db=db, ttls=ttls)
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def ytmusic(self):
+        # ytmusicapi is slow to import, so the client is only built on the first request that misses the cache
+        with self._client_lock:
+            if self._ytmusic is None:
+                from ytmusicapi import YTMusic
+                if self.http is not None:
+                    self._ytmusic = YTMusic(requests_session=self.http.session)
+                else:
+                    self._ytmusic = YTMusic()
+            return self._ytmusic
+
+    def _cached(self, endpoint: str, key: str, fetch, on_update=None):
+        value, fresh = self.cache.get(endpoint, key)
+        if value is not None:
+            if not fresh:
+                self._revalidate(endpoint, key, fetch, value, on_update)
+            return value
+
+        value = fetch()
+        if self._cacheable(value):
+            self.cache.put(endpoint, key, value)
+        return value
+
+    @staticmethod
+    def _cacheable(value) -> bool:
+        # Empty lists and error payloads are never worth remembering
+        return bool(value) and api_error(value) is None
 
-    def search_songs(self, query: str) -> list:
+    def _revalidate(self, endpoint: str, key: str, fetch, stale, on_update):
+        with self._refresh_lock:
+            if (endpoint, key) in self._refreshing:
+                return
+            self._refreshing.add((endpoint, key))
+
+        def refresh():
+            try:
+                value = fetch()
+                if self._cacheable(value):
+                    self.cache.put(endpoint, key, value)
+                    if on_update and value != stale:
+                        on_update(value)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard((endpoint, key))
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    @tracer.traced("api.search_songs")
+    def search_songs(self, query: str, on_update=None) -> list:
+        """Cached search. If a stale result is served, on_update gets the refreshed list from a background thread."""
+        key = ResponseCache.normalize(query)
+        return self._cached('search', key, lambda: self._fetch_search(query), on_update)
+
+    @tracer.traced("api.fetch_search")
+    def _fetch_search(self, query: str) -> list:
         try:
             results = self.ytmusic.search(query, filter="songs", limit=50)
-            tracks = []
-            for item in results:
-                artists = ", ".join([a['name'] for a in item.get('artists', [])])
-                tracks.append({
-                    'id': item['videoId'],
-                    'title': item['title'],
-                    'artist': artists,
-                    'duration': item.get('duration', 'Unknown')
-                })
-            return tracks
+            return [self._track_from_item(item) for item in results]
         except Exception:
             return []
 
-    def get_radio_songs(self, video_id: str) -> list:
+    @staticmethod
+    def _track_from_item(item: dict) -> Track:
+        # Search results and playlist entries share this shape
+        artists = [a['name'] for a in item.get('artists') or [] if a.get('name')]
+        duration = item.get('duration_seconds') or item.get('duration') or 0
+        return Track.create(item['videoId'], item['title'], artists, duration)
+
+    @tracer.traced("api.get_playlist_tracks")
+    def get_playlist_tracks(self, playlist_id: str) -> list:
+        """Every playable track of a YouTube / YouTube Music playlist. Raises if the playlist can't be read."""
+        playlist = self.ytmusic.get_playlist(playlist_id, limit=None)
+        # Deleted or region-locked entries come back without a videoId
+        return [self._track_from_item(item) for item in playlist.get('tracks', []) if item.get('videoId')]
+
+    @tracer.traced("api.get_track")
+    def get_track(self, video_id: str):
+        """Metadata for a bare video id, or None if YouTube doesn't know it."""
+        try:
+            details = self.ytmusic.get_song(video_id).get('videoDetails') or {}
+        except Exception:
+            return None
+        if not details.get('title'):
+            return None
+
+        # Auto-generated music channels are called "<Artist> - Topic"
+        author = details.get('author', '').removesuffix(" - Topic")
+        return Track.create(video_id, details['title'], split_artists(author), int(details.get('lengthSeconds') or 0))
+
+    @tracer.traced("api.get_radio_songs")
+    def get_radio_songs(self, video_id: str, on_update=None) -> list:
+        return self._cached('radio', video_id, lambda: self._remember_radio(video_id, self._fetch_radio(video_id)), on_update)
+
+    def _remember_radio(self, video_id: str, tracks: list) -> list:
+        # Every fresh radio feeds the local recommendations, cache hits were already saved when fetched
+        if self.db is not None and self._cacheable(tracks):
+            self.db.set_radio_neighbors(video_id, tracks)
+        return tracks
+
+    @tracer.traced("api.fetch_radio")
+    def _fetch_radio(self, video_id: str) -> list:
         try:
             # The RDAMVM prefix forces YouTube to generate an endless algorithmic radio mix
             playlist = self.ytmusic.get_watch_playlist(videoId=video_id, playlistId=f"RDAMVM{video_id}")
             tracks = []
-            
+
             for item in playlist.get('tracks', []):
                 current_id = item.get('videoId')
-                
+
                 if not current_id or current_id == video_id:
-                    continue 
-                
-                artists_list = item.get('artists', [])
-                artists = ", ".join([a['name'] for a in artists_list if 'name' in a]) if artists_list else "Unknown Artist"
-                
-                tracks.append({
-                    'id': current_id,
-                    'title': item.get('title', 'Unknown Title'),
-                    'artist': artists,
-                    'duration': item.get('length', 'Unknown')
-                })
+                    continue
+
+                artists = [a['name'] for a in item.get('artists', []) if 'name' in a]
+                tracks.append(Track.create(current_id, item.get('title', 'Unknown Title'), artists, item.get('length', 0)))
             return tracks
         except Exception as e:
             # Pass the error string back so the UI can display it
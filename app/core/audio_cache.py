@@ -0,0 +1,125 @@
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+class AudioCache:
+    """Keeps downloaded audio under ~/.cache/tusic/audio within a byte budget.
+
+    Least recently played files are evicted first. Pinned tracks are never
+    evicted, so they stay playable offline.
+    """
+
+    # googlevideo throttles single long requests, so fetch in ranged chunks like yt-dlp does
+    CHUNK_SIZE = 10 * 1024 * 1024
+
+    def __init__(self, db, max_bytes: int = 2 * 1024 ** 3, session=None, http=None):
+        self.db = db
+        self.max_bytes = max_bytes
+        self._session = session
+        self.http = http
+        # Optional, called with bytes/second for every full chunk downloaded
+        self.on_throughput = None
+        self.root = Path.home() / ".cache" / "tusic" / "audio"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._downloading = set()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            if self.http is not None:
+                self._session = self.http.session
+            else:
+                import requests
+                self._session = requests.Session()
+        return self._session
+
+    def path_for(self, video_id: str):
+        """Returns the local file for a track, or None if it isn't cached."""
+        entry = self.db.get_audio_entry(video_id)
+        if entry is None or entry[0] is None:
+            return None
+
+        path = Path(entry[0])
+        if not path.exists():
+            self.db.delete_audio_entry(video_id, keep_pin=True)
+            return None
+
+        self.db.touch_audio_entry(video_id, time.time())
+        return path
+
+    def has(self, video_id: str) -> bool:
+        # Unlike path_for, this doesn't count as a use
+        entry = self.db.get_audio_entry(video_id)
+        return bool(entry and entry[0]) and Path(entry[0]).exists()
+
+    def is_pinned(self, video_id: str) -> bool:
+        entry = self.db.get_audio_entry(video_id)
+        return bool(entry and entry[2])
+
+    def pin(self, video_id: str, pinned: bool = True):
+        self.db.set_audio_pinned(video_id, pinned)
+        if not pinned:
+            self.evict()
+
+    def store_in_background(self, video_id: str, url: str):
+        with self._lock:
+            if video_id in self._downloading:
+                return
+            self._downloading.add(video_id)
+        threading.Thread(target=self._download, args=(video_id, url), daemon=True).start()
+
+    def _download(self, video_id: str, url: str):
+        target = self.root / f"{video_id}.{self._extension(url)}"
+        partial = target.with_name(target.name + ".part")
+        try:
+            with open(partial, "wb") as f:
+                start = 0
+                while True:
+                    end = start + self.CHUNK_SIZE - 1
+                    started = time.perf_counter()
+                    resp = self.session.get(url, headers={"Range": f"bytes={start}-{end}"}, timeout=30)
+                    resp.raise_for_status()
+                    # Short tail chunks are mostly request latency, only full ones say how fast the link is
+                    if self.on_throughput and len(resp.content) == self.CHUNK_SIZE:
+                        self.on_throughput(len(resp.content) / (time.perf_counter() - started))
+                    f.write(resp.content)
+                    if resp.status_code != 206 or len(resp.content) < self.CHUNK_SIZE:
+                        break
+                    start = end + 1
+
+            partial.replace(target)
+            self.db.set_audio_entry(video_id, str(target), target.stat().st_size, time.time())
+            self.evict()
+        except Exception:
+            # A half-written file is worse than none, mpv will just stream next time
+            partial.unlink(missing_ok=True)
+        finally:
+            with self._lock:
+                self._downloading.discard(video_id)
+
+    @staticmethod
+    def _extension(url: str) -> str:
+        mime = parse_qs(urlparse(url).query).get("mime", ["audio/webm"])[0]
+        return "m4a" if "mp4" in mime else "webm"
+
+    def remove(self, video_id: str):
+        entry = self.db.get_audio_entry(video_id)
+        if entry is None:
+            return
+        if entry[0]:
+            Path(entry[0]).unlink(missing_ok=True)
+        self.db.delete_audio_entry(video_id, keep_pin=False)
+
+    def evict(self):
+        total = self.db.audio_cache_size()
+        if total <= self.max_bytes:
+            return
+
+        for video_id, path, size in self.db.get_evictable_audio():
+            Path(path).unlink(missing_ok=True)
+            self.db.delete_audio_entry(video_id, keep_pin=False)
+            total -= size
+            if total <= self.max_bytes:
+                break
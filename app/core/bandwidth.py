@@ -0,0 +1,90 @@
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlparse
+
+# Audio-only itags YouTube serves, with their nominal bitrate (kbps)
+ITAG_ABR = {"249": 50, "250": 70, "251": 160, "139": 48, "140": 128, "141": 256, "599": 31, "600": 35}
+
+
+def format_from_url(url: str) -> dict:
+    """What little can be told about a stream from its googlevideo URL alone."""
+    parsed = urlparse(url)
+    itag = parse_qs(parsed.query).get("itag", [None])[0]
+    if itag is None:
+        match = re.search(r"/itag/(\d+)", parsed.path)
+        itag = match.group(1) if match else None
+    mime = parse_qs(parsed.query).get("mime", [""])[0]
+    return {"format_id": itag, "codec": "opus" if "webm" in mime else "aac" if "mp4" in mime else None,
+            "abr": ITAG_ABR.get(itag), "best_abr": None}
+
+
+class ThroughputMeter:
+    """Rolling estimate of how fast audio actually arrives, in kbps.
+
+    Fed with bytes/second samples from mpv's demuxer cache while it is filling
+    and from audio cache downloads. The estimate is the median of recent
+    samples, so one slow chunk doesn't drag the quality down.
+    """
+
+    WINDOW = 30
+    # Samples older than this describe a network we may no longer be on
+    MAX_AGE = 600
+
+    def __init__(self, window: int = WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, bytes_per_second: float):
+        if bytes_per_second > 0:
+            with self._lock:
+                self._samples.append((time.monotonic(), bytes_per_second * 8 / 1000))
+
+    def estimate(self):
+        cutoff = time.monotonic() - self.MAX_AGE
+        with self._lock:
+            recent = [kbps for at, kbps in self._samples if at >= cutoff]
+        return statistics.median(recent) if recent else None
+
+
+class FormatPolicy:
+    """Picks how much audio bitrate to ask yt-dlp for.
+
+    quality is "auto" or one of the tier names. Auto takes the best tier the
+    measured throughput covers HEADROOM times over (mpv reads ahead, and a
+    prefetch or download may be sharing the link). max_kbps caps every tier.
+    """
+
+    # Best first. The nominal kbps is what a tier asks for at most, "high" takes whatever is best.
+    TIERS = (("high", 160), ("medium", 128), ("low", 70), ("lowest", 50))
+    HEADROOM = 4
+
+    def __init__(self, meter: ThroughputMeter, quality: str = "auto", max_kbps: float = None):
+        self.meter = meter
+        self.quality = quality if quality in dict(self.TIERS) else "auto"
+        self.max_kbps = max_kbps
+
+    def tier(self) -> str:
+        limit = self.max_kbps
+        if self.quality != "auto":
+            limit = min(limit or float("inf"), dict(self.TIERS)[self.quality])
+        else:
+            estimate = self.meter.estimate()
+            if estimate is not None:
+                limit = min(limit or float("inf"), estimate / self.HEADROOM)
+
+        for name, kbps in self.TIERS:
+            if limit is None or limit >= kbps:
+                return name
+        return self.TIERS[-1][0]
+
+    def format_spec(self, tier: str = None):
+        """yt-dlp format string for the tier, None when the extractor's own default should be used."""
+        tier = tier or self.tier()
+        if tier == "high":
+            return None
+        kbps = dict(self.TIERS)[tier]
+        # Opus holds up better than AAC at low bitrates. Nothing small enough at all means take the smallest.
+        return f"bestaudio[abr<={kbps}][acodec=opus]/bestaudio[abr<={kbps}]/worstaudio/best"
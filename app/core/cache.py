@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+from core.track import Track
+
+class ResponseCache:
+    """Small LRU for API responses (lists of Track), optionally backed by the SQLite database."""
+
+    # How long a response counts as fresh, per endpoint (seconds)
+    DEFAULT_TTLS = {
+        'search': 6 * 3600,
+        'radio': 3600,
+    }
+    # Past its TTL an entry is still served while a refresh runs, up to this age
+    STALE_LIMIT = 7 * 24 * 3600
+
+    def __init__(self, max_entries: int = 256, db=None, ttls: dict = None):
+        self.max_entries = max_entries
+        self.db = db
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(key: str) -> str:
+        return " ".join(key.lower().split())
+
+    def get(self, endpoint: str, key: str):
+        """Returns (value, is_fresh). value is None on a miss or when the entry is too old to serve."""
+        cache_key = (endpoint, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+
+        if entry is None and self.db is not None:
+            entry = self.db.get_cached_response(endpoint, key)
+            if entry is not None:
+                entry = ([Track.from_json(item) for item in entry[0]], entry[1])
+                self._remember(cache_key, entry)
+
+        if entry is None:
+            return None, False
+
+        value, stored_at = entry
+        age = time.time() - stored_at
+        if age > self.STALE_LIMIT:
+            return None, False
+        return value, age <= self.ttls.get(endpoint, 0)
+
+    def put(self, endpoint: str, key: str, value):
+        entry = (value, time.time())
+        self._remember((endpoint, key), entry)
+        if self.db is not None:
+            self.db.set_cached_response(endpoint, key, [track.to_json() for track in value], entry[1])
+
+    def _remember(self, cache_key, entry):
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
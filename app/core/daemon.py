@@ -0,0 +1,485 @@
+import json
+import os
+import queue
+import select
+import socket
+import socketserver
+import sys
+import threading
+from collections import deque
+from pathlib import Path
+
+from core.api import TusicAPI, api_error
+from core.audio_cache import AudioCache
+from core.bandwidth import FormatPolicy, ThroughputMeter
+from core.database import Database
+from core.http import HttpClient
+from core.player import Player, Progress, PauseChanged, TrackStarted, TrackEnded
+from core.recommender import Recommender
+from core.remote import encode_event, socket_path
+from core.resolver import StreamResolver
+from core.retention import HistoryCompactor
+from core.trace import tracer
+from core.track import Track
+
+
+def _hung_up(sock) -> bool:
+    # Subscribers never send anything after subscribing, so readable means EOF
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and not sock.recv(1, socket.MSG_PEEK)
+    except OSError:
+        return True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # A client that has gone quiet this long is dropped, its thread isn't kept waiting on it forever.
+    # Clients keep idle connections for less than this (DaemonClient.MAX_IDLE).
+    timeout = 120
+
+    def handle(self):
+        daemon = self.server.tusic
+        try:
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                    cmd, args = request["cmd"], request.get("args") or {}
+                except (ValueError, KeyError, TypeError):
+                    self.send({"id": None, "ok": False, "error": "bad request"})
+                    continue
+
+                if cmd == "subscribe":
+                    self.send({"id": request.get("id"), "ok": True, "result": None})
+                    # Blocks until the client hangs up, the connection carries nothing but events from here
+                    daemon.stream_events(self, player=bool(args.get("player")))
+                    return
+                self.send(daemon.dispatch(request.get("id"), cmd, args))
+        except OSError:
+            pass
+
+    def send(self, message: dict):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TusicDaemon:
+    """Runs playback without the TUI and takes orders over a Unix socket.
+
+    The daemon owns the Player, StreamResolver, TusicAPI and Database, so mpv,
+    the warm yt-dlp extractors and the in-memory caches live as long as it
+    does, not as long as a UI session. The TUI attaches as a thin client
+    (RemotePlayer / RemoteResolver in core/remote.py), scripts and status bars
+    go through tusicctl.py.
+
+    While a TUI is attached it drives playback. Once the last one is gone the
+    daemon plays on through the queue it was handed, topping it up with radio
+    tracks the way Up Next does.
+    """
+
+    # How often progress is passed on to subscribers, when nothing else wakes the event pump first
+    PROGRESS_INTERVAL = 0.25
+
+    def __init__(self, config: dict, path=None):
+        self.config = config
+        self.path = Path(path or socket_path())
+        tracer.enabled = config.get("tracing", True)
+
+        self.db = Database()
+        self.recommender = Recommender(self.db)
+        self.compactor = HistoryCompactor(self.db, config.get("history_retention_days", 365))
+        self.http = HttpClient.from_config(config)
+        self.api = TusicAPI(
+            self.db,
+            cache_size=config.get("response_cache_size", 256),
+            ttls=config.get("response_cache_ttls"),
+            http=self.http,
+        )
+        audio_cache_mb = config.get("audio_cache_mb", 2048)
+        self.audio_cache = AudioCache(self.db, max_bytes=audio_cache_mb * 1024 * 1024, http=self.http) if audio_cache_mb > 0 else None
+        self.throughput = ThroughputMeter()
+        self.format_policy = FormatPolicy(
+            self.throughput,
+            quality=config.get("audio_quality", "auto"),
+            max_kbps=config.get("max_audio_kbps"),
+        )
+        if self.audio_cache is not None:
+            self.audio_cache.on_throughput = self.throughput.add
+        self.resolver = StreamResolver(
+            self.db,
+            pool_size=config.get("resolver_pool_size", 2),
+            disk_cache=config.get("ytdlp_disk_cache", True),
+            audio_cache=self.audio_cache,
+            http=self.http,
+            strategies=config.get("resolver_strategies"),
+            hedge_after=config.get("resolver_hedge_after", 2.5),
+            attempt_timeout=config.get("resolver_attempt_timeout", 20.0),
+            format_policy=self.format_policy,
+        )
+        self.player = Player(
+            cache_profile=config.get("cache_profile", "balanced"),
+            cache_options=config.get("mpv_cache"),
+        )
+        self._wake = threading.Event()
+        self.player.on_event = self._wake.set
+        self.player.on_input_rate = self.throughput.add
+
+        # What plays once the current track ends and no UI is attached to pick the next one
+        self.queue = deque()
+        # When the queue runs dry, carry on with a radio off the last track like Up Next does
+        self.autoradio = config.get("daemon_autoradio", True)
+        # Played on the current station, so its radio doesn't bring them round again. Reset with the station.
+        self.played = set()
+        self.current = None
+        # Attached UIs (subscribers that said player=True), while there are any they drive playback
+        self.controllers = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.server = None
+
+    # Socket
+
+    def serve(self):
+        """Listens until shutdown. Raises RuntimeError if another daemon already owns the socket."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(self.path))
+            except OSError:
+                # Left behind by a daemon that didn't get to clean up
+                self.path.unlink()
+            else:
+                raise RuntimeError(f"a tusic daemon is already listening on {self.path}")
+            finally:
+                probe.close()
+
+        # Only this user gets to drive the player, the socket is never group or world accessible
+        umask = os.umask(0o177)
+        try:
+            self.server = _Server(str(self.path), _Handler)
+        finally:
+            os.umask(umask)
+        self.server.tusic = self
+
+        threading.Thread(target=self._pump, daemon=True).start()
+        threading.Thread(target=self._restore_pinned, daemon=True).start()
+        housekeeping = threading.Timer(30, self.compactor.start)
+        housekeeping.daemon = True
+        housekeeping.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            housekeeping.cancel()
+            self.close()
+
+    def shutdown(self):
+        # serve_forever has to be stopped from another thread than the one running it
+        if self.server is not None:
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def close(self):
+        self._stopped.set()
+        if self.server is not None:
+            self.server.server_close()
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        self.compactor.stop()
+        self.player.stop()
+        self.resolver.close()
+        self.db.close()
+        self.http.close()
+        tracer.close()
+
+    def dispatch(self, request_id, cmd: str, args: dict) -> dict:
+        # "player.seek" is handled by cmd_player_seek and so on
+        handler = getattr(self, "cmd_" + cmd.replace(".", "_"), None)
+        if handler is None:
+            return {"id": request_id, "ok": False, "error": f"unknown command: {cmd}"}
+        try:
+            return {"id": request_id, "ok": True, "result": handler(**args)}
+        except Exception as e:
+            return {"id": request_id, "ok": False, "error": str(e) or type(e).__name__}
+
+    # Events
+
+    def _pump(self):
+        # Player events fan out to every subscriber, and the daemon advances the queue itself when nobody else will
+        while not self._stopped.is_set():
+            self._wake.wait(self.PROGRESS_INTERVAL)
+            self._wake.clear()
+            for event in self.player.poll_events():
+                # Attached UIs keep the stall count from this instead of asking for it
+                extra = {"stalls": self.player.stall_count}
+                if isinstance(event, TrackStarted):
+                    self.current = self.player.current_track or self.current
+                    extra["track"] = self.current.to_json() if self.current else None
+                self._broadcast(encode_event(event, **extra))
+
+                if isinstance(event, TrackEnded) and event.reason == "eof" and not self.controllers:
+                    threading.Thread(target=self._auto_next, args=(self.current,), daemon=True).start()
+
+    def _restore_pinned(self):
+        # Pinned files can vanish (cache dir wiped, failed download), fetch them again
+        if self.audio_cache is None:
+            return
+        for video_id in self.db.get_pinned_missing_audio():
+            try:
+                stream_url = self.resolver.get_stream_url(video_id)
+            except Exception:
+                continue
+            if stream_url.startswith("http"):
+                self.audio_cache.store_in_background(video_id, stream_url)
+
+    def _broadcast(self, message: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for events in subscribers:
+            events.put(message)
+
+    def stream_events(self, handler, player: bool = False):
+        events = queue.SimpleQueue()
+        with self._lock:
+            self._subscribers.add(events)
+            if player:
+                self.controllers += 1
+        try:
+            # Start every subscriber off with the current state, not just what changes from now on
+            handler.send(encode_event(PauseChanged(self.player.paused)))
+            handler.send(encode_event(Progress(self.player.time_pos, self.player.duration)))
+            while not self._stopped.is_set():
+                try:
+                    message = events.get(timeout=1.0)
+                except queue.Empty:
+                    # Nothing might happen for hours, a client that left must not count as attached meanwhile
+                    if _hung_up(handler.connection):
+                        return
+                    continue
+                handler.send(message)
+        finally:
+            with self._lock:
+                self._subscribers.discard(events)
+                if player:
+                    self.controllers -= 1
+
+    def _auto_next(self, finished):
+        # Played to the end, so next time it starts over
+        if finished is not None:
+            self.db.clear_resume_position(finished.id)
+        try:
+            self.cmd_next()
+        except Exception as e:
+            print(f"tusic daemon: couldn't play on: {e}", file=sys.stderr)
+
+    # Playback on the daemon's own account
+
+    def _play(self, track: Track):
+        url = self.resolver.get_stream_url(track.id)
+        if not url:
+            raise RuntimeError(f"no stream found for {track.id}")
+        self.player.play(url, start=self.db.get_resume_position(track.id), track=track)
+        self.current = track
+        self.played.add(track.id)
+        self.db.add_to_history(track)
+        return track.to_json()
+
+    def _lookup(self, video_id: str) -> Track:
+        track = self.db.get_known_tracks([video_id]).get(video_id) or self.api.get_track(video_id)
+        if track is None:
+            raise ValueError(f"unknown video id: {video_id}")
+        return track
+
+    def _next_track(self):
+        with self._lock:
+            if self.queue:
+                return self.queue.popleft()
+        seed = self.current
+        if not self.autoradio or seed is None:
+            return None
+        results = self.api.get_radio_songs(seed.id)
+        if not results or api_error(results):
+            return None
+        fresh = [track for track in results if track.id not in self.played]
+        if not fresh:
+            # Everything this station has to offer was played, start it over rather than fall silent
+            self.played = {seed.id}
+            fresh = [track for track in results if track.id != seed.id]
+            if not fresh:
+                return None
+        with self._lock:
+            self.queue.extend(fresh[1:])
+        return fresh[0]
+
+    # Commands. Keyword arguments come straight from the request's "args".
+
+    def cmd_ping(self):
+        return "pong"
+
+    def cmd_status(self):
+        track = self.player.current_track
+        state = "idle" if self.player.is_idle else "paused" if self.player.paused else "playing"
+        return {
+            "state": state,
+            "track": track.to_json() if track else None,
+            "position": self.player.time_pos,
+            "duration": self.player.duration,
+            "queue": len(self.queue),
+            "attached": self.controllers,
+        }
+
+    def cmd_play(self, video_id: str = None, query: str = None, track=None):
+        """Plays a track now: a full track, a video id, or the top search result for query."""
+        if track is not None:
+            track = Track.from_json(track)
+        elif video_id:
+            track = self._lookup(video_id)
+        elif query:
+            results = self.api.search_songs(query)
+            error = api_error(results)
+            if error or not results:
+                raise ValueError(error or f"nothing found for {query!r}")
+            track = results[0]
+        else:
+            raise ValueError("play needs a video_id, query or track")
+        # Picking a track starts a new station, like a new seed does in the TUI
+        self.played = set()
+        return self._play(track)
+
+    def cmd_next(self):
+        track = self._next_track()
+        if track is None:
+            self.player.stop()
+            return None
+        return self._play(track)
+
+    def cmd_toggle(self):
+        return self.player.toggle_pause()
+
+    def cmd_pause(self):
+        return self.player.toggle_pause() if not self.player.paused else True
+
+    def cmd_resume(self):
+        return self.player.toggle_pause() if self.player.paused else False
+
+    def cmd_stop(self):
+        self.player.stop()
+
+    def cmd_seek(self, offset: float):
+        return self.player.seek(float(offset))
+
+    def cmd_queue(self):
+        with self._lock:
+            return [track.to_json() for track in self.queue]
+
+    def cmd_enqueue(self, tracks: list = None, video_ids: list = None):
+        added = [Track.from_json(item) for item in tracks or []]
+        added += [self._lookup(video_id) for video_id in video_ids or []]
+        with self._lock:
+            self.queue.extend(added)
+            return len(self.queue)
+
+    def cmd_queue_clear(self):
+        with self._lock:
+            self.queue.clear()
+
+    def cmd_search(self, query: str):
+        results = self.api.search_songs(query)
+        error = api_error(results)
+        if error:
+            raise RuntimeError(error)
+        return [track.to_json() for track in results]
+
+    def cmd_radio(self, video_id: str):
+        results = self.api.get_radio_songs(video_id)
+        error = api_error(results)
+        if error:
+            raise RuntimeError(error)
+        return [track.to_json() for track in results]
+
+    def cmd_mix(self, limit: int = 25):
+        return [track.to_json() for track in self.recommender.mix(int(limit))]
+
+    def cmd_save(self):
+        track = self.player.current_track or self.current
+        if track is None:
+            raise ValueError("nothing is playing")
+        self.db.add_to_playlist(track)
+        return track.to_json()
+
+    def cmd_shutdown(self):
+        self.shutdown()
+
+    # Player and resolver, for an attached TUI
+
+    def cmd_player_play(self, url: str, start: float = None, track=None):
+        self.player.play(url, start=start, track=Track.from_json(track) if track else None)
+
+    def cmd_player_append(self, url: str, start: float = None, track=None):
+        self.player.append(url, start=start, track=Track.from_json(track) if track else None)
+
+    def cmd_player_clear_queue(self):
+        self.player.clear_queue()
+
+    def cmd_player_stop(self):
+        self.player.stop()
+
+    def cmd_player_toggle_pause(self):
+        return self.player.toggle_pause()
+
+    def cmd_player_seek(self, offset: float):
+        return self.player.seek(float(offset))
+
+    def cmd_player_state(self):
+        return {
+            "position": self.player.time_pos,
+            "duration": self.player.duration,
+            "paused": self.player.paused,
+            "idle": self.player.is_idle,
+            "playlist_pos": self.player.playlist_pos,
+            "stalls": self.player.stall_count,
+        }
+
+    def cmd_quality(self):
+        return {"tier": self.format_policy.tier(), "throughput": self.throughput.estimate()}
+
+    # Audio cache, an attached TUI has none of its own
+
+    def _audio_cache(self):
+        if self.audio_cache is None:
+            raise RuntimeError("audio cache is disabled (audio_cache_mb = 0)")
+        return self.audio_cache
+
+    def cmd_audio_enabled(self):
+        return self.audio_cache is not None
+
+    def cmd_audio_is_pinned(self, video_id: str):
+        return self._audio_cache().is_pinned(video_id)
+
+    def cmd_audio_pin(self, video_id: str, pinned: bool = True):
+        self._audio_cache().pin(video_id, pinned)
+
+    def cmd_audio_store(self, video_id: str, url: str):
+        self._audio_cache().store_in_background(video_id, url)
+
+    def cmd_audio_remove(self, video_id: str):
+        self._audio_cache().remove(video_id)
+
+    def cmd_resolve(self, video_id: str):
+        return self.resolver.get_stream_url(video_id)
+
+    def cmd_resolver_is_cached(self, video_id: str):
+        return self.resolver.is_cached(video_id)
+
+    def cmd_resolver_invalidate(self, video_id: str):
+        self.resolver.invalidate(video_id)
+
+    def cmd_resolver_stream_format(self, url: str):
+        return self.resolver.stream_format(url)
+
+    def cmd_resolver_stats(self):
+        return {"cache": self.resolver.cache_stats(), "strategies": self.resolver.strategy_stats()}
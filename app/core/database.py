@@ -1,15 +1,59 @@
+import json
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
 from pathlib import Path
 
+from core.cache import ResponseCache
+from core.trace import tracer
+from core.track import UNKNOWN_ARTISTS, Track, parse_duration, split_artists
+
 class Database:
-    def __init__(self):
-        self.db_dir = Path.home() / ".local" / "share" / "tusic"
+    # Bumped whenever migrate() learns a new step
+    SCHEMA_VERSION = 4
+
+    # Plays this close together (seconds) belong to one listening session...
+    SESSION_GAP = 30 * 60
+    # ...and each play is linked to at most this many plays before it, weighted 1/distance
+    COOCCUR_WINDOW = 5
+
+    # The writer waits this long for more writes so they can share one commit (one fsync)
+    COMMIT_WINDOW = 0.02
+    MAX_BATCH = 500
+
+    def __init__(self, db_dir=None):
+        self.db_dir = Path(db_dir) if db_dir else Path.home() / ".local" / "share" / "tusic"
         self.db_dir.mkdir(parents=True, exist_ok=True)
         # Keep the full path to the .db file
         self.db_path = self.db_dir / "tusic.db"
+        # Reads happen on this connection from whichever thread asks. Writes never do,
+        # they go through the writer thread so the UI never waits on a commit.
         self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        # Only a brand new (empty) file can be given incremental auto-vacuum, and it has to happen before WAL
+        # mode writes the header. Existing databases are switched over by enable_incremental_vacuum() (--vacuum).
+        # Setting it takes the write lock, so it is never tried on a database someone else may be writing to.
+        if self.conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+            self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.configure(self.conn)
         self.setup_tables()
 
+        self._writes = queue.Queue()
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+    @staticmethod
+    def configure(conn):
+        # First, so everything after it waits out another process's write instead of failing
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute("PRAGMA journal_mode = WAL")
+        # In WAL mode NORMAL is still crash-safe, it only skips the fsync on every commit
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -16000")
+
     def setup_tables(self):
         cursor = self.conn.cursor()
         cursor.execute("""
@@ -18,7 +62,7 @@ class Database:
                 video_id TEXT,
                 title TEXT,
                 artist TEXT,
-                duration TEXT,
+                duration INTEGER,
                 played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
@@ -27,52 +71,860 @@ class Database:
                 video_id TEXT PRIMARY KEY,
                 title TEXT,
                 artist TEXT,
-                duration TEXT
+                duration INTEGER
             )
         """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stream_cache (
+                video_id TEXT PRIMARY KEY,
+                url TEXT,
+                expires_at REAL
+            )
+        """)
+        # Where a long track was left off, so it can pick up there next time
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS resume_positions (
+                video_id TEXT PRIMARY KEY,
+                position REAL,
+                duration REAL,
+                updated_at REAL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                endpoint TEXT,
+                key TEXT,
+                value TEXT,
+                stored_at REAL,
+                PRIMARY KEY (endpoint, key)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS audio_cache (
+                video_id TEXT PRIMARY KEY,
+                path TEXT,
+                size INTEGER DEFAULT 0,
+                last_used REAL DEFAULT 0,
+                pinned INTEGER DEFAULT 0
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_played_at ON history(played_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_video_id ON history(video_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_title_artist ON history(title, artist)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_playlist_title_artist ON playlist(title, artist)")
+        # Normalized view of everything we've played or saved, with running play counters
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                video_id TEXT PRIMARY KEY,
+                title TEXT,
+                artist TEXT,
+                duration INTEGER,
+                play_count INTEGER DEFAULT 0,
+                last_played TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS artists (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE,
+                play_count INTEGER DEFAULT 0
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS track_artists (
+                video_id TEXT,
+                artist_id INTEGER,
+                PRIMARY KEY (video_id, artist_id)
+            )
+        """)
+        # Plays that aged out of history, one row per track per day (tracks keeps the all-time counters)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS history_daily (
+                day TEXT,
+                video_id TEXT,
+                plays INTEGER DEFAULT 0,
+                PRIMARY KEY (day, video_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_daily_video_id ON history_daily(video_id)")
+        # One row per play: which audio format was streamed, how long, and how often it stalled
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS play_quality (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_id TEXT,
+                played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                tier TEXT,
+                format_id TEXT,
+                codec TEXT,
+                abr REAL,
+                best_abr REAL,
+                throughput_kbps REAL,
+                seconds REAL,
+                stalls INTEGER
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_play_quality_played_at ON play_quality(played_at)")
+        # Track-to-track graph for local recommendations, stored in both directions
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cooccur (
+                a TEXT,
+                b TEXT,
+                weight REAL DEFAULT 0,
+                PRIMARY KEY (a, b)
+            ) WITHOUT ROWID
+        """)
+        # What YouTube's radio put next to a seed, with enough metadata to list tracks we never played
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS radio_neighbors (
+                seed TEXT,
+                video_id TEXT,
+                position INTEGER,
+                title TEXT,
+                artist TEXT,
+                duration INTEGER,
+                PRIMARY KEY (seed, video_id)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_play_count ON tracks(play_count)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tracks_title_artist ON tracks(title, artist)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_artists_play_count ON artists(play_count)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_track_artists_artist ON track_artists(artist_id)")
+        self.fts_enabled = self.setup_fts(cursor)
+        # Stream URLs are only good for a few hours, drop whatever died while we were closed
+        cursor.execute("DELETE FROM stream_cache WHERE expires_at < strftime('%s', 'now')")
+        # Same for API responses too old to be served even while a refresh runs, they'd only ever be overwritten
+        cursor.execute("DELETE FROM response_cache WHERE stored_at < ?", (time.time() - ResponseCache.STALE_LIMIT,))
         self.conn.commit()
+        self.migrate()
 
-    def add_to_history(self, video_id, title, artist, duration):
+    def migrate(self):
         cursor = self.conn.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+        if version < 1:
+            # Build tracks/artists out of the old history and playlist tables
+            cursor.execute("""
+                INSERT OR IGNORE INTO tracks (video_id, title, artist, duration, play_count, last_played)
+                SELECT h.video_id, h.title, h.artist, h.duration, counts.plays, counts.last_played
+                FROM history h
+                JOIN (
+                    SELECT video_id, COUNT(*) AS plays, MAX(played_at) AS last_played, MAX(id) AS last_id
+                    FROM history GROUP BY video_id
+                ) counts ON h.id = counts.last_id
+            """)
+            cursor.execute("""
+                INSERT OR IGNORE INTO tracks (video_id, title, artist, duration, play_count)
+                SELECT video_id, title, artist, duration, 0 FROM playlist
+            """)
+            cursor.execute("SELECT video_id, artist FROM tracks")
+            for video_id, artist in cursor.fetchall():
+                self._link_artists(cursor, video_id, split_artists(artist))
+            cursor.execute("""
+                UPDATE artists SET play_count = (
+                    SELECT COALESCE(SUM(t.play_count), 0)
+                    FROM track_artists ta JOIN tracks t ON t.video_id = ta.video_id
+                    WHERE ta.artist_id = artists.id
+                )
+            """)
+
+        if version < 2 and self.fts_enabled:
+            cursor.execute("INSERT INTO tracks_fts(tracks_fts) VALUES ('rebuild')")
+
+        if version < 3:
+            # Durations used to be stored as the "3:45" strings YouTube hands out, keep seconds instead
+            for table in ("history", "playlist", "tracks"):
+                cursor.execute(f"SELECT DISTINCT duration FROM {table}")
+                for (duration,) in cursor.fetchall():
+                    cursor.execute(f"UPDATE {table} SET duration = ? WHERE duration = ?", (parse_duration(duration), duration))
+
+        if version < 4:
+            self._rebuild_cooccur(cursor)
+
+        cursor.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def _rebuild_cooccur(self, cursor):
+        # One pass over the whole history, pairs are summed in memory and written in one go
+        weights = {}
+        recent = []
+        cursor.execute("SELECT video_id, CAST(strftime('%s', played_at) AS INTEGER) FROM history ORDER BY id")
+        for video_id, played_at in cursor.fetchall():
+            recent = [(other, at) for other, at in recent if played_at - at <= self.SESSION_GAP]
+            for a, b, weight in self._session_pairs(video_id, [other for other, _ in reversed(recent)]):
+                weights[(a, b)] = weights.get((a, b), 0.0) + weight
+            recent = (recent + [(video_id, played_at)])[-self.COOCCUR_WINDOW:]
+
+        cursor.execute("DELETE FROM cooccur")
+        cursor.executemany("INSERT INTO cooccur (a, b, weight) VALUES (?, ?, ?)", ((a, b, w) for (a, b), w in weights.items()))
+
+    @staticmethod
+    def _session_pairs(video_id: str, previous: list) -> list:
+        """(a, b, weight) rows linking video_id to the plays before it in its session, nearest first."""
+        pairs = []
+        for distance, other in enumerate(previous, 1):
+            if other != video_id:
+                weight = 1.0 / distance
+                pairs.append((video_id, other, weight))
+                pairs.append((other, video_id, weight))
+        return pairs
+
+    def setup_fts(self, cursor) -> bool:
+        # Some SQLite builds ship without FTS5, local search then falls back to LIKE
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+                    title, artist,
+                    content='tracks', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
+                )
+            """)
+        except sqlite3.OperationalError:
+            return False
+
+        # Keep the index in step with tracks on every insert, delete and rename
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS tracks_fts_insert AFTER INSERT ON tracks BEGIN
+                INSERT INTO tracks_fts(rowid, title, artist) VALUES (new.rowid, new.title, new.artist);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS tracks_fts_delete AFTER DELETE ON tracks BEGIN
+                INSERT INTO tracks_fts(tracks_fts, rowid, title, artist) VALUES ('delete', old.rowid, old.title, old.artist);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS tracks_fts_update AFTER UPDATE OF title, artist ON tracks BEGIN
+                INSERT INTO tracks_fts(tracks_fts, rowid, title, artist) VALUES ('delete', old.rowid, old.title, old.artist);
+                INSERT INTO tracks_fts(rowid, title, artist) VALUES (new.rowid, new.title, new.artist);
+            END
+        """)
+        return True
+
+    @staticmethod
+    def _link_artists(cursor, video_id: str, artists):
+        for name in artists:
+            cursor.execute("INSERT OR IGNORE INTO artists (name) VALUES (?)", (name,))
+            cursor.execute(
+                "INSERT OR IGNORE INTO track_artists (video_id, artist_id) SELECT ?, id FROM artists WHERE name = ?",
+                (video_id, name)
+            )
+
+    def _ensure_track(self, cursor, track: Track):
         cursor.execute(
-            "INSERT INTO history (video_id, title, artist, duration) VALUES (?, ?, ?, ?)",
-            (video_id, title, artist, duration)
+            "INSERT OR IGNORE INTO tracks (video_id, title, artist, duration) VALUES (?, ?, ?, ?)",
+            (track.id, track.title, track.artist, track.duration)
         )
-        self.conn.commit()
+        # Artists are only linked the first time a track shows up
+        if cursor.rowcount > 0:
+            self._link_artists(cursor, track.id, track.artists)
+
+    def _forget_track(self, cursor, video_id: str):
+        cursor.execute("""
+            UPDATE artists SET play_count = play_count - (SELECT play_count FROM tracks WHERE video_id = ?)
+            WHERE id IN (SELECT artist_id FROM track_artists WHERE video_id = ?)
+        """, (video_id, video_id))
+        cursor.execute("DELETE FROM track_artists WHERE video_id = ?", (video_id,))
+        cursor.execute("DELETE FROM tracks WHERE video_id = ?", (video_id,))
+        cursor.execute("DELETE FROM history_daily WHERE video_id = ?", (video_id,))
+        cursor.execute("DELETE FROM resume_positions WHERE video_id = ?", (video_id,))
+        # Edges are stored both ways, drop the mirrored ones first while they can still be found through a
+        cursor.execute("DELETE FROM cooccur WHERE (a, b) IN (SELECT b, a FROM cooccur WHERE a = ?)", (video_id,))
+        cursor.execute("DELETE FROM cooccur WHERE a = ?", (video_id,))
+
+    def _writer_loop(self):
+        try:
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            self.configure(conn)
+        except Exception as e:
+            # Nothing can be written without a connection, but nobody may be left waiting on a write either
+            self._fail_writes(e)
+            return
+        cursor = conn.cursor()
+
+        held = None
+        stopping = False
+        while not stopping:
+            item = held if held is not None else self._writes.get()
+            held = None
+            if item is None:
+                break
+
+            op, done, transactional = item
+            if not transactional:
+                # VACUUM and friends can't run inside a transaction, they get the connection to themselves
+                try:
+                    with tracer.span(self._span_name(op)):
+                        self._settle(done, op(cursor), None)
+                except Exception as e:
+                    self._rollback(conn)
+                    self._settle(done, None, e)
+                continue
+
+            # Group commit: everything that queues up within the window shares one transaction
+            batch = [item]
+            deadline = time.monotonic() + self.COMMIT_WINDOW
+            while len(batch) < self.MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._writes.get(timeout=remaining) if remaining > 0 else self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                if not item[2]:
+                    held = item
+                    break
+                batch.append(item)
+
+            outcomes = []
+            try:
+                cursor.execute("BEGIN")
+                for op, done, _ in batch:
+                    # Savepoints keep one failing write from rolling back the rest of the batch
+                    cursor.execute("SAVEPOINT op")
+                    try:
+                        with tracer.span(self._span_name(op)):
+                            result = op(cursor)
+                        outcomes.append((done, result, None))
+                        cursor.execute("RELEASE op")
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO op")
+                        cursor.execute("RELEASE op")
+                        outcomes.append((done, None, e))
+                with tracer.span("db.commit"):
+                    cursor.execute("COMMIT")
+            except Exception as e:
+                # BEGIN, a savepoint or the commit itself failed (busy, disk full, I/O error): none of the
+                # batch stuck. Everyone waiting hears about it, and the writer carries on with the next batch.
+                self._rollback(conn)
+                outcomes = [(done, None, e) for _, done, _ in batch]
+
+            for done, result, error in outcomes:
+                self._settle(done, result, error)
+
+        conn.close()
+        # Whatever was queued behind close() will never run
+        self._fail_writes(sqlite3.ProgrammingError("Cannot operate on a closed database."), block=False)
+
+    @staticmethod
+    def _rollback(conn):
+        if conn.in_transaction:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+    def _fail_writes(self, error, block: bool = True):
+        while True:
+            try:
+                item = self._writes.get(block=block)
+            except queue.Empty:
+                return
+            if item is None:
+                if block:
+                    return
+                continue
+            self._settle(item[1], None, error)
+
+    @staticmethod
+    def _span_name(op) -> str:
+        # Write ops are closures, "Database.add_to_history.<locals>.op" is traced as db.add_to_history
+        return "db." + op.__qualname__.split(".<locals>")[0].rsplit(".", 1)[-1]
+
+    @staticmethod
+    def _settle(done, result, error):
+        if done is None:
+            return
+        if error is not None:
+            done.set_exception(error)
+        else:
+            done.set_result(result)
+
+    def _write(self, op, wait: bool = False, transaction: bool = True):
+        """Queues op(cursor) for the writer thread. With wait=True, blocks until committed and returns op's result.
+
+        transaction=False runs op on its own in autocommit mode, for statements like VACUUM.
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        if not self._writer.is_alive():
+            raise RuntimeError("the database writer thread has stopped")
+        done = Future() if wait else None
+        self._writes.put((op, done, transaction))
+        return done.result() if wait else None
+
+    def flush(self):
+        """Blocks until every write queued so far has been committed."""
+        self._write(lambda cursor: None, wait=True)
+
+    def close(self):
+        self._closed = True
+        self._writes.put(None)
+        self._writer.join()
+        self.conn.close()
+
+    def add_to_history(self, track: Track):
+        def op(cursor):
+            cursor.execute(
+                "INSERT INTO history (video_id, title, artist, duration) VALUES (?, ?, ?, ?)",
+                (track.id, track.title, track.artist, track.duration)
+            )
+            # The co-occurrence graph grows with every play, no batch job needed
+            cursor.execute(
+                "SELECT video_id FROM history WHERE id < ? AND played_at >= datetime('now', ?) ORDER BY id DESC LIMIT ?",
+                (cursor.lastrowid, f"-{self.SESSION_GAP} seconds", self.COOCCUR_WINDOW)
+            )
+            cursor.executemany(
+                "INSERT INTO cooccur (a, b, weight) VALUES (?, ?, ?) ON CONFLICT (a, b) DO UPDATE SET weight = weight + excluded.weight",
+                self._session_pairs(track.id, [row[0] for row in cursor.fetchall()])
+            )
+            # Counters move in the same transaction as the history row, so they can't drift
+            self._ensure_track(cursor, track)
+            cursor.execute(
+                "UPDATE tracks SET play_count = play_count + 1, last_played = CURRENT_TIMESTAMP WHERE video_id = ?",
+                (track.id,)
+            )
+            cursor.execute(
+                "UPDATE artists SET play_count = play_count + 1 WHERE id IN (SELECT artist_id FROM track_artists WHERE video_id = ?)",
+                (track.id,)
+            )
+        self._write(op)
+
+    def compact_history(self, cutoff: str, batch_size: int = 5000) -> int:
+        """Rolls up to batch_size plays from before cutoff ("YYYY-MM-DD HH:MM:SS", UTC) into history_daily.
+
+        Returns how many history rows went away, 0 once there is nothing left to compact.
+        """
+        def op(cursor):
+            # Ordered by id, which is unique: ties on the played_at second could otherwise pick a different
+            # batch for the DELETE than the INSERT counted, double-counting some plays and losing others
+            oldest = "SELECT id FROM history WHERE played_at < ? ORDER BY id LIMIT ?"
+            cursor.execute(f"""
+                INSERT INTO history_daily (day, video_id, plays)
+                SELECT date(played_at), video_id, COUNT(*) FROM history WHERE id IN ({oldest}) GROUP BY 1, 2
+                ON CONFLICT (day, video_id) DO UPDATE SET plays = plays + excluded.plays
+            """, (cutoff, batch_size))
+            cursor.execute(f"DELETE FROM history WHERE id IN ({oldest})", (cutoff, batch_size))
+            return cursor.rowcount
+        return self._write(op, wait=True)
+
+    def prune_play_quality(self, cutoff: str) -> int:
+        def op(cursor):
+            cursor.execute("DELETE FROM play_quality WHERE played_at < ?", (cutoff,))
+            return cursor.rowcount
+        return self._write(op, wait=True)
 
-    def get_history(self):
+    @classmethod
+    def enable_incremental_vacuum(cls, db_dir=None) -> bool:
+        """Switches a database from before retention existed to incremental auto-vacuum. False if it already was.
+
+        That takes one full VACUUM, which rewrites the whole file and can run for a
+        while on a big history. It gets a connection of its own and is meant to run
+        with nothing else open (python app/main.py --vacuum), never behind the writer.
+        """
+        db_path = (Path(db_dir) if db_dir else Path.home() / ".local" / "share" / "tusic") / "tusic.db"
+        # A library created from now on starts out in the right mode
+        if not db_path.exists():
+            return False
+        conn = sqlite3.connect(db_path)
+        try:
+            cls.configure(conn)
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            return True
+        finally:
+            conn.close()
+
+    def reclaim_space(self, max_pages: int = 1000) -> int:
+        """Hands up to max_pages free pages back to the filesystem. Returns how many were still free before.
+
+        Only databases in incremental auto-vacuum mode can do this a bit at a time, older
+        ones keep their free pages for reuse until enable_incremental_vacuum() has run.
+        """
+        def op(cursor):
+            if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return 0
+            free = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            if free:
+                # sqlite3 only steps a statement without result rows once, and every step frees one page
+                cursor.execute("BEGIN")
+                for _ in range(min(free, max_pages)):
+                    cursor.execute("PRAGMA incremental_vacuum")
+                cursor.execute("COMMIT")
+            else:
+                # Done, the file only shrinks once the WAL is checkpointed
+                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            return free
+        return self._write(op, wait=True, transaction=False)
+
+    @tracer.traced("db.get_history_page")
+    def get_history_page(self, before_id=None, limit: int = 100):
+        """One page of history, newest first. Returns (tracks, token for the next page or None when done).
+
+        Keyset paging on the id, so deep pages cost the same as the first one.
+        """
         cursor = self.conn.cursor()
-        cursor.execute("SELECT video_id, title, artist, duration FROM history ORDER BY played_at DESC LIMIT 50")
-        return [{"id": row[0], "title": row[1], "artist": row[2], "duration": row[3]} for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT id, video_id, title, artist, duration FROM history WHERE id < ? ORDER BY id DESC LIMIT ?",
+            (before_id if before_id is not None else 2 ** 63 - 1, limit)
+        )
+        rows = cursor.fetchall()
+        tracks = [Track.from_row(row[1:]) for row in rows]
+        return tracks, (rows[-1][0] if len(rows) == limit else None)
 
-    def add_to_playlist(self, video_id, title, artist, duration):
+    def add_to_playlist(self, track: Track):
+        def op(cursor):
+            cursor.execute(
+                "INSERT OR IGNORE INTO playlist (video_id, title, artist, duration) VALUES (?, ?, ?, ?)",
+                (track.id, track.title, track.artist, track.duration)
+            )
+            self._ensure_track(cursor, track)
+        self._write(op)
+
+    def add_many_to_playlist(self, tracks: list) -> int:
+        """Bulk add_to_playlist: the whole list is one write, inserted with executemany. Returns how many were new."""
+        rows = [(track.id, track.title, track.artist, track.duration) for track in tracks]
+
+        def op(cursor):
+            cursor.executemany("INSERT OR IGNORE INTO playlist (video_id, title, artist, duration) VALUES (?, ?, ?, ?)", rows)
+            added = cursor.rowcount
+
+            known = set()
+            ids = [row[0] for row in rows]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(f"SELECT video_id FROM tracks WHERE video_id IN ({','.join('?' * len(chunk))})", chunk)
+                known.update(row[0] for row in cursor.fetchall())
+
+            # Same as _ensure_track, only tracks we haven't seen before get linked to their artists
+            new = {track.id: track for track in tracks if track.id not in known}
+            cursor.executemany(
+                "INSERT OR IGNORE INTO tracks (video_id, title, artist, duration) VALUES (?, ?, ?, ?)",
+                [(track.id, track.title, track.artist, track.duration) for track in new.values()]
+            )
+            cursor.executemany(
+                "INSERT OR IGNORE INTO artists (name) VALUES (?)",
+                [(name,) for name in {name for track in new.values() for name in track.artists}]
+            )
+            cursor.executemany(
+                "INSERT OR IGNORE INTO track_artists (video_id, artist_id) SELECT ?, id FROM artists WHERE name = ?",
+                [(track.id, name) for track in new.values() for name in track.artists]
+            )
+            return added
+
+        return self._write(op, wait=True)
+
+    @tracer.traced("db.get_known_tracks")
+    def get_known_tracks(self, video_ids: list) -> dict:
+        """video_id -> Track for every id already in the library."""
+        cursor = self.conn.cursor()
+        found = {}
+        for start in range(0, len(video_ids), 500):
+            chunk = video_ids[start:start + 500]
+            cursor.execute(
+                f"SELECT video_id, title, artist, duration FROM tracks WHERE video_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for row in cursor.fetchall():
+                found[row[0]] = Track.from_row(row)
+        return found
+
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        # Every word must match, the last one (still being typed) as a prefix
+        words = [w.replace('"', '""') for w in text.split()]
+        return " ".join(f'"{w}"*' for w in words)
+
+    @tracer.traced("db.search_local")
+    def search_local(self, text: str, limit: int = 25) -> list:
+        """Prefix search over every track we've played or saved."""
+        if not text.strip():
+            return []
+
+        cursor = self.conn.cursor()
+        if self.fts_enabled:
+            cursor.execute("""
+                SELECT t.video_id, t.title, t.artist, t.duration
+                FROM tracks_fts JOIN tracks t ON t.rowid = tracks_fts.rowid
+                WHERE tracks_fts MATCH ?
+                ORDER BY bm25(tracks_fts), t.play_count DESC
+                LIMIT ?
+            """, (self._fts_query(text), limit))
+        else:
+            pattern = f"%{text.strip()}%"
+            cursor.execute("""
+                SELECT video_id, title, artist, duration FROM tracks
+                WHERE title LIKE ? OR artist LIKE ?
+                ORDER BY play_count DESC LIMIT ?
+            """, (pattern, pattern, limit))
+        return [Track.from_row(row) for row in cursor.fetchall()]
+
+    @tracer.traced("db.has_history")
+    def has_history(self) -> bool:
+        cursor = self.conn.cursor()
+        # Everything may have been rolled up already
+        cursor.execute("SELECT 1 FROM history UNION ALL SELECT 1 FROM history_daily LIMIT 1")
+        return cursor.fetchone() is not None
+
+    @tracer.traced("db.get_top_artists")
+    def get_top_artists(self, limit: int = 3) -> list:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT name FROM artists WHERE play_count > 0 ORDER BY play_count DESC LIMIT ?", (limit,))
+        return [row[0] for row in cursor.fetchall()]
+
+    @tracer.traced("db.get_most_played")
+    def get_most_played(self, limit: int = 50) -> list:
         cursor = self.conn.cursor()
         cursor.execute(
-            "INSERT OR IGNORE INTO playlist (video_id, title, artist, duration) VALUES (?, ?, ?, ?)",
-            (video_id, title, artist, duration)
+            "SELECT video_id, title, artist, duration FROM tracks WHERE play_count > 0 ORDER BY play_count DESC LIMIT ?",
+            (limit,)
         )
-        self.conn.commit()
+        return [Track.from_row(row) for row in cursor.fetchall()]
+
+    @tracer.traced("db.get_recent_ids")
+    def get_recent_ids(self, limit: int = 20) -> list:
+        """The last limit distinct tracks played, newest first."""
+        cursor = self.conn.cursor()
+        # Reads a bounded slice off the end of history, grouping all of it gets slow at millions of plays
+        cursor.execute("SELECT video_id FROM history ORDER BY id DESC LIMIT ?", (limit * 10,))
+        return list(dict.fromkeys(row[0] for row in cursor.fetchall()))[:limit]
 
-    def get_playlist(self):
+    def set_radio_neighbors(self, seed: str, tracks: list):
+        def op(cursor):
+            cursor.execute("DELETE FROM radio_neighbors WHERE seed = ?", (seed,))
+            cursor.executemany(
+                "INSERT OR IGNORE INTO radio_neighbors (seed, video_id, position, title, artist, duration) VALUES (?, ?, ?, ?, ?, ?)",
+                [(seed, track.id, position, track.title, track.artist, track.duration) for position, track in enumerate(tracks)]
+            )
+        self._write(op)
+
+    @tracer.traced("db.score_candidates")
+    def score_candidates(self, seeds: dict, radio_weight: float = 1.0, limit: int = 100) -> list:
+        """Tracks related to the seeds ({video_id: weight}), best first, as (Track, score) pairs.
+
+        The score is a sparse product done in one query: each seed's weight times
+        its co-occurrence edges, plus its radio neighbors (worth radio_weight at the
+        top of the radio, less further down). Seeds themselves are left out.
+        """
+        if not seeds:
+            return []
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            WITH seeds AS (SELECT key AS video_id, value AS weight FROM json_each(?))
+            SELECT video_id, SUM(score) AS score FROM (
+                SELECT c.b AS video_id, s.weight * c.weight AS score
+                FROM seeds s JOIN cooccur c ON c.a = s.video_id
+                UNION ALL
+                SELECT r.video_id, s.weight * ? / (1 + r.position * 0.1)
+                FROM seeds s JOIN radio_neighbors r ON r.seed = s.video_id
+            )
+            WHERE video_id NOT IN (SELECT video_id FROM seeds)
+            GROUP BY video_id ORDER BY score DESC LIMIT ?
+        """, (json.dumps(seeds), radio_weight, limit))
+        scores = cursor.fetchall()
+        if not scores:
+            return []
+
+        # Played or saved tracks have metadata in tracks, the rest only ever showed up on a radio
+        ids = [video_id for video_id, _ in scores]
+        known = self.get_known_tracks(ids)
+        missing = [video_id for video_id in ids if video_id not in known]
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            cursor.execute(
+                f"SELECT video_id, title, artist, duration FROM radio_neighbors WHERE video_id IN ({placeholders}) GROUP BY video_id",
+                missing
+            )
+            for row in cursor.fetchall():
+                known[row[0]] = Track.from_row(row)
+        return [(known[video_id], score) for video_id, score in scores if video_id in known]
+
+    def add_play_quality(self, video_id: str, fmt: dict, throughput_kbps, seconds: float, stalls: int):
+        def op(cursor):
+            cursor.execute(
+                """INSERT INTO play_quality (video_id, tier, format_id, codec, abr, best_abr, throughput_kbps, seconds, stalls)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (video_id, fmt.get("tier"), fmt.get("format_id"), fmt.get("codec"), fmt.get("abr"), fmt.get("best_abr"),
+                 throughput_kbps, seconds, stalls)
+            )
+        self._write(op)
+
+    @tracer.traced("db.get_quality_summary")
+    def get_quality_summary(self, days: int = 30) -> dict:
+        """Streamed vs. best-available megabytes and stalls per hour of listening, over the last days."""
         cursor = self.conn.cursor()
-        cursor.execute("SELECT video_id, title, artist, duration FROM playlist")
-        return [{"id": row[0], "title": row[1], "artist": row[2], "duration": row[3]} for row in cursor.fetchall()]
+        # best_abr is unknown for URLs resolved in an earlier session, those count as nothing saved
+        cursor.execute("""
+            SELECT COUNT(*), COALESCE(SUM(seconds), 0), COALESCE(SUM(stalls), 0),
+                   COALESCE(SUM(abr * seconds), 0) / 8000, COALESCE(SUM(MAX(COALESCE(best_abr, abr), abr) * seconds), 0) / 8000
+            FROM play_quality WHERE played_at >= datetime('now', ?) AND COALESCE(tier, '') != 'local'
+        """, (f"-{int(days)} days",))
+        plays, seconds, stalls, used_mb, best_mb = cursor.fetchone()
+        return {
+            "plays": plays,
+            "hours": seconds / 3600,
+            "used_mb": used_mb,
+            "saved_mb": best_mb - used_mb,
+            "stalls_per_hour": stalls / (seconds / 3600) if seconds else 0.0,
+        }
+
+    @tracer.traced("db.in_playlist")
+    def in_playlist(self, video_id: str) -> bool:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT 1 FROM playlist WHERE video_id = ?", (video_id,))
+        return cursor.fetchone() is not None
+
+    @tracer.traced("db.get_playlist_page")
+    def get_playlist_page(self, after_rowid=None, limit: int = 100):
+        """Same contract as get_history_page, in the order songs were saved."""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT rowid, video_id, title, artist, duration FROM playlist WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (after_rowid if after_rowid is not None else 0, limit)
+        )
+        rows = cursor.fetchall()
+        tracks = [Track.from_row(row[1:]) for row in rows]
+        return tracks, (rows[-1][0] if len(rows) == limit else None)
+
+    @tracer.traced("db.get_cached_stream")
+    def get_cached_stream(self, video_id: str):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT url, expires_at FROM stream_cache WHERE video_id = ?", (video_id,))
+        return cursor.fetchone()
+
+    def set_cached_stream(self, video_id: str, url: str, expires_at: float):
+        def op(cursor):
+            cursor.execute(
+                "INSERT OR REPLACE INTO stream_cache (video_id, url, expires_at) VALUES (?, ?, ?)",
+                (video_id, url, expires_at)
+            )
+        self._write(op)
+
+    @tracer.traced("db.get_resume_position")
+    def get_resume_position(self, video_id: str):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT position FROM resume_positions WHERE video_id = ?", (video_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def set_resume_position(self, video_id: str, position: float, duration: float):
+        def op(cursor):
+            cursor.execute(
+                "INSERT OR REPLACE INTO resume_positions (video_id, position, duration, updated_at) VALUES (?, ?, ?, ?)",
+                (video_id, position, duration, time.time())
+            )
+        self._write(op)
+
+    def clear_resume_position(self, video_id: str):
+        def op(cursor):
+            cursor.execute("DELETE FROM resume_positions WHERE video_id = ?", (video_id,))
+        self._write(op)
+
+    def delete_cached_stream(self, video_id: str):
+        def op(cursor):
+            cursor.execute("DELETE FROM stream_cache WHERE video_id = ?", (video_id,))
+        self._write(op)
+
+    @tracer.traced("db.get_cached_response")
+    def get_cached_response(self, endpoint: str, key: str):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT value, stored_at FROM response_cache WHERE endpoint = ? AND key = ?", (endpoint, key))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set_cached_response(self, endpoint: str, key: str, value, stored_at: float):
+        def op(cursor):
+            cursor.execute(
+                "INSERT OR REPLACE INTO response_cache (endpoint, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                (endpoint, key, json.dumps(value), stored_at)
+            )
+        self._write(op)
+
+    @tracer.traced("db.get_audio_entry")
+    def get_audio_entry(self, video_id: str):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT path, size, pinned FROM audio_cache WHERE video_id = ?", (video_id,))
+        return cursor.fetchone()
+
+    def set_audio_entry(self, video_id: str, path: str, size: int, last_used: float):
+        def op(cursor):
+            cursor.execute("""
+                INSERT INTO audio_cache (video_id, path, size, last_used) VALUES (?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET path = excluded.path, size = excluded.size, last_used = excluded.last_used
+            """, (video_id, path, size, last_used))
+        # Eviction reads the index right after this, so it has to be committed first
+        self._write(op, wait=True)
+
+    def touch_audio_entry(self, video_id: str, last_used: float):
+        def op(cursor):
+            cursor.execute("UPDATE audio_cache SET last_used = ? WHERE video_id = ?", (last_used, video_id))
+        self._write(op)
+
+    def set_audio_pinned(self, video_id: str, pinned: bool):
+        def op(cursor):
+            cursor.execute("""
+                INSERT INTO audio_cache (video_id, pinned) VALUES (?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET pinned = excluded.pinned
+            """, (video_id, int(pinned)))
+        self._write(op, wait=True)
+
+    def delete_audio_entry(self, video_id: str, keep_pin: bool = True):
+        def op(cursor):
+            if keep_pin:
+                # A pinned track loses its file but stays pinned, so it gets downloaded again
+                cursor.execute("UPDATE audio_cache SET path = NULL, size = 0 WHERE video_id = ? AND pinned = 1", (video_id,))
+                cursor.execute("DELETE FROM audio_cache WHERE video_id = ? AND pinned = 0", (video_id,))
+            else:
+                cursor.execute("DELETE FROM audio_cache WHERE video_id = ?", (video_id,))
+        self._write(op, wait=True)
+
+    @tracer.traced("db.audio_cache_size")
+    def audio_cache_size(self) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COALESCE(SUM(size), 0) FROM audio_cache WHERE path IS NOT NULL")
+        return cursor.fetchone()[0]
+
+    @tracer.traced("db.get_evictable_audio")
+    def get_evictable_audio(self) -> list:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT video_id, path, size FROM audio_cache WHERE pinned = 0 AND path IS NOT NULL ORDER BY last_used")
+        return cursor.fetchall()
+
+    @tracer.traced("db.get_pinned_missing_audio")
+    def get_pinned_missing_audio(self) -> list:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT video_id FROM audio_cache WHERE pinned = 1 AND path IS NULL")
+        return [row[0] for row in cursor.fetchall()]
+
+    @tracer.traced("db.play_count")
+    def play_count(self, video_id: str) -> int:
+        # Not COUNT(*) over history, old plays get rolled up into history_daily. The counter covers them all.
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT play_count FROM tracks WHERE video_id = ?", (video_id,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
 
     # FIX: Use self.conn instead of opening a new connection to a directory path
     def remove_from_playlist(self, video_id: str) -> bool:
-        try:
-            cursor = self.conn.cursor()
-            clean_id = video_id.strip()
-            cursor.execute("DELETE FROM playlist WHERE video_id = ?", (clean_id,))
-            self.conn.commit()
+        def op(cursor):
+            cursor.execute("DELETE FROM playlist WHERE video_id = ?", (video_id.strip(),))
             return cursor.rowcount > 0
+
+        try:
+            return self._write(op, wait=True)
         except Exception as e:
             print(f"DEBUG DB: {e}") 
             return False
 
     def remove_song_completely(self, video_id: str) -> bool:
-        try:
-            cursor = self.conn.cursor()
+        def op(cursor):
             clean_id = video_id.strip()
             
             cursor.execute("DELETE FROM playlist WHERE video_id = ?", (clean_id,))
@@ -80,23 +932,37 @@ class Database:
             
             cursor.execute("DELETE FROM history WHERE video_id = ?", (clean_id,))
             h_deleted = cursor.rowcount
+
+            self._forget_track(cursor, clean_id)
             
-            self.conn.commit()
             return (p_deleted + h_deleted) > 0
+
+        try:
+            return self._write(op, wait=True)
         except Exception as e:
             print(f"DB Error: {e}")
             return False
 
     def remove_by_title(self, title: str, artist: str) -> bool:
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM playlist WHERE title = ? AND artist = ?", (title, artist))
+        # Older rows spelled a missing artist as '' or one of the API's placeholders
+        artists = (artist,) if artist else ("", *sorted(UNKNOWN_ARTISTS))
+        match = f"title = ? AND artist IN ({', '.join('?' * len(artists))})"
+        params = (title, *artists)
+
+        def op(cursor):
+            cursor.execute(f"SELECT video_id FROM tracks WHERE {match}", params)
+            for (video_id,) in cursor.fetchall():
+                self._forget_track(cursor, video_id)
+
+            cursor.execute(f"DELETE FROM playlist WHERE {match}", params)
             p_deleted = cursor.rowcount
             
-            cursor.execute("DELETE FROM history WHERE title = ? AND artist = ?", (title, artist))
+            cursor.execute(f"DELETE FROM history WHERE {match}", params)
             h_deleted = cursor.rowcount
             
-            self.conn.commit()
             return (p_deleted + h_deleted) > 0
+
+        try:
+            return self._write(op, wait=True)
         except Exception:
             return False
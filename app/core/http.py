@@ -0,0 +1,75 @@
+import threading
+
+class HttpClient:
+    """The one place Tusic's HTTP settings live.
+
+    ytmusicapi and the audio cache share a single requests session, so
+    searches, radio fetches and downloads reuse warm keep-alive connections
+    instead of paying for a TCP/TLS handshake each time. yt-dlp runs its own
+    networking stack, it gets the same proxy and timeout through its options
+    (its connections stay warm because the resolver keeps its YoutubeDL
+    instances around).
+    """
+
+    def __init__(self, proxy: str = None, connect_timeout: float = 5.0, read_timeout: float = 20.0,
+                 pool_size: int = 16, retries: int = 2):
+        self.proxy = proxy
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.retries = retries
+        self._session = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict):
+        return cls(
+            proxy=config.get("http_proxy"),
+            connect_timeout=config.get("http_connect_timeout", 5.0),
+            read_timeout=config.get("http_read_timeout", 20.0),
+            pool_size=config.get("http_pool_size", 16),
+            retries=config.get("http_retries", 2),
+        )
+
+    @property
+    def session(self):
+        # requests is only imported once something actually goes to the network
+        with self._lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def _create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        timeout = (self.connect_timeout, self.read_timeout)
+
+        class Session(requests.Session):
+            def request(self, method, url, **kwargs):
+                # ytmusicapi never passes a timeout, a stalled socket would hang its worker forever
+                kwargs.setdefault("timeout", timeout)
+                return super().request(method, url, **kwargs)
+
+        session = Session()
+        # Only failed connects are retried, a request that reached the server may not be safe to repeat
+        retry = Retry(total=self.retries, connect=self.retries, read=False, status=False, backoff_factor=0.2)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if self.proxy:
+            session.proxies = {"http": self.proxy, "https": self.proxy}
+        return session
+
+    def ytdlp_options(self) -> dict:
+        options = {"socket_timeout": self.read_timeout}
+        if self.proxy:
+            options["proxy"] = self.proxy
+        return options
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
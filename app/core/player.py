@@ -1,44 +1,298 @@
 import locale
+import queue
+import threading
+import time
+from dataclasses import dataclass
+
+from core.trace import tracer
 
 locale.setlocale(locale.LC_ALL, 'C')
 locale.setlocale(locale.LC_NUMERIC, 'C')
 
-import mpv
+# Events published by Player. They are produced on mpv's event thread and
+# consumed by the UI through Player.poll_events().
+
+@dataclass(frozen=True)
+class Progress:
+    position: float
+    duration: float
+
+@dataclass(frozen=True)
+class PauseChanged:
+    paused: bool
+
+@dataclass(frozen=True)
+class TrackStarted:
+    playlist_pos: int
+
+@dataclass(frozen=True)
+class TrackEnded:
+    reason: str  # "eof", "stop" or "error"
+
 
 class Player:
-    def __init__(self):
+    # Progress is pushed at most this often, mpv reports time-pos far more frequently than we can draw it
+    PROGRESS_STEP = 0.2
+    # Seeks stop this far short of the end of what is buffered, so mpv lands on audio it already has
+    SEEK_MARGIN = 2.0
+
+    # mpv cache options per profile. Readahead is how far ahead of the playhead mpv buffers,
+    # back bytes is how much already played audio it keeps so seeking back doesn't refetch.
+    CACHE_PROFILES = {
+        "mpv": {},
+        "balanced": {"cache": "yes", "cache_secs": 60, "demuxer_readahead_secs": 60,
+                     "demuxer_max_bytes": "32MiB", "demuxer_max_back_bytes": "16MiB"},
+        "low-memory": {"cache": "yes", "cache_secs": 15, "demuxer_readahead_secs": 15,
+                       "demuxer_max_bytes": "8MiB", "demuxer_max_back_bytes": "2MiB"},
+        # Hour-long mixes: buffer far ahead and keep most of what was played for seeking back
+        "long-mix": {"cache": "yes", "cache_secs": 600, "demuxer_readahead_secs": 600,
+                     "demuxer_max_bytes": "128MiB", "demuxer_max_back_bytes": "96MiB"},
+    }
+
+    def __init__(self, backend=None, cache_profile: str = "balanced", cache_options: dict = None):
+        # libmpv is only loaded when something is first played, it shouldn't delay the first frame
+        self._mpv = None
+        # Anything shaped like the python-mpv module (MPV, MpvEventEndFile), the benchmarks pass a fake one
+        self._backend = backend
+        self._mpv_lock = threading.Lock()
+        # Unknown profile names fall back to balanced, cache_options override single values (demuxer_max_bytes etc.)
+        self.mpv_options = dict(self.CACHE_PROFILES.get(cache_profile, self.CACHE_PROFILES["balanced"]), **(cache_options or {}))
+        self.events = queue.SimpleQueue()
+        # Optional wake-up hook, called from mpv's thread after a non-progress event is queued
+        self.on_event = None
+        # Optional, called from mpv's thread with bytes/second while the demuxer cache is filling
+        self.on_input_rate = None
+
+        self._lock = threading.Lock()
+        self._position = 0.0
+        self._duration = 0.0
+        self._paused = False
+        self._idle = True
+        self._last_pushed = None
+        # Times playback paused to wait for the network, over the whole session
+        self._stalls = 0
+        # [(start, end)] of the current file that mpv has buffered and can seek in without refetching
+        self._seekable = []
+        # perf_counter of the last play(), cleared once mpv reports the first position
+        self._play_started = None
+        # The Track behind each mpv playlist entry (None where the caller didn't say), for current_track
+        self._tracks = []
+
+    @property
+    def mpv(self):
+        with self._mpv_lock:
+            if self._mpv is None:
+                self._mpv = self._create_mpv()
+            return self._mpv
+
+    def _create_mpv(self):
+        mpv = self._backend
+        if mpv is None:
+            import mpv
+
         locale.setlocale(locale.LC_NUMERIC, 'C')
-        self.mpv = mpv.MPV(video=False, ytdl=False)
-        self.auto_play_enabled = True
+        player = mpv.MPV(video=False, ytdl=False, **self.mpv_options)
+
+        player.observe_property('time-pos', self._on_time_pos)
+        player.observe_property('duration', self._on_duration)
+        player.observe_property('pause', self._on_pause)
+        player.observe_property('idle-active', self._on_idle)
+        player.observe_property('demuxer-cache-state', self._on_cache_state)
+        player.observe_property('paused-for-cache', self._on_paused_for_cache)
+
+        @player.event_callback('start-file')
+        def _on_start_file(event):
+            with self._lock:
+                self._seekable = []
+            self._publish(TrackStarted(self.playlist_pos))
+
+        @player.event_callback('end-file')
+        def _on_end_file(event):
+            reason = event.data.reason
+            if reason == mpv.MpvEventEndFile.EOF:
+                self._publish(TrackEnded("eof"))
+            elif reason == mpv.MpvEventEndFile.ERROR:
+                self._publish(TrackEnded("error"))
+            else:
+                self._publish(TrackEnded("stop"))
+
+        return player
+
+    def _publish(self, event):
+        self.events.put(event)
+        if self.on_event and not isinstance(event, Progress):
+            self.on_event()
+
+    def _push_progress(self):
+        with self._lock:
+            position, duration = self._position, self._duration
+            last = self._last_pushed
+            if last is not None and last[1] == duration and abs(position - last[0]) < self.PROGRESS_STEP:
+                return
+            self._last_pushed = (position, duration)
+        self._publish(Progress(position, duration))
+
+    def _on_time_pos(self, _name, value):
+        started = None
+        with self._lock:
+            self._position = value or 0.0
+            if value is not None:
+                started, self._play_started = self._play_started, None
+        if started is not None:
+            tracer.record("player.play_to_audio", time.perf_counter() - started)
+        self._push_progress()
+
+    def _on_duration(self, _name, value):
+        with self._lock:
+            self._duration = value or 0.0
+        self._push_progress()
+
+    def _on_pause(self, _name, value):
+        with self._lock:
+            self._paused = bool(value)
+        self._publish(PauseChanged(bool(value)))
+
+    def _on_idle(self, _name, value):
+        with self._lock:
+            self._idle = bool(value)
 
-    def play(self, url: str):
-        self.mpv.play(url)
+    def _on_cache_state(self, _name, value):
+        if not value:
+            return
+        with self._lock:
+            self._seekable = [(r['start'], r['end']) for r in value.get('seekable-ranges') or []]
+
+        # Once readahead is full mpv stops reading and the rate drops to nothing, that says nothing about the link
+        if value.get('idle') or self.on_input_rate is None:
+            return
+        rate = value.get('raw-input-rate') or 0
+        if rate > 0:
+            self.on_input_rate(rate)
+
+    def _on_paused_for_cache(self, _name, value):
+        if value:
+            with self._lock:
+                self._stalls += 1
+
+    def poll_events(self) -> list:
+        """Drains every event queued since the last call, without touching mpv."""
+        drained = []
+        while True:
+            try:
+                drained.append(self.events.get_nowait())
+            except queue.Empty:
+                return drained
+
+    def play(self, url: str, start: float = None, track=None):
+        """Plays url, from start seconds in if given (mpv then fetches from there, not from zero)."""
+        with self._lock:
+            self._play_started = time.perf_counter()
+            self._tracks = [track]
+        if start:
+            self.mpv.loadfile(url, 'replace', start=f"{start:.1f}")
+        else:
+            self.mpv.play(url)
+
+    def append(self, url: str, start: float = None, track=None):
+        # Queued behind the current track so mpv can roll straight into it
+        with self._lock:
+            self._tracks.append(track)
+        if start:
+            self.mpv.loadfile(url, 'append', start=f"{start:.1f}")
+        else:
+            self.mpv.playlist_append(url)
+
+    def seek(self, offset: float):
+        """Seeks offset seconds from the current position without leaving the buffered range.
+
+        Returns the position sought to, or None if nothing is playing.
+        """
+        if self._mpv is None:
+            return None
+        with self._lock:
+            if self._idle:
+                return None
+            position, duration, seekable = self._position, self._duration, list(self._seekable)
+
+        target = max(0.0, position + offset)
+        if duration > 0:
+            target = min(target, max(0.0, duration - self.SEEK_MARGIN))
+        # No ranges reported (local files, or the cache is off): mpv can seek anywhere cheaply or has to refetch anyway
+        if seekable and not any(start <= target <= end for start, end in seekable):
+            current = next(((start, end) for start, end in seekable if start <= position <= end), None)
+            if current is None:
+                return position
+            start, end = current
+            target = max(start, min(target, end - self.SEEK_MARGIN))
+            # Barely anything buffered ahead, a forward seek must not turn into a backward one
+            if (target - position) * offset < 0:
+                return position
+
+        self.mpv.seek(target, 'absolute')
+        with self._lock:
+            # So a second press before mpv reports back builds on this one
+            self._position = target
+        return target
+
+    def clear_queue(self):
+        # Drops every playlist entry except the one currently playing
+        pos = self.playlist_pos
+        self.mpv.playlist_clear()
+        with self._lock:
+            self._tracks = self._tracks[pos:pos + 1] if pos >= 0 else []
 
     def stop(self):
-        self.mpv.command('stop')
+        # Nothing to stop if mpv was never started
+        if self._mpv is not None:
+            self.mpv.command('stop')
+        with self._lock:
+            self._tracks = []
 
     def toggle_pause(self) -> bool:
-        self.mpv.pause = not self.mpv.pause
-        return self.mpv.pause
+        paused = not self.paused
+        self.mpv.pause = paused
+        return paused
+
+    # The properties below read the values mpv last reported, so they never block on the mpv core
 
     @property
     def time_pos(self) -> float:
-        try:
-            return self.mpv.time_pos or 0.0
-        except Exception:
-            return 0.0
+        with self._lock:
+            return self._position
 
     @property
     def duration(self) -> float:
-        try:
-            return self.mpv.duration or 0.0
-        except Exception:
-            return 0.0
+        with self._lock:
+            return self._duration
+
+    @property
+    def paused(self) -> bool:
+        with self._lock:
+            return self._paused
+
+    @property
+    def stall_count(self) -> int:
+        with self._lock:
+            return self._stalls
 
     @property
     def is_idle(self) -> bool:
+        with self._lock:
+            return self._idle
+
+    @property
+    def playlist_pos(self) -> int:
+        if self._mpv is None:
+            return -1
         try:
-            # 'idle_active' remains True whenever MPV is sitting empty after a song finishes
-            return getattr(self.mpv, 'idle_active', True)
+            pos = self.mpv.playlist_pos
+            return -1 if pos is None else pos
         except Exception:
-            return True
+            return -1
+
+    @property
+    def current_track(self):
+        """The Track passed along with whatever mpv is playing, None if it wasn't given one."""
+        pos = self.playlist_pos
+        with self._lock:
+            return self._tracks[pos] if 0 <= pos < len(self._tracks) else None
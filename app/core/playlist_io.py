@@ -0,0 +1,245 @@
+import csv
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from core.track import Track, split_artists
+
+# Anything that carries an 11 character video id: watch URLs, youtu.be links, or the bare id
+VIDEO_ID = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|^)([A-Za-z0-9_-]{11})(?:[&?#/]|$)")
+PLAYLIST_ID = re.compile(r"(?:[?&]list=|^)((?:PL|OLAK5uy_|VL|RD|UU|LL|FL)[A-Za-z0-9_-]{8,})")
+
+# #EXTINF:<seconds> [key="value" ...],<artist> - <title>, IPTV style lists put -1 and attributes before the comma
+EXTINF = re.compile(r'#EXTINF:\s*(-?\d+(?:\.\d+)?)?(?:[^,"]|"[^"]*")*,?(.*)')
+
+FORMATS = {".m3u": "m3u", ".m3u8": "m3u", ".json": "json", ".jsonl": "json", ".csv": "csv"}
+
+
+def detect_format(source: str):
+    """m3u, json or csv from the file extension, "youtube" for a playlist id or URL, None if unknown."""
+    suffix = Path(source).suffix.lower()
+    if suffix in FORMATS:
+        return FORMATS[suffix]
+    if not Path(source).exists() and PLAYLIST_ID.search(source):
+        return "youtube"
+    return None
+
+
+def _bare(video_id: str) -> Track:
+    # Only the id is known, the importer fills in the rest
+    return Track(video_id, "")
+
+
+def _from_fields(video_id: str, title: str, artist, duration) -> Track:
+    if not title:
+        return _bare(video_id)
+    artists = split_artists(artist) if isinstance(artist, str) else tuple(artist or ())
+    return Track.create(video_id, title, artists, duration or 0)
+
+
+# --- readers, each yields Tracks one at a time without reading the whole file ---
+# An entry that can't be imported (another site, a malformed item) comes out as None, for the importer to count
+
+def read_m3u(path):
+    with open(path, encoding="utf-8-sig") as f:
+        info = None
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                seconds, label = EXTINF.match(line).groups()
+                artist, _, title = label.partition(" - ")
+                if not title:
+                    artist, title = "", label
+                info = (title.strip(), artist.strip(), max(int(float(seconds or 0)), 0))
+                continue
+            if not line or line.startswith("#"):
+                continue
+
+            match = VIDEO_ID.search(line)
+            # Local files and other sites can't be played from here
+            if match:
+                yield _from_fields(match.group(1), *info) if info else _bare(match.group(1))
+            else:
+                yield None
+            info = None
+
+
+def _track_from_object(item):
+    if isinstance(item, list):
+        try:
+            return Track.from_json(item)
+        except (TypeError, ValueError):
+            return None
+    if not isinstance(item, dict):
+        return None
+    video_id = item.get("id") or item.get("videoId") or item.get("video_id")
+    if not video_id:
+        return None
+    return _from_fields(video_id, item.get("title"), item.get("artists") or item.get("artist"), item.get("duration"))
+
+
+def read_json(path, chunk_size: int = 1 << 16):
+    """A JSON array of tracks, or one track per line. Decoded an element at a time."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8-sig") as f:
+        buffer = f.read(chunk_size).lstrip()
+        in_array = buffer.startswith("[")
+        pos = 1 if in_array else 0
+        exhausted = False
+
+        while True:
+            # Skip separators between elements
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if in_array and pos < len(buffer) and buffer[pos] == "]":
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if exhausted:
+                    if buffer[pos:].strip():
+                        raise
+                    return
+                # The element runs past what we've read so far
+                more = f.read(chunk_size)
+                exhausted = not more
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+
+            pos = end
+            yield _track_from_object(item)
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            video_id = row.get("video_id") or row.get("id") or row.get("videoId")
+            if video_id:
+                yield _from_fields(video_id.strip(), row.get("title"), row.get("artist") or row.get("artists"), row.get("duration"))
+            else:
+                yield None
+
+
+def read_youtube(playlist: str, api):
+    # ytmusicapi hands back the whole playlist in one go, so unlike the file readers this holds it all in memory
+    yield from api.get_playlist_tracks(PLAYLIST_ID.search(playlist).group(1))
+
+
+def read_source(source: str, api=None):
+    fmt = detect_format(source)
+    if fmt == "m3u":
+        return read_m3u(source)
+    if fmt == "json":
+        return read_json(source)
+    if fmt == "csv":
+        return read_csv(source)
+    if fmt == "youtube":
+        return read_youtube(source, api)
+    raise ValueError(f"Don't know how to import {source!r}, expected .m3u, .json, .csv or a YouTube playlist id")
+
+
+class PlaylistImporter:
+    """Streams a playlist into My Playlist.
+
+    The source is read in batches. Tracks that arrive without metadata (bare
+    ids or URLs) are looked up in the library first and on YouTube Music
+    otherwise, on a bounded thread pool. Each batch is then written as one
+    executemany transaction, so only one batch is ever held in memory.
+    """
+
+    BATCH_SIZE = 1000
+    WORKERS = 8
+
+    def __init__(self, db, api, workers: int = WORKERS, batch_size: int = BATCH_SIZE, on_progress=None):
+        self.db = db
+        self.api = api
+        self.workers = workers
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+
+    def run(self, source: str) -> dict:
+        stats = {"read": 0, "added": 0, "resolved": 0, "failed": 0, "unreadable": 0}
+        entries = read_source(source, self.api)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                batch = list(islice(entries, self.batch_size))
+                if not batch:
+                    break
+                stats["read"] += len(batch)
+                readable = [track for track in batch if track is not None]
+                stats["unreadable"] += len(batch) - len(readable)
+                batch = readable
+
+                tracks = self._complete(batch, pool, stats)
+                if tracks:
+                    stats["added"] += self.db.add_many_to_playlist(tracks)
+                if self.on_progress:
+                    self.on_progress(dict(stats))
+        return stats
+
+    def _complete(self, batch: list, pool, stats: dict) -> list:
+        missing = list({track.id for track in batch if not track.title})
+        found = self.db.get_known_tracks(missing) if missing else {}
+
+        unknown = [video_id for video_id in missing if video_id not in found]
+        for video_id, track in zip(unknown, pool.map(self.api.get_track, unknown)):
+            if track is not None:
+                found[video_id] = track
+                stats["resolved"] += 1
+
+        tracks = []
+        for track in batch:
+            if not track.title:
+                track = found.get(track.id)
+                if track is None:
+                    stats["failed"] += 1
+                    continue
+            tracks.append(track)
+        return tracks
+
+
+# --- export ---
+
+def iter_playlist(db, page_size: int = 1000):
+    token = None
+    while True:
+        tracks, token = db.get_playlist_page(token, page_size)
+        yield from tracks
+        if token is None:
+            return
+
+
+def export_playlist(db, path: str) -> int:
+    """Writes My Playlist to path as M3U, JSON or CSV (by extension). Returns the number of tracks."""
+    fmt = FORMATS.get(Path(path).suffix.lower())
+    if fmt is None:
+        raise ValueError(f"Don't know how to export to {path!r}, expected .m3u, .json or .csv")
+
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if fmt == "m3u":
+            f.write("#EXTM3U\n")
+            for track in iter_playlist(db):
+                f.write(f"#EXTINF:{track.duration or -1},{track.artist} - {track.title}\n")
+                f.write(f"https://music.youtube.com/watch?v={track.id}\n")
+                count += 1
+        elif fmt == "json":
+            f.write("[\n")
+            for track in iter_playlist(db):
+                if count:
+                    f.write(",\n")
+                f.write(json.dumps({"id": track.id, "title": track.title, "artists": list(track.artists), "duration": track.duration}))
+                count += 1
+            f.write("\n]\n")
+        else:
+            writer = csv.writer(f)
+            writer.writerow(["video_id", "title", "artist", "duration"])
+            for track in iter_playlist(db):
+                writer.writerow([track.id, track.title, track.artist, track.duration])
+                count += 1
+    return count
@@ -0,0 +1,150 @@
+import itertools
+import queue
+import random
+import threading
+import time
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to burst."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        # Nobody gets a token until the pause is over, backoff applies to every worker at once
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    def acquire(self, cancelled: threading.Event) -> bool:
+        """Blocks until a token is free. False if cancelled while waiting."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    wait = self._resume_at - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return True
+                    wait = (1 - self._tokens) / self.rate
+            if cancelled.wait(wait):
+                return False
+
+
+class PreResolver:
+    """Resolves stream URLs for a whole list of tracks ahead of time.
+
+    Tracks are resolved in the order given (the caller puts next-up first) by a
+    few worker threads, throttled by a token bucket. When YouTube starts
+    refusing requests every worker backs off exponentially and the track goes
+    back in the queue at its original priority. URLs end up in the resolver's
+    cache, so playing any of them later skips yt-dlp.
+    """
+
+    # Substrings of yt-dlp errors that mean "slow down" rather than "this video is broken"
+    THROTTLE_MARKERS = ("429", "too many requests", "rate limit", "rate-limit", "not a bot")
+    MAX_RETRIES = 4
+    BACKOFF_BASE = 5.0
+    BACKOFF_MAX = 120.0
+
+    def __init__(self, resolver, workers: int = 3, rate: float = 0.5, burst: int = 3, on_progress=None):
+        self.resolver = resolver
+        self.workers = max(1, workers)
+        self.bucket = TokenBucket(rate, burst)
+        # Called from worker threads with {"total", "done", "failed", "finished", "cancelled"}
+        self.on_progress = on_progress
+        self._run = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        run = self._run
+        return run is not None and not run["finished"]
+
+    def start(self, video_ids: list):
+        """Starts warming video_ids, highest priority first. Replaces any run in progress."""
+        self.cancel()
+
+        order = list(dict.fromkeys(video_ids))
+        run = {
+            "queue": queue.PriorityQueue(),
+            "cancelled": threading.Event(),
+            "total": len(order),
+            "done": 0,
+            "failed": 0,
+            "active": self.workers,
+            "finished": False,
+        }
+        # The counter breaks ties, so retried tracks keep their place relative to the rest
+        tiebreak = itertools.count()
+        for priority, video_id in enumerate(order):
+            run["queue"].put((priority, next(tiebreak), video_id, 0))
+
+        with self._lock:
+            self._run = run
+        for _ in range(self.workers):
+            threading.Thread(target=self._work, args=(run,), daemon=True).start()
+
+    def cancel(self):
+        with self._lock:
+            run = self._run
+        if run is not None and not run["finished"]:
+            run["cancelled"].set()
+
+    def _report(self, run: dict):
+        if self.on_progress:
+            self.on_progress({
+                "total": run["total"],
+                "done": run["done"],
+                "failed": run["failed"],
+                "finished": run["finished"],
+                "cancelled": run["cancelled"].is_set(),
+            })
+
+    def _throttled(self, error: Exception) -> bool:
+        message = str(error).lower()
+        return any(marker in message for marker in self.THROTTLE_MARKERS)
+
+    def _work(self, run: dict):
+        cancelled = run["cancelled"]
+        while not cancelled.is_set():
+            try:
+                priority, tiebreak, video_id, attempt = run["queue"].get_nowait()
+            except queue.Empty:
+                break
+
+            # Already warm (or downloaded), don't spend a token on it
+            if not self.resolver.is_cached(video_id):
+                if not self.bucket.acquire(cancelled):
+                    break
+                try:
+                    self.resolver.get_stream_url(video_id)
+                except Exception as e:
+                    if self._throttled(e) and attempt < self.MAX_RETRIES:
+                        delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt)
+                        self.bucket.pause(delay * random.uniform(0.8, 1.2))
+                        run["queue"].put((priority, tiebreak, video_id, attempt + 1))
+                        continue
+                    with self._lock:
+                        run["failed"] += 1
+                    self._report(run)
+                    continue
+
+            with self._lock:
+                run["done"] += 1
+            self._report(run)
+
+        with self._lock:
+            run["active"] -= 1
+            last = run["active"] == 0
+            if last:
+                run["finished"] = True
+        if last:
+            self._report(run)
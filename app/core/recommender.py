@@ -0,0 +1,37 @@
+import math
+import random
+
+from core.trace import tracer
+
+class Recommender:
+    """Made For You out of the local database, no network needed.
+
+    Recent plays and all-time favourites are the seeds. Candidates are scored
+    from what got played alongside them (the co-occurrence graph Database keeps
+    up to date on every history insert) and from the radios YouTube generated
+    for them before. The result is shuffled by score, so refreshing the mix
+    gives a different but still relevant selection.
+    """
+
+    RECENT_SEEDS = 20
+    FAVOURITE_SEEDS = 10
+    # How much a radio neighbor counts next to playing two tracks back to back (weight 1)
+    RADIO_WEIGHT = 0.5
+
+    def __init__(self, db):
+        self.db = db
+
+    def seeds(self) -> dict:
+        # The last thing played matters most, older plays fade out
+        seeds = {video_id: 0.9 ** age for age, video_id in enumerate(self.db.get_recent_ids(self.RECENT_SEEDS))}
+        for track in self.db.get_most_played(self.FAVOURITE_SEEDS):
+            seeds[track.id] = seeds.get(track.id, 0.0) + 0.5
+        return seeds
+
+    @tracer.traced("recommender.mix")
+    def mix(self, limit: int = 25) -> list:
+        candidates = self.db.score_candidates(self.seeds(), self.RADIO_WEIGHT, limit * 3)
+        # Weighted shuffle (Efraimidis-Spirakis): higher scores tend to come first, but not always the same ones
+        keyed = [(math.log(random.random() or 1e-12) / score, track) for track, score in candidates if score > 0]
+        keyed.sort(key=lambda item: item[0], reverse=True)
+        return [track for _, track in keyed[:limit]]
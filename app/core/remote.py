@@ -0,0 +1,404 @@
+import itertools
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from dataclasses import asdict, fields
+from pathlib import Path
+
+from core.player import Progress, PauseChanged, TrackStarted, TrackEnded
+
+# The daemon protocol is JSON lines over a Unix socket, one object per line:
+#   request   {"id": 1, "cmd": "status", "args": {}}
+#   reply     {"id": 1, "ok": true, "result": ...}  or  {"id": 1, "ok": false, "error": "..."}
+#   event     {"event": "Progress", "position": 12.3, "duration": 180.0}
+# Events only flow on a connection that sent "subscribe", and nothing else does from then on.
+
+EVENTS = {cls.__name__: cls for cls in (Progress, PauseChanged, TrackStarted, TrackEnded)}
+
+
+def socket_path() -> Path:
+    """Where the daemon listens: $TUSIC_SOCKET, else the per-user runtime dir, else ~/.cache/tusic."""
+    if os.environ.get("TUSIC_SOCKET"):
+        return Path(os.environ["TUSIC_SOCKET"]).expanduser()
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    base = Path(runtime) if runtime else Path.home() / ".cache" / "tusic"
+    return base / "tusic.sock"
+
+
+def encode_event(event, **extra) -> dict:
+    return {"event": type(event).__name__, **asdict(event), **extra}
+
+
+def decode_event(message: dict):
+    """The Player event a message carries, None for anything else. Extra keys (a TrackStarted's track) are dropped."""
+    cls = EVENTS.get(message.get("event"))
+    if cls is None:
+        return None
+    return cls(**{field.name: message[field.name] for field in fields(cls)})
+
+
+class DaemonError(Exception):
+    """The daemon understood the request but couldn't carry it out."""
+
+
+class DaemonClient:
+    """Talks to a running daemon.
+
+    Each request checks a connection out of a small pool and hands it back
+    once the reply is in, so a resolve taking a few seconds on a worker thread
+    never holds up a pause from the UI thread. Connections belong to the
+    client, not to a thread: most requests come from short-lived workers.
+    """
+
+    # Idle connections kept around for the next request
+    POOL_SIZE = 4
+    # Reused only this long, well inside the daemon's own idle timeout (_Handler.timeout in core/daemon.py)
+    MAX_IDLE = 60.0
+
+    def __init__(self, path=None, timeout: float = 60.0):
+        self.path = str(path or socket_path())
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._idle = []
+        self._subscriptions = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, path=None):
+        """A client for the daemon at path, or None if nothing is listening there."""
+        client = cls(path)
+        try:
+            client.request("ping")
+        except (OSError, DaemonError):
+            client.close()
+            return None
+        return client
+
+    def _dial(self, timeout):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock, sock.makefile("rb")
+
+    @staticmethod
+    def _hang_up(sock, reader):
+        # The descriptor only goes once the file made from it is closed too
+        reader.close()
+        sock.close()
+
+    def _checkout(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                sock, reader, used = self._idle.pop()
+                if now - used < self.MAX_IDLE:
+                    return sock, reader, True
+                self._hang_up(sock, reader)
+        return (*self._dial(self.timeout), False)
+
+    def _checkin(self, sock, reader):
+        with self._lock:
+            if not self._closed and len(self._idle) < self.POOL_SIZE:
+                self._idle.append((sock, reader, time.monotonic()))
+                return
+        self._hang_up(sock, reader)
+
+    def _exchange(self, sock, reader, line: bytes) -> bytes:
+        try:
+            sock.sendall(line)
+            reply = reader.readline()
+        except OSError:
+            self._hang_up(sock, reader)
+            raise
+        if not reply:
+            self._hang_up(sock, reader)
+            raise ConnectionError(f"tusic daemon at {self.path} went away")
+        return reply
+
+    def request(self, cmd: str, **args):
+        """Sends one command and waits for its reply. Raises DaemonError if it failed, OSError if the daemon is gone."""
+        line = json.dumps({"id": next(self._ids), "cmd": cmd, "args": args}).encode() + b"\n"
+        sock, reader, reused = self._checkout()
+        try:
+            reply = self._exchange(sock, reader, line)
+        except OSError:
+            if not reused:
+                raise
+            # The daemon restarted, or timed the idle connection out, before it read anything. One fresh try.
+            sock, reader = self._dial(self.timeout)
+            reply = self._exchange(sock, reader, line)
+        self._checkin(sock, reader)
+
+        reply = json.loads(reply)
+        if not reply.get("ok"):
+            raise DaemonError(reply.get("error") or "request failed")
+        return reply.get("result")
+
+    def events(self, **args):
+        """Subscribes on a connection of its own and yields every event message until the daemon goes away."""
+        sock, reader = self._dial(self.timeout)
+        with self._lock:
+            self._subscriptions.append(sock)
+        try:
+            sock.sendall(json.dumps({"id": 0, "cmd": "subscribe", "args": args}).encode() + b"\n")
+            ack = json.loads(reader.readline() or b"{}")
+            if not ack.get("ok"):
+                raise DaemonError(ack.get("error") or "subscribe failed")
+            # Events arrive whenever something happens, possibly hours apart
+            sock.settimeout(None)
+            for line in reader:
+                yield json.loads(line)
+        finally:
+            with self._lock:
+                if sock in self._subscriptions:
+                    self._subscriptions.remove(sock)
+            self._hang_up(sock, reader)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            subscriptions = list(self._subscriptions)
+        for sock, reader, _ in idle:
+            self._hang_up(sock, reader)
+        for sock in subscriptions:
+            try:
+                # Wakes the thread blocked reading events, which closes it on the way out
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class RemotePlayer:
+    """Stands in for Player when the TUI is attached to a daemon.
+
+    mpv lives in the daemon, so playback carries on when the TUI quits. Events
+    come in on a subscription and land in the same queue Player would fill. The
+    state Player answers from memory (position, duration, pause, idle, playlist
+    position, stalls) is kept from them too, so polling it never waits on the socket.
+    """
+
+    def __init__(self, client: DaemonClient):
+        self.client = client
+        self.events = queue.SimpleQueue()
+        self.on_event = None
+        # The daemon measures throughput on its own side, nothing to report here
+        self.on_input_rate = None
+        # Called from the listener thread if the daemon goes away while attached
+        self.on_disconnect = None
+
+        self._lock = threading.Lock()
+        self._position = 0.0
+        self._duration = 0.0
+        self._paused = False
+        self._closed = False
+        # Asked once, the events keep it current from here on
+        state = self._call("player.state") or {}
+        self._idle = state.get("idle", True)
+        self._playlist_pos = state.get("playlist_pos", -1)
+        self._stalls = state.get("stalls", 0)
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        try:
+            # player=True tells the daemon a UI is driving, so it leaves advancing the queue to us
+            for message in self.client.events(player=True):
+                event = decode_event(message)
+                if event is None:
+                    continue
+                with self._lock:
+                    self._stalls = message.get("stalls", self._stalls)
+                    if isinstance(event, Progress):
+                        self._position, self._duration = event.position, event.duration
+                    elif isinstance(event, PauseChanged):
+                        self._paused = event.paused
+                    elif isinstance(event, TrackStarted):
+                        self._idle, self._playlist_pos = False, event.playlist_pos
+                    elif isinstance(event, TrackEnded):
+                        # A following entry announces itself with TrackStarted right after
+                        self._idle, self._playlist_pos = True, -1
+                self.events.put(event)
+                if self.on_event and not isinstance(event, Progress):
+                    self.on_event()
+        except (OSError, ValueError, DaemonError):
+            pass
+        if not self._closed and self.on_disconnect:
+            self.on_disconnect()
+
+    def _call(self, cmd: str, **args):
+        # A daemon that died mid-session shouldn't take the UI down with it, on_disconnect tells the user
+        try:
+            return self.client.request(cmd, **args)
+        except OSError:
+            return None
+
+    def poll_events(self) -> list:
+        drained = []
+        while True:
+            try:
+                drained.append(self.events.get_nowait())
+            except queue.Empty:
+                return drained
+
+    def play(self, url: str, start: float = None, track=None):
+        self._call("player.play", url=url, start=start, track=track.to_json() if track else None)
+        # mpv's playlist now holds just this, its own events confirm it a moment later
+        with self._lock:
+            self._idle, self._playlist_pos = False, 0
+
+    def append(self, url: str, start: float = None, track=None):
+        self._call("player.append", url=url, start=start, track=track.to_json() if track else None)
+
+    def seek(self, offset: float):
+        position = self._call("player.seek", offset=offset)
+        if position is not None:
+            with self._lock:
+                self._position = position
+        return position
+
+    def clear_queue(self):
+        self._call("player.clear_queue")
+        # Only the playing entry is left, at the top
+        with self._lock:
+            if self._playlist_pos > 0:
+                self._playlist_pos = 0
+
+    def stop(self):
+        self._call("player.stop")
+        with self._lock:
+            self._idle, self._playlist_pos = True, -1
+
+    def toggle_pause(self) -> bool:
+        paused = bool(self._call("player.toggle_pause"))
+        with self._lock:
+            self._paused = paused
+        return paused
+
+    def close(self):
+        self._closed = True
+        self.client.close()
+
+    @property
+    def time_pos(self) -> float:
+        with self._lock:
+            return self._position
+
+    @property
+    def duration(self) -> float:
+        with self._lock:
+            return self._duration
+
+    @property
+    def paused(self) -> bool:
+        with self._lock:
+            return self._paused
+
+    @property
+    def stall_count(self) -> int:
+        with self._lock:
+            return self._stalls
+
+    @property
+    def is_idle(self) -> bool:
+        with self._lock:
+            return self._idle
+
+    @property
+    def playlist_pos(self) -> int:
+        with self._lock:
+            return self._playlist_pos
+
+
+class RemoteResolver:
+    """The daemon's StreamResolver, so its warm extractors and URL cache serve every client."""
+
+    def __init__(self, client: DaemonClient):
+        self.client = client
+
+    def get_stream_url(self, video_id: str, wanted=None) -> str:
+        # The daemon can't ask back whether the request is still wanted, a stale answer is dropped on arrival
+        return self.client.request("resolve", video_id=video_id)
+
+    def is_cached(self, video_id: str) -> bool:
+        return self.client.request("resolver.is_cached", video_id=video_id)
+
+    def invalidate(self, video_id: str):
+        self.client.request("resolver.invalidate", video_id=video_id)
+
+    def stream_format(self, url: str) -> dict:
+        return self.client.request("resolver.stream_format", url=url)
+
+    def cache_stats(self) -> dict:
+        return self.client.request("resolver.stats")["cache"]
+
+    def strategy_stats(self) -> dict:
+        return self.client.request("resolver.stats")["strategies"]
+
+    def close(self):
+        # Nothing to tear down, the daemon's resolver outlives this client
+        pass
+
+
+class RemoteAudioCache:
+    """The daemon's AudioCache. It alone downloads into and evicts from the cache directory."""
+
+    def __init__(self, client: DaemonClient):
+        self.client = client
+
+    def _call(self, cmd: str, **args):
+        # Mostly called from the UI thread, a daemon gone missing is reported by RemotePlayer.on_disconnect
+        try:
+            return self.client.request(cmd, **args)
+        except OSError:
+            return None
+
+    def is_pinned(self, video_id: str) -> bool:
+        return bool(self._call("audio.is_pinned", video_id=video_id))
+
+    def pin(self, video_id: str, pinned: bool = True):
+        self._call("audio.pin", video_id=video_id, pinned=pinned)
+
+    def store_in_background(self, video_id: str, url: str):
+        self._call("audio.store", video_id=video_id, url=url)
+
+    def remove(self, video_id: str):
+        self._call("audio.remove", video_id=video_id)
+
+
+class RemoteThroughputMeter:
+    """The daemon's ThroughputMeter, it is the one fed by mpv and the downloads."""
+
+    def __init__(self, client: DaemonClient):
+        self.client = client
+
+    def add(self, bytes_per_second: float):
+        # Nothing is measured on this side
+        pass
+
+    def estimate(self):
+        try:
+            return self.client.request("quality")["throughput"]
+        except OSError:
+            return None
+
+
+class RemoteFormatPolicy:
+    """The daemon's FormatPolicy, the bitrate tier its resolver asks for."""
+
+    def __init__(self, client: DaemonClient):
+        self.client = client
+
+    def tier(self) -> str:
+        try:
+            return self.client.request("quality")["tier"]
+        except OSError:
+            return "unknown"
@@ -1,17 +1,407 @@
-import yt_dlp
+import queue
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+from core.bandwidth import format_from_url
+from core.trace import tracer
+
+class CircuitBreaker:
+    """Demotes a strategy after threshold failures in a row, for cooldown seconds.
+
+    A demoted strategy is still tried, just last. Once the cooldown is over it
+    gets its normal place back, and one more failure demotes it again.
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 300.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = {}
+        self._open_until = {}
+        self._lock = threading.Lock()
+
+    def success(self, name: str):
+        with self._lock:
+            self._failures[name] = 0
+            self._open_until.pop(name, None)
+
+    def failure(self, name: str):
+        with self._lock:
+            failures = self._failures.get(name, 0) + 1
+            self._failures[name] = failures
+            if failures >= self.threshold:
+                self._open_until[name] = time.monotonic() + self.cooldown
+
+    def is_open(self, name: str) -> bool:
+        with self._lock:
+            return self._open_until.get(name, 0) > time.monotonic()
+
+    def order(self, names: list) -> list:
+        # Stable, so healthy strategies keep their configured order
+        return sorted(names, key=self.is_open)
+
+
+class Superseded(Exception):
+    """The resolve was no longer wanted by the time it could get an extractor."""
+
 
 class StreamResolver:
-    def __init__(self):
+    # Treat a URL as stale a little before googlevideo actually expires it,
+    # so mpv never gets handed a link that dies mid-open.
+    EXPIRY_MARGIN = 120
+    # Fallback lifetime when the URL carries no expire timestamp
+    DEFAULT_TTL = 3600
+
+    # yt-dlp options layered over ydl_opts. They ask YouTube through different player
+    # clients, which tend not to break (or get throttled) at the same time.
+    STRATEGIES = {
+        "default": {},
+        "ios": {'extractor_args': {'youtube': {'player_client': ['ios']}}, 'format': 'bestaudio[ext=m4a]/bestaudio/best'},
+        "tv": {'extractor_args': {'youtube': {'player_client': ['tv']}}},
+        "web_music": {'extractor_args': {'youtube': {'player_client': ['web_music']}}},
+    }
+
+    def __init__(self, db=None, pool_size: int = 2, disk_cache: bool = True, audio_cache=None, ydl_class=None, http=None,
+                 strategies: list = None, hedge_after: float = 2.5, attempt_timeout: float = 20.0, format_policy=None):
         self.ydl_opts = {
             'format': 'bestaudio/best',
             'quiet': True,
             'no_warnings': True,
-            'extract_flat': False, 
+            'extract_flat': False,
         }
+        # Lets yt-dlp persist player JS / signature functions between runs
+        if disk_cache:
+            cache_dir = Path.home() / ".cache" / "tusic" / "yt-dlp"
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            self.ydl_opts['cachedir'] = str(cache_dir)
+        else:
+            self.ydl_opts['cachedir'] = False
+        # yt-dlp has its own networking, it only takes the proxy and timeout from the shared settings.
+        # Its connections are kept alive per YoutubeDL instance, which the pool below holds on to.
+        if http is not None:
+            self.ydl_opts.update(http.ytdlp_options())
+
+        self.db = db
+        # Stand-in for yt_dlp.YoutubeDL, the benchmarks pass a fake one
+        self.ydl_class = ydl_class
+        # Downloaded audio beats any URL, and works offline
+        self.audio_cache = audio_cache
+
+        # First one is the primary, the rest are only started when it is slow or failing
+        self.strategies = [name for name in (strategies or ["default", "ios"]) if name in self.STRATEGIES] or ["default"]
+        # Seconds to wait on an attempt before starting the next strategy alongside it, None to only fall back on failure
+        self.hedge_after = hedge_after
+        # An attempt still running after this long is given up on (yt-dlp can't be interrupted, it just gets ignored)
+        self.attempt_timeout = attempt_timeout
+        self.breaker = CircuitBreaker()
+        self._attempts = None
+        self._strategy_stats = {name: {'wins': 0, 'hedged_wins': 0, 'failures': 0, 'timeouts': 0} for name in self.strategies}
+
+        # Long-lived extractors per strategy, checked out by one worker thread at a time.
+        # They are created lazily, so extra pool slots cost nothing until two workers resolve at once.
+        self.pool_size = max(1, pool_size)
+        self._pools = {name: queue.Queue() for name in self.strategies}
+        self._created = dict.fromkeys(self.strategies, 0)
+        self._pool_lock = threading.Lock()
+
+        # Decides the bitrate to ask for on each extraction, None always takes the best audio
+        self.format_policy = format_policy
+        # Stream URL -> what was picked for it, for the per-play quality log
+        self._formats = {}
+
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def url_expiry(cls, url: str) -> float:
+        """Reads the expire timestamp googlevideo embeds in its stream URLs."""
+        parsed = urlparse(url)
+        expire = parse_qs(parsed.query).get('expire')
+        if expire:
+            try:
+                return float(expire[0])
+            except ValueError:
+                pass
+
+        # Some URLs carry their parameters in the path instead: /expire/1700000000/
+        match = re.search(r'/expire/(\d+)', parsed.path)
+        if match:
+            return float(match.group(1))
+
+        return time.time() + cls.DEFAULT_TTL
+
+    def _lookup(self, video_id: str):
+        with self._lock:
+            entry = self._cache.get(video_id)
+
+        if entry is None and self.db is not None:
+            entry = self.db.get_cached_stream(video_id)
+            if entry:
+                with self._lock:
+                    self._cache[video_id] = entry
+
+        if entry and entry[1] - self.EXPIRY_MARGIN > time.time():
+            return entry[0]
+        return None
+
+    def _store(self, video_id: str, url: str):
+        expires_at = self.url_expiry(url)
+        with self._lock:
+            self._cache[video_id] = (url, expires_at)
+        if self.db is not None:
+            self.db.set_cached_stream(video_id, url, expires_at)
+
+    def invalidate(self, video_id: str):
+        with self._lock:
+            self._cache.pop(video_id, None)
+        if self.db is not None:
+            self.db.delete_cached_stream(video_id)
+
+    @contextmanager
+    def _extractor(self, strategy: str, wanted=None):
+        pool = self._pools[strategy]
+        ydl = None
+        if wanted is not None and not wanted():
+            raise Superseded(strategy)
+        try:
+            ydl = pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                if self._created[strategy] < self.pool_size:
+                    if self.ydl_class is None:
+                        # yt_dlp takes a good while to import, don't pay for it before the first resolve
+                        import yt_dlp
+                        self.ydl_class = yt_dlp.YoutubeDL
+                    ydl = self.ydl_class(dict(self.ydl_opts, **self.STRATEGIES[strategy]))
+                    # Only counted once it exists, a constructor that raises mustn't use up a slot for good
+                    self._created[strategy] += 1
+            # Every extractor is busy. A request that gets replaced meanwhile stops waiting,
+            # so it never holds a slot the newer one needs.
+            while ydl is None:
+                try:
+                    ydl = pool.get(timeout=0.05 if wanted is not None else None)
+                except queue.Empty:
+                    if not wanted():
+                        raise Superseded(strategy)
 
-    def get_stream_url(self, video_id: str) -> str:
-        """Uses yt-dlp to get the direct audio stream."""
+        try:
+            yield ydl
+        finally:
+            pool.put(ydl)
+
+    @tracer.traced("resolver.extract")
+    def _extract(self, video_id: str, strategy: str = None, wanted=None, on_start=None) -> str:
         url = f"https://www.youtube.com/watch?v={video_id}"
-        with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
+        strategy = strategy or self.strategies[0]
+        tier = self.format_policy.tier() if self.format_policy is not None else "high"
+        spec = self.format_policy.format_spec(tier) if self.format_policy is not None else None
+        with self._extractor(strategy, wanted) as ydl:
+            if on_start is not None:
+                on_start()
+            self._select_format(ydl, spec or self.STRATEGIES[strategy].get('format', self.ydl_opts['format']))
             info = ydl.extract_info(url, download=False)
-            return info['url']
+        self._remember_format(info, tier)
+        return info['url']
+
+    @staticmethod
+    def _select_format(ydl, spec: str):
+        if ydl.params.get('format') == spec:
+            return
+        ydl.params['format'] = spec
+        # YoutubeDL compiles the selector once in __init__ and never looks at params['format'] again,
+        # so a pooled instance only switches tiers if the selector is rebuilt too
+        if hasattr(ydl, 'build_format_selector'):
+            ydl.format_selector = ydl.build_format_selector(spec)
+
+    def _remember_format(self, info: dict, tier: str):
+        audio = [f.get('abr') for f in info.get('formats') or [] if f.get('vcodec') == 'none' and f.get('abr')]
+        with self._lock:
+            self._formats[info['url']] = {
+                'format_id': info.get('format_id'),
+                'codec': info.get('acodec'),
+                'abr': info.get('abr'),
+                'best_abr': max(audio) if audio else None,
+                'tier': tier,
+            }
+            # Only the formats of recent resolves are ever asked for
+            while len(self._formats) > 1000:
+                del self._formats[next(iter(self._formats))]
+
+    def stream_format(self, url: str) -> dict:
+        """format_id, codec, abr, best_abr and tier for a URL get_stream_url returned, as far as known."""
+        if not url.startswith("http"):
+            return {'format_id': None, 'codec': None, 'abr': None, 'best_abr': None, 'tier': "local"}
+        with self._lock:
+            known = self._formats.get(url)
+        # URLs from the disk cache were resolved in an earlier session, the itag in them still says a lot
+        return dict(known) if known else dict(format_from_url(url), tier=None)
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._attempts is None:
+                # Room for every pooled extractor, plus as many given up attempts still holding one
+                self._attempts = ThreadPoolExecutor(max_workers=2 * self.pool_size * len(self.strategies),
+                                                    thread_name_prefix="resolve")
+            return self._attempts
+
+    def _count(self, strategy: str, key: str):
+        with self._lock:
+            self._strategy_stats[strategy][key] += 1
+
+    def _start_attempt(self, video_id: str, strategy: str, wanted=None):
+        # The timeout counts from when an extractor is checked out, not from the wait in line for one
+        attempt = {'strategy': strategy, 'submitted': time.monotonic(), 'started': None, 'abandoned': False}
+
+        def still_wanted():
+            # Once given up on, an attempt that hasn't got an extractor yet drops out instead of running for nobody.
+            # Only the ones already extracting stay in flight, at most one per pooled extractor.
+            return not attempt['abandoned'] and (wanted is None or wanted())
+
+        def begin():
+            attempt['started'] = time.monotonic()
+
+        def settle(future):
+            # A timed out attempt was already counted as a failure when it was abandoned
+            if attempt['abandoned'] or isinstance(future.exception(), Superseded):
+                return
+            if future.exception() is None:
+                self.breaker.success(strategy)
+            else:
+                self.breaker.failure(strategy)
+                self._count(strategy, 'failures')
+
+        future = self._executor().submit(self._extract, video_id, strategy, still_wanted, begin)
+        future.add_done_callback(settle)
+        return future, attempt
+
+    @staticmethod
+    def _clock(attempt: dict) -> float:
+        # Still waiting for an extractor, that wait gets its own attempt_timeout
+        return attempt['started'] or attempt['submitted']
+
+    def _resolve(self, video_id: str, wanted=None) -> str:
+        """Runs the strategies hedged: the next one starts when the current one is slow or fails, first URL wins."""
+        waiting = self.breaker.order(self.strategies)
+        running = dict([self._start_attempt(video_id, waiting.pop(0), wanted)])
+        hedge_at = time.monotonic() + self.hedge_after if self.hedge_after is not None else None
+        launched = 1
+        error = None
+
+        while running:
+            now = time.monotonic()
+            deadline = min(self._clock(attempt) for attempt in running.values()) + self.attempt_timeout
+            if waiting and hedge_at is not None:
+                deadline = min(deadline, hedge_at)
+            done, _ = wait(running, timeout=max(0.0, deadline - now), return_when=FIRST_COMPLETED)
+            # Every finished attempt here failed, a successful one returns straight away
+            lost = len(done)
+
+            for future in done:
+                attempt = running.pop(future)
+                try:
+                    url = future.result()
+                except Superseded:
+                    # Nobody is waiting for this one any more, no point starting another strategy
+                    for loser in running.values():
+                        loser['abandoned'] = True
+                    raise
+                except Exception as e:
+                    error = e
+                    continue
+                strategy = attempt['strategy']
+                self._count(strategy, 'wins')
+                if launched > 1:
+                    self._count(strategy, 'hedged_wins')
+                # Shows up on the stats screen, so the strategy defaults can be tuned from real numbers
+                tracer.record(f"resolver.win.{strategy}", time.monotonic() - self._clock(attempt))
+                for loser in running.values():
+                    loser['abandoned'] = True
+                return url
+
+            now = time.monotonic()
+            for future, attempt in list(running.items()):
+                if now - self._clock(attempt) >= self.attempt_timeout:
+                    attempt['abandoned'] = True
+                    del running[future]
+                    lost += 1
+                    if attempt['started'] is None:
+                        # Never ran, every extractor was busy (prefetch, warming). Nothing the strategy did wrong.
+                        error = TimeoutError(f"no {attempt['strategy']} extractor came free within {self.attempt_timeout:g}s")
+                        continue
+                    self.breaker.failure(attempt['strategy'])
+                    self._count(attempt['strategy'], 'timeouts')
+                    error = TimeoutError(f"{attempt['strategy']} took longer than {self.attempt_timeout:g}s")
+
+            # Start the next strategy when an attempt has failed, or the hedge delay is up
+            if waiting and (lost or (hedge_at is not None and now >= hedge_at)):
+                future, attempt = self._start_attempt(video_id, waiting.pop(0), wanted)
+                running[future] = attempt
+                launched += 1
+                if hedge_at is not None:
+                    hedge_at = now + self.hedge_after
+
+        raise error
+
+    def close(self):
+        with self._pool_lock:
+            for strategy, pool in self._pools.items():
+                while True:
+                    try:
+                        pool.get_nowait().close()
+                        self._created[strategy] -= 1
+                    except queue.Empty:
+                        break
+            if self._attempts is not None:
+                self._attempts.shutdown(wait=False, cancel_futures=True)
+                self._attempts = None
+
+    def is_cached(self, video_id: str) -> bool:
+        """True if get_stream_url would answer without running yt-dlp."""
+        if self.audio_cache is not None and self.audio_cache.has(video_id):
+            return True
+        return self._lookup(video_id) is not None
+
+    def cache_stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache)}
+
+    def strategy_stats(self) -> dict:
+        """Per strategy: wins, wins after more than one strategy was tried, failures, timeouts, and whether it is demoted."""
+        with self._lock:
+            stats = {name: dict(counts) for name, counts in self._strategy_stats.items()}
+        for name, counts in stats.items():
+            counts['demoted'] = self.breaker.is_open(name)
+        return stats
+
+    @tracer.traced("resolver.get_stream_url")
+    def get_stream_url(self, video_id: str, wanted=None) -> str:
+        """Uses yt-dlp to get the direct audio stream.
+
+        wanted, if given, is asked while waiting for a busy extractor. Once it
+        returns False the resolve gives up with Superseded.
+        """
+        if self.audio_cache is not None:
+            local = self.audio_cache.path_for(video_id)
+            if local is not None:
+                with self._lock:
+                    self.hits += 1
+                return str(local)
+
+        cached = self._lookup(video_id)
+        if cached:
+            with self._lock:
+                self.hits += 1
+            return cached
+
+        with self._lock:
+            self.misses += 1
+
+        stream_url = self._resolve(video_id, wanted)
+        self._store(video_id, stream_url)
+        return stream_url
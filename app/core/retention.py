@@ -0,0 +1,59 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+class HistoryCompactor:
+    """Keeps the raw play log from growing forever.
+
+    Plays older than retention_days are folded into history_daily (one row per
+    track per day) a batch at a time, then the freed pages are handed back
+    with incremental VACUUM. Each batch is its own short write, so the writer
+    thread stays free for whatever the UI queues up in between.
+    """
+
+    BATCH_SIZE = 5000
+    VACUUM_PAGES = 1000
+
+    def __init__(self, db, retention_days: int = 365, pause: float = 0.1):
+        self.db = db
+        # 0 (or None) keeps every play forever
+        self.retention_days = retention_days
+        self.pause = pause
+        self.stats = {"compacted": 0, "pages_freed": 0}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not self.retention_days or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self) -> dict:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        # Same format SQLite's CURRENT_TIMESTAMP writes played_at in, so they compare as strings
+        cutoff = cutoff.strftime("%Y-%m-%d %H:%M:%S")
+
+        while not self._stopped.is_set():
+            moved = self.db.compact_history(cutoff, self.BATCH_SIZE)
+            if not moved:
+                break
+            self.stats["compacted"] += moved
+            self._stopped.wait(self.pause)
+        # The per-play quality log ages out with the raw plays, there is nothing in it worth rolling up
+        if not self._stopped.is_set():
+            self.stats["compacted"] += self.db.prune_play_quality(cutoff)
+
+        # Nothing was deleted, nothing to give back
+        if self.stats["compacted"]:
+            while not self._stopped.is_set():
+                free = self.db.reclaim_space(self.VACUUM_PAGES)
+                if not free:
+                    break
+                self.stats["pages_freed"] += min(free, self.VACUUM_PAGES)
+                self._stopped.wait(self.pause)
+        return self.stats
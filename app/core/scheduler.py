@@ -0,0 +1,96 @@
+import threading
+import time
+from dataclasses import dataclass
+
+from core.track import Track
+
+@dataclass
+class PlaybackRequest:
+    track: Track
+    fetch_radio: bool = False
+    is_retry: bool = False
+    generation: int = 0
+
+    @property
+    def video_id(self) -> str:
+        return self.track.id
+
+
+class PlaybackScheduler:
+    """Turns bursts of play requests into as few resolves as possible, without delaying a lone one.
+
+    Every submit() bumps a generation counter. A request arriving when nothing
+    was dispatched for debounce seconds goes out straight away (leading edge).
+    Requests arriving within debounce of the last dispatch replace each other,
+    and only the last one goes out once the window is over. A resolve whose
+    generation is no longer current when it finishes is thrown away instead of
+    reaching on_ready.
+    """
+
+    def __init__(self, resolve, on_ready, on_error=None, debounce: float = 0.15):
+        self.resolve = resolve
+        self.on_ready = on_ready
+        self.on_error = on_error
+        self.debounce = debounce
+
+        self._cond = threading.Condition()
+        self._pending = None
+        self._generation = 0
+        # Until when requests get held back and coalesced, set by every dispatch
+        self._window_end = 0.0
+
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def submit(self, request: PlaybackRequest, immediate: bool = False) -> int:
+        """Queues request. immediate=True skips the debounce, for auto-advance where nobody is skipping."""
+        with self._cond:
+            self._generation += 1
+            request.generation = self._generation
+            now = time.monotonic()
+            if immediate or now >= self._window_end:
+                self._pending = None
+                self._window_end = now + self.debounce
+                self._start(request)
+            else:
+                self._pending = request
+                self._cond.notify()
+            return request.generation
+
+    def cancel(self):
+        with self._cond:
+            self._generation += 1
+            self._pending = None
+
+    def is_current(self, generation: int) -> bool:
+        with self._cond:
+            return generation == self._generation
+
+    def _dispatch(self):
+        # Sends out whatever is still held back once the window after the last dispatch closes
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                remaining = self._window_end - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                request, self._pending = self._pending, None
+                self._window_end = time.monotonic() + self.debounce
+                self._start(request)
+
+    def _start(self, request: PlaybackRequest):
+        # yt-dlp can't be interrupted, so each resolve gets its own thread. A superseded one stops waiting
+        # for an extractor, one that already got one runs to the end and its result is dropped.
+        threading.Thread(target=self._resolve, args=(request,), daemon=True).start()
+
+    def _resolve(self, request: PlaybackRequest):
+        try:
+            url = self.resolve(request.video_id, wanted=lambda: self.is_current(request.generation))
+        except Exception as e:
+            if self.on_error and self.is_current(request.generation):
+                self.on_error(request, e)
+            return
+
+        if self.is_current(request.generation):
+            self.on_ready(request, url)
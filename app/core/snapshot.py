@@ -0,0 +1,20 @@
+import json
+from pathlib import Path
+
+# What the tables looked like when Tusic last closed, so the next start can draw them immediately
+SNAPSHOT_PATH = Path.home() / ".cache" / "tusic" / "snapshot.json"
+
+def load_snapshot() -> dict:
+    try:
+        with open(SNAPSHOT_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_snapshot(snapshot: dict):
+    SNAPSHOT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # Write-then-rename, a crash mid-write must not leave a corrupt snapshot behind
+    partial = SNAPSHOT_PATH.with_suffix(".json.part")
+    with open(partial, "w") as f:
+        json.dump(snapshot, f)
+    partial.replace(SNAPSHOT_PATH)
@@ -0,0 +1,113 @@
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+class Tracer:
+    """Timing spans for the hot paths, kept as a rolling window per span name.
+
+    Recording a span is a perf_counter pair and a deque append, cheap enough to
+    leave on all the time. The stats screen reads percentiles from here, and
+    everything still in the window can be dumped to a JSON-lines file.
+    """
+
+    # Samples kept per span, percentiles only ever describe the recent past
+    WINDOW = 500
+
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        self.enabled = True
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        # Optional file every span is appended to as it happens
+        self._log = None
+
+    def record(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        at = time.time()
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append((at, seconds))
+            self._counts[name] = self._counts.get(name, 0) + 1
+            if self._log is not None:
+                self._log.write(json.dumps({"span": name, "at": round(at, 3), "ms": round(seconds * 1000, 3)}) + "\n")
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def traced(self, name: str):
+        """Decorator version of span()."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    @staticmethod
+    def _percentile(ordered: list, pct: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+    def stats(self) -> list:
+        """One row per span: name, total count, and p50/p90/p99/max in ms over the window."""
+        with self._lock:
+            snapshot = {name: [seconds for _, seconds in samples] for name, samples in self._samples.items()}
+            counts = dict(self._counts)
+
+        rows = []
+        for name in sorted(snapshot):
+            ordered = sorted(snapshot[name])
+            rows.append({
+                "span": name,
+                "count": counts[name],
+                "p50": self._percentile(ordered, 50) * 1000,
+                "p90": self._percentile(ordered, 90) * 1000,
+                "p99": self._percentile(ordered, 99) * 1000,
+                "max": ordered[-1] * 1000,
+            })
+        return rows
+
+    def export(self, path) -> int:
+        """Writes every sample still in the window as JSON lines, oldest first. Returns how many."""
+        with self._lock:
+            lines = [
+                (at, {"span": name, "at": round(at, 3), "ms": round(seconds * 1000, 3)})
+                for name, samples in self._samples.items() for at, seconds in samples
+            ]
+        lines.sort(key=lambda line: line[0])
+        with open(path, "w") as f:
+            for _, line in lines:
+                f.write(json.dumps(line) + "\n")
+        return len(lines)
+
+    def log_to(self, path):
+        """Appends every span to path as it is recorded, until close()."""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            self._log = open(path, "a", buffering=1)
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+# Shared by every module, spans from all of them end up on the same stats screen
+tracer = Tracer()
@@ -0,0 +1,79 @@
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+
+# Placeholder names the API uses when YouTube doesn't tell us who the artist is
+UNKNOWN_ARTISTS = {"Unknown", "Unknown Artist"}
+
+# The same few artist strings come back on every page of history, split each one only once
+@lru_cache(maxsize=4096)
+def split_artists(artist: str) -> tuple:
+    if not artist:
+        return ()
+    return tuple(sys.intern(name.strip()) for name in artist.split(",") if name.strip() and name.strip() not in UNKNOWN_ARTISTS)
+
+def parse_duration(value) -> int:
+    """'3:45', '1:02:03' or a number of seconds -> seconds. 0 when unknown."""
+    if isinstance(value, int):
+        return value
+    seconds = 0
+    try:
+        for part in str(value).split(":"):
+            seconds = seconds * 60 + int(part)
+    except ValueError:
+        return 0
+    return seconds
+
+def format_duration(seconds: int) -> str:
+    if not seconds:
+        return "Unknown"
+    minutes, secs = divmod(seconds, 60)
+    if minutes >= 60:
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+@dataclass(frozen=True, slots=True)
+class Track:
+    """One song, as it travels from the API through the database into the tables.
+
+    Artist names are split once when the track is built and interned, so the
+    thousands of rows sharing an artist also share the string.
+    """
+    id: str
+    title: str
+    artists: tuple = ()
+    duration: int = 0  # seconds, 0 when unknown
+
+    @classmethod
+    def create(cls, video_id: str, title: str, artists, duration=0):
+        return cls(video_id, title, tuple(sys.intern(name) for name in artists), parse_duration(duration))
+
+    @classmethod
+    def from_row(cls, row):
+        # (video_id, title, artist, duration) as stored in history, playlist and tracks
+        return cls(row[0], row[1], split_artists(row[2]), parse_duration(row[3] or 0))
+
+    @property
+    def artist(self) -> str:
+        # What gets stored and matched on, empty when nobody is credited
+        return ", ".join(self.artists)
+
+    @property
+    def display_artist(self) -> str:
+        return self.artist or "Unknown Artist"
+
+    @property
+    def length(self) -> str:
+        return format_duration(self.duration)
+
+    def to_json(self) -> list:
+        return [self.id, self.title, list(self.artists), self.duration]
+
+    @classmethod
+    def from_json(cls, data):
+        # Snapshots and cached responses from older versions stored plain dicts
+        if isinstance(data, dict):
+            return cls.create(data['id'], data['title'], split_artists(data['artist']), data['duration'])
+        return cls.create(*data)
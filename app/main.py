@@ -1,8 +1,14 @@
+import time
+# Taken before anything heavy is imported, for --profile-startup
+STARTED_AT = time.perf_counter()
+
 import os
+import sys
 import json
 import random
-import time
-from collections import Counter
+import signal
+import sqlite3
+import argparse
 from pathlib import Path
 
 from textual.app import App, ComposeResult
@@ -10,16 +16,36 @@ from textual.containers import Grid, Vertical, Horizontal, Container
 from textual.widgets import Input, Label, DataTable, ProgressBar, OptionList, ContentSwitcher
 from textual.binding import Binding
 from textual.screen import ModalScreen
+from textual.message import Message
 from textual import work
+from textual.worker import get_current_worker
 
-from core.api import TusicAPI
+from core.api import TusicAPI, api_error
 from core.resolver import StreamResolver
 from core.database import Database
+from core.audio_cache import AudioCache
+from core.bandwidth import FormatPolicy, ThroughputMeter
+from core.http import HttpClient
+from core.remote import (
+    DaemonClient, DaemonError, RemoteAudioCache, RemoteFormatPolicy, RemotePlayer, RemoteResolver, RemoteThroughputMeter,
+)
+from core.snapshot import load_snapshot, save_snapshot
+from ui.track_table import TrackTable
+from core.scheduler import PlaybackScheduler, PlaybackRequest
+from core.preresolver import PreResolver
+from core.recommender import Recommender
+from core.retention import HistoryCompactor
+from core.playlist_io import iter_playlist
+from core.track import Track, format_duration
+from core.trace import tracer
 
 import locale
 locale.setlocale(locale.LC_ALL, 'C')
 locale.setlocale(locale.LC_NUMERIC, 'C')
-from core.player import Player
+from core.player import Player, Progress, PauseChanged, TrackStarted, TrackEnded
+
+class PlayerEventsReady(Message):
+    """Posted from mpv's thread when the player has queued an event worth handling right away."""
 
 class HelpScreen(ModalScreen):
     BINDINGS = [
@@ -36,10 +62,10 @@ class HelpScreen(ModalScreen):
             yield Label("h / l : Focus Sidebar / Songs\nH / L : View Search / View Up Next\nj / k : Move up / down", classes="help_text")
             
             yield Label(" Playback ", classes="help_header")
-            yield Label("Space : Play / Pause\nn : Next Track", classes="help_text")
+            yield Label("Space : Play / Pause\nn : Next Track\n[ / ] : Seek -10s / +10s\n{ / } : Seek -1m / +1m", classes="help_text")
             
             yield Label(" General ", classes="help_header")
-            yield Label("/ : Search\ns : Save to Playlist\nd : Delete from Playlist\nr : Refresh Recommendations", classes="help_text")
+            yield Label("/ : Search\ns : Save to Playlist\nd : Delete from Playlist\np : Pin / Unpin for Offline\nr : Refresh Recommendations\nw : Warm Streams for Queue + Playlist\nt : Latency Stats", classes="help_text")
             
             yield Label("Press Escape or ? to close", id="help_footer")
 
@@ -62,6 +88,56 @@ class HelpScreen(ModalScreen):
         self.app.pop_screen()
 
 
+class StatsScreen(ModalScreen):
+    BINDINGS = [
+        Binding("escape", "dismiss", "Close Stats"),
+        Binding("q", "dismiss", "Close Stats"),
+        Binding("t", "dismiss", "Close Stats"),
+        Binding("e", "export", "Export"),
+    ]
+
+    def compose(self) -> ComposeResult:
+        with Vertical(id="stats_dialog"):
+            yield Label("Latency (ms, last 500 calls per span)", id="stats_title")
+            yield DataTable(id="stats_table", cursor_type="none", zebra_stripes=True)
+            yield Label("", id="stats_quality")
+            yield Label("e : Export to JSON lines   Esc / t : Close", id="stats_footer")
+
+    def on_mount(self) -> None:
+        primary_color = self.app.pywal_colors.get("color6", "#B5EAD7")
+        self.query_one("#stats_dialog").styles.border = ("solid", primary_color)
+        table = self.query_one("#stats_table")
+        table.add_columns("Span", "Count", "p50", "p90", "p99", "Max")
+        self.refresh_stats()
+        self.set_interval(1.0, self.refresh_stats)
+
+    def refresh_stats(self) -> None:
+        table = self.query_one("#stats_table")
+        table.clear()
+        for row in tracer.stats():
+            table.add_row(
+                row["span"], str(row["count"]),
+                *(f"{row[key]:.1f}" for key in ("p50", "p90", "p99", "max"))
+            )
+
+        quality = self.app.db.get_quality_summary()
+        estimate = self.app.throughput.estimate()
+        link = f"{estimate:.0f} kbps" if estimate is not None else "not measured yet"
+        self.query_one("#stats_quality").update(
+            f"Audio: {self.app.format_policy.tier()} (link {link})   Last 30 days: {quality['used_mb']:.0f} MB streamed, "
+            f"{quality['saved_mb']:.0f} MB saved, {quality['stalls_per_hour']:.1f} stalls/hour"
+        )
+
+    def action_export(self) -> None:
+        path = Path.home() / ".cache" / "tusic" / f"trace-{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        count = tracer.export(path)
+        self.app.notify(f"Exported {count} spans to {path}")
+
+    def action_dismiss(self) -> None:
+        self.app.pop_screen()
+
+
 class TusicApp(App):
     ENABLE_COMMAND_PALETTE = False
     CSS_PATH = "ui/styles.css"
@@ -80,27 +156,149 @@ class TusicApp(App):
         Binding("n", "play_next", "Next Track", show=False),
         Binding("s", "save_song", "Save Song", show=False),
         Binding("d", "remove_song", "Remove Song", show=False), 
+        Binding("p", "pin_song", "Pin Song", show=False),
+        Binding("w", "warm_streams", "Warm Streams", show=False),
+        Binding("left_square_bracket", "seek(-10)", "Back 10s", show=False),
+        Binding("right_square_bracket", "seek(10)", "Forward 10s", show=False),
+        Binding("left_curly_bracket", "seek(-60)", "Back 1m", show=False),
+        Binding("right_curly_bracket", "seek(60)", "Forward 1m", show=False),
         Binding("?", "show_help", "Help", show=False),
+        Binding("t", "show_stats", "Stats", show=False),
         Binding("q", "quit", "Quit"),
     ]
 
-    def __init__(self):
+    # Most tracks handed to the daemon on quit, it tops the queue up with radio once they run out
+    HAND_OFF_TRACKS = 50
+
+    def __init__(self, profile_startup: bool = False):
         super().__init__()
+        self.profile_startup = profile_startup
+        self.startup_marks = {}
+        # "interactive" reached before the first paint, it gets recorded along with it
+        self.interactive_early = False
         self.user_config = self.load_config()
         self.pywal_colors = self.load_pywal()
-        self.api = TusicAPI()
-        self.resolver = StreamResolver()
+
+        # Spans can also be streamed to a JSON-lines file as they happen
+        tracer.enabled = self.user_config.get("tracing", True)
+        if self.user_config.get("trace_log"):
+            tracer.log_to(Path(self.user_config["trace_log"]).expanduser())
+
         self.db = Database()
-        
-        self.player = Player()
-        self.player.on_track_end = self.trigger_next_song
+        self.recommender = Recommender(self.db)
+        # A running daemon (main.py --daemon) owns mpv, the resolver, the audio cache and the housekeeping,
+        # the TUI then just drives them
+        self.remote = DaemonClient.connect() if self.user_config.get("use_daemon", True) else None
+        # Plays older than this many days get rolled up into daily counts, 0 keeps them all
+        self.compactor = HistoryCompactor(self.db, self.user_config.get("history_retention_days", 365)) if self.remote is None else None
+        # One keep-alive pool (plus proxy and timeouts) for ytmusicapi, yt-dlp and the audio cache
+        self.http = HttpClient.from_config(self.user_config)
+        self.api = TusicAPI(
+            self.db,
+            cache_size=self.user_config.get("response_cache_size", 256),
+            ttls=self.user_config.get("response_cache_ttls"),
+            http=self.http,
+        )
+        if self.remote is not None:
+            # One audio cache directory has one owner, and only the daemon sees how fast audio arrives
+            self.audio_cache = RemoteAudioCache(self.remote) if self.remote.request("audio.enabled") else None
+            self.throughput = RemoteThroughputMeter(self.remote)
+            self.format_policy = RemoteFormatPolicy(self.remote)
+        else:
+            # audio_cache_mb = 0 turns the on-disk audio cache off entirely
+            audio_cache_mb = self.user_config.get("audio_cache_mb", 2048)
+            self.audio_cache = AudioCache(self.db, max_bytes=audio_cache_mb * 1024 * 1024, http=self.http) if audio_cache_mb > 0 else None
+            # How fast audio really arrives decides the bitrate asked for. audio_quality is auto, high, medium, low or lowest.
+            self.throughput = ThroughputMeter()
+            self.format_policy = FormatPolicy(
+                self.throughput,
+                quality=self.user_config.get("audio_quality", "auto"),
+                max_kbps=self.user_config.get("max_audio_kbps"),
+            )
+            if self.audio_cache is not None:
+                self.audio_cache.on_throughput = self.throughput.add
+        # Tracks get downloaded once they have been played this many times
+        self.audio_cache_min_plays = self.user_config.get("audio_cache_min_plays", 2)
+
+        if self.remote is not None:
+            self.resolver = RemoteResolver(self.remote)
+            self.player = RemotePlayer(self.remote)
+            self.player.on_disconnect = lambda: self.call_from_thread(
+                self.notify, "Lost the tusic daemon, playback has stopped.", severity="error"
+            )
+        else:
+            self.resolver = StreamResolver(
+                self.db,
+                pool_size=self.user_config.get("resolver_pool_size", 2),
+                disk_cache=self.user_config.get("ytdlp_disk_cache", True),
+                audio_cache=self.audio_cache,
+                http=self.http,
+                strategies=self.user_config.get("resolver_strategies"),
+                hedge_after=self.user_config.get("resolver_hedge_after", 2.5),
+                attempt_timeout=self.user_config.get("resolver_attempt_timeout", 20.0),
+                format_policy=self.format_policy,
+            )
+            # cache_profile is balanced, low-memory, long-mix or mpv (mpv's own defaults), mpv_cache overrides single options
+            self.player = Player(
+                cache_profile=self.user_config.get("cache_profile", "balanced"),
+                cache_options=self.user_config.get("mpv_cache"),
+            )
+        # Tracks at least this long (seconds) remember where they were left off
+        self.resume_min_duration = self.user_config.get("resume_min_duration", 600)
+        self.resume_saved_at = None
+        self.resume_cleared = False
+        # post_message is thread-safe and doesn't block mpv's event thread
+        self.player.on_event = lambda: self.post_message(PlayerEventsReady())
+        self.player.on_input_rate = self.throughput.add
+        # Format, position reached and stalls of whatever is playing, logged once it is done
+        self.play_record = None
+        self.progress_interval = 1.0 / self.user_config.get("progress_refresh_hz", 4)
+        self.last_progress = None
+        self.current_video_id = None
+        self.current_request = None
+        self.stream_retried = False
+
+        # The library is only searched once typing pauses this long
+        self.typing_debounce = self.user_config.get("typing_debounce", 0.15)
+
+        # Rapid skips collapse into a single resolve for whatever was requested last
+        self.scheduler = PlaybackScheduler(
+            self.resolver.get_stream_url,
+            on_ready=lambda request, url: self.call_from_thread(self._start_stream, request, url),
+            on_error=lambda request, error: self.call_from_thread(self._on_stream_error, request, error),
+            debounce=self.user_config.get("skip_debounce", 0.15),
+        )
+
+        # Warms stream URLs for the rest of the queue and My Playlist ahead of time (w)
+        self.preresolver = PreResolver(
+            self.resolver,
+            workers=self.user_config.get("preresolve_workers", 3),
+            rate=self.user_config.get("preresolve_rate", 0.5),
+            on_progress=lambda stats: self.call_from_thread(self._on_preresolve_progress, stats),
+        )
+
+        # Seconds before the end of a track at which the next row gets resolved and queued in mpv
+        self.prefetch_seconds = self.user_config.get("prefetch_seconds", 20)
+        self.prefetch = None
+
+        # What the search table / up next table currently show, so background cache refreshes don't clobber other views
+        self.search_query = None
+        self.radio_seed = None
+
+        # Kept around so it can be written to the snapshot on exit
+        self.made_for_you = []
+
+        # Up Next is an endless queue: when fewer than queue_lookahead rows are left after the
+        # cursor, more radio tracks are fetched from the tail and appended
+        self.queue_lookahead = self.user_config.get("queue_lookahead", 5)
+        self.queued_ids = set()
+        # Played on the current station, so the radio doesn't bring them round again. Reset with the station.
+        self.played_ids = set()
+        self.used_seeds = set()
+        self.play_when_extended = False
 
     def load_config(self) -> dict:
-        config_path = Path.home() / ".config" / "tusic" / "config.json"
-        if config_path.exists():
-            with open(config_path, "r") as f:
-                return json.load(f)
-        return {}
+        return load_config()
 
     def load_pywal(self) -> dict:
         wal_path = Path.home() / ".cache" / "wal" / "colors.json"
@@ -120,8 +318,8 @@ class TusicApp(App):
 
             with Container(id="main_content"):
                 with ContentSwitcher(initial="search_table", id="table_switcher"):
-                    yield DataTable(id="search_table", cursor_type="row")
-                    yield DataTable(id="up_next_table", cursor_type="row")
+                    yield TrackTable(id="search_table", cursor_type="row", album_column=True)
+                    yield TrackTable(id="up_next_table", cursor_type="row")
 
             with Vertical(id="player_bar"):
                 yield Label("Nothing playing", id="track_info")
@@ -144,35 +342,153 @@ class TusicApp(App):
         up_next_table = self.query_one("#up_next_table")
         up_next_table.add_columns("Title", "Artist", "Length")
 
-        self.set_interval(1.0, self.update_progress)
+        self.set_interval(self.progress_interval, self.update_progress)
+
+        # Paint whatever was on screen last time, the network refresh replaces it when it lands
+        self.restore_snapshot()
+        self.call_after_refresh(self.mark_startup, "first_paint")
 
+        if self.remote is not None:
+            self.attach_daemon()
         self.load_made_for_you()
         self.query_one("#search_table").focus()
+        self.restore_pinned_audio()
+        # Well clear of startup, compaction is housekeeping nobody is waiting for
+        if self.compactor is not None:
+            self.set_timer(30, self.compactor.start)
+
+    def restore_snapshot(self) -> None:
+        snapshot = load_snapshot()
+        tracks = {name: [Track.from_json(item) for item in snapshot.get(name, [])] for name in ("search", "up_next", "made_for_you")}
+        self.made_for_you = tracks["made_for_you"]
+
+        search_rows = tracks["search"] or self.made_for_you
+        if search_rows:
+            self.update_search_table(search_rows, reset_title=False)
+            self.query_one("#main_content").border_title = snapshot.get("search_title", "Made For You")
+
+        if tracks["up_next"]:
+            self.populate_up_next(tracks["up_next"], show=False)
+
+    def attach_daemon(self) -> None:
+        # Whatever the daemon was playing carries on, the TUI takes over picking what comes next
+        try:
+            status = self.remote.request("status")
+            self.remote.request("queue.clear")
+        except (OSError, DaemonError):
+            return
+        if not status.get("track"):
+            return
+
+        song = Track.from_json(status["track"])
+        self.current_track = f"{song.title} - {song.display_artist}"
+        self.current_video_id = song.id
+        self.current_request = PlaybackRequest(song)
+        self.played_ids.add(song.id)
+        self.set_now_playing(self.current_track)
+        if status["state"] == "paused":
+            self.query_one("#track_info").update(f"⏸️ Paused: {self.current_track}")
+
+    def hand_off_queue(self) -> None:
+        # The daemon plays on after the TUI is gone, so it gets whatever would have played next.
+        # mpv must not hold a prefetched entry on top of that, it would play twice.
+        self.invalidate_prefetch()
+        upcoming = []
+        active_table_id = self.query_one("#table_switcher").current
+        if active_table_id:
+            table = self.query_one(f"#{active_table_id}")
+            if table.row_count:
+                upcoming = table.tracks[table.cursor_coordinate.row + 1:][:self.HAND_OFF_TRACKS]
+        try:
+            self.remote.request("enqueue", tracks=[song.to_json() for song in upcoming])
+        except (OSError, DaemonError):
+            pass
+        self.player.close()
+
+    def mark_startup(self, name: str) -> None:
+        if name in self.startup_marks:
+            return
+        # Nothing is usable before it is on screen, a cached mix can finish loading first
+        if name == "interactive" and "first_paint" not in self.startup_marks:
+            self.interactive_early = True
+            return
+        self.startup_marks[name] = time.perf_counter() - STARTED_AT
+        if name == "first_paint" and self.interactive_early:
+            self.startup_marks["interactive"] = self.startup_marks[name]
+        if self.profile_startup and "first_paint" in self.startup_marks and "interactive" in self.startup_marks:
+            self.exit()
+
+    def exit(self, *args, **kwargs) -> None:
+        self.preresolver.cancel()
+        if self.profile_startup:
+            # A profiling run only looks, the saved session and the daemon's queue are left as they were
+            if self.remote is not None:
+                self.player.close()
+            super().exit(*args, **kwargs)
+            return
+        self.finish_play_record()
+        if self.last_progress is not None:
+            self.save_resume_position(self.last_progress, force=True)
+        if self.remote is not None:
+            try:
+                self.hand_off_queue()
+            except Exception:
+                pass
+        # Saved here rather than on unmount, the widgets are already gone by then
+        try:
+            search_title = "Search Results"
+            if self.query_one("#table_switcher").current == "search_table":
+                search_title = self.query_one("#main_content").border_title
+            save_snapshot({
+                "search_title": search_title,
+                "search": [song.to_json() for song in self.query_one("#search_table").tracks],
+                "up_next": [song.to_json() for song in self.query_one("#up_next_table").tracks],
+                "made_for_you": [song.to_json() for song in self.made_for_you],
+            })
+        except Exception:
+            pass
+        super().exit(*args, **kwargs)
+
+    def on_unmount(self) -> None:
+        # Let the writer thread commit whatever is still queued
+        if self.compactor is not None:
+            self.compactor.stop()
+        self.db.close()
+        self.http.close()
+        tracer.close()
 
     def action_show_help(self) -> None:
         self.push_screen(HelpScreen())
 
+    def action_show_stats(self) -> None:
+        self.push_screen(StatsScreen())
+
+    @work(exclusive=True, thread=True, group="made_for_you")
     def load_made_for_you(self) -> None:
-        history = self.db.get_history()
+        # The local mix shows up as soon as it is scored, the network search below only tops it up
+        local = self.recommender.mix(self.user_config.get("local_mix_size", 25))
+        top_artists = self.db.get_top_artists(3)
         
-        if not history:
+        if not top_artists and not self.db.has_history():
             query = "synthwave mix"
-            self.notify("Welcome! Fetching some starter recommendations...")
+            message = "Welcome! Fetching some starter recommendations..."
         else:
-            artists = []
-            for song in history:
-                if song['artist'] != "Unknown":
-                    artists.extend([a.strip() for a in song['artist'].split(',') if a.strip()])
-            
-            if artists:
-                top_artists = [artist for artist, count in Counter(artists).most_common(3)]
+            if top_artists:
                 query = f"{random.choice(top_artists)} radio"
-                self.notify("Fetching recommendations based on your taste...")
+                message = "Fetching recommendations based on your taste..."
             else:
                 query = "synthwave mix"
-                self.notify("Fetching top picks for you...")
-                
-        self.fetch_results(query)
+                message = "Fetching top picks for you..."
+
+        self.call_from_thread(self._show_made_for_you, query, local, message)
+
+    def _show_made_for_you(self, query: str, local: list, message: str) -> None:
+        self.notify(message)
+        if local:
+            self.made_for_you = local
+            self.search_query = query
+            self.update_search_table(local, reset_title=False)
+        self.fetch_results(query, local, made_for_you=True)
 
     def action_focus_sidebar(self) -> None:
         self.query_one("#library_menu").focus()
@@ -230,15 +546,61 @@ class TusicApp(App):
         status = "⏸️ Paused" if is_paused else "▶️ Playing"
         self.query_one("#track_info").update(f"{status}: {self.current_track}")
 
-    def trigger_next_song(self) -> None:
-        self.call_from_thread(self._do_play_next, True)
+    def action_seek(self, offset: float) -> None:
+        position = self.player.seek(offset)
+        if position is not None and self.last_progress is not None:
+            self.last_progress = Progress(position, self.last_progress.duration)
+            self.render_progress(self.last_progress)
+
+    def resume_position(self, video_id: str):
+        return self.db.get_resume_position(video_id)
+
+    def save_resume_position(self, progress: Progress, force: bool = False) -> None:
+        video_id = self.current_video_id
+        if video_id is None or progress.duration < self.resume_min_duration:
+            return
+        # Finishing (or nearly) means starting over next time
+        if progress.duration - progress.position < 30:
+            if not self.resume_cleared:
+                self.db.clear_resume_position(video_id)
+                self.resume_cleared = True
+            return
+        # Every 10 seconds of playback is plenty
+        if force or self.resume_saved_at is None or abs(progress.position - self.resume_saved_at) >= 10:
+            self.db.set_resume_position(video_id, progress.position, progress.duration)
+            self.resume_saved_at = progress.position
+            self.resume_cleared = False
+
+    def _retry_stream(self) -> None:
+        # mpv couldn't open the URL, most likely a cached link YouTube already revoked
+        request = self.current_request
+        if request is None:
+            return
+
+        self.resolver.invalidate(request.video_id)
+        if self.stream_retried:
+            self.notify("Stream failed to open.", severity="error")
+            return
+
+        self.stream_retried = True
+        retry = PlaybackRequest(request.track, is_retry=True)
+        self.play_track(retry, manual_interrupt=True)
 
     def action_play_next(self) -> None:
-        # Immediately disarm auto-play on the UI thread to prevent double-skips
-        self.player.auto_play_enabled = False
         self._do_play_next(False)
 
+    def _next_row(self, table: TrackTable):
+        next_row = table.cursor_coordinate.row + 1
+        if not table.ensure_row(next_row):
+            # Up Next never wraps around, it grows instead
+            if table.id == "up_next_table":
+                return None
+            next_row = 0
+        return next_row
+
     def _do_play_next(self, is_auto_play: bool) -> None:
+        self.invalidate_prefetch()
+
         active_table_id = self.query_one("#table_switcher").current
         if not active_table_id:
             return
@@ -247,22 +609,97 @@ class TusicApp(App):
         if not table.row_count:
             return
 
-        next_row = table.cursor_coordinate.row + 1
-        if next_row >= table.row_count:
-            next_row = 0
+        next_row = self._next_row(table)
+        if next_row is None:
+            # Ran off the end of the queue, play on as soon as more tracks arrive
+            self.play_when_extended = True
+            self.check_queue_lookahead()
+            return
 
         table.move_cursor(row=next_row)
-        row_key = table.coordinate_to_cell_key(table.cursor_coordinate).row_key
-        video_id = row_key.value.split("||")[0]
-        row_data = table.get_row(row_key)
-        
-        song_title = f"{row_data[0]} - {row_data[1]}"
+        song = table.track_at(next_row)
+
+        request = PlaybackRequest(song)
+        self.play_track(request, manual_interrupt=not is_auto_play)
+
+    def start_prefetch(self) -> None:
+        active_table_id = self.query_one("#table_switcher").current
+        if not active_table_id:
+            return
+
+        table = self.query_one(f"#{active_table_id}")
+        if not table.row_count:
+            return
+
+        from_row = table.cursor_coordinate.row
+        next_row = self._next_row(table)
+        if next_row is None:
+            return
+        song = table.track_at(next_row)
+
+        self.prefetch = {
+            "table_id": active_table_id,
+            "from_row": from_row,
+            "row": next_row,
+            "video_id": song.id,
+            "track": song,
+            "queue_pos": None,
+        }
+        self.prefetch_track(self.prefetch)
+
+    @work(exclusive=True, thread=True, group="prefetch")
+    def prefetch_track(self, prefetch: dict) -> None:
+        try:
+            stream_url = self.resolver.get_stream_url(prefetch["video_id"])
+        except Exception:
+            return
+        if stream_url:
+            self.call_from_thread(self._queue_prefetched, prefetch, stream_url)
+
+    def _queue_prefetched(self, prefetch: dict, stream_url: str) -> None:
+        # The cursor moved or the table was rebuilt while we were resolving
+        if self.prefetch is not prefetch:
+            return
+        prefetch["queue_pos"] = self.player.playlist_pos
+        prefetch["url"] = stream_url
+        self.player.append(stream_url, start=self.resume_position(prefetch["video_id"]), track=prefetch["track"])
+
+    def invalidate_prefetch(self) -> None:
+        if self.prefetch is None:
+            return
+        if self.prefetch["queue_pos"] is not None:
+            self.player.clear_queue()
+        self.prefetch = None
+
+    def _commit_prefetch(self) -> None:
+        # mpv already rolled over into the queued track, just catch the UI up
+        prefetch = self.prefetch
+        self.prefetch = None
+
+        table = self.query_one(f"#{prefetch['table_id']}")
+        if prefetch["row"] < table.row_count:
+            table.move_cursor(row=prefetch["row"])
+
+        song = prefetch["track"]
+        song_title = f"{song.title} - {song.display_artist}"
         self.current_track = song_title
-        
-        self.db.add_to_history(video_id, row_data[0], row_data[1], row_data[-1])
-        self.query_one("#track_info").update(f"⏳ Loading: {song_title}")
-        
-        self.play_track(video_id, song_title, manual_interrupt=not is_auto_play, fetch_radio=False)
+        self.current_video_id = song.id
+        self.current_request = PlaybackRequest(song)
+        self.stream_retried = False
+
+        # History writes are queued, so count the plays before adding this one
+        plays = self.db.play_count(song.id) + 1
+        self.db.add_to_history(song)
+        self.set_now_playing(song_title)
+        self.track_started(prefetch["video_id"], prefetch["url"])
+        self.maybe_cache_audio(prefetch["video_id"], prefetch["url"], plays)
+
+    def on_data_table_row_highlighted(self, event: DataTable.RowHighlighted) -> None:
+        if self.prefetch is None:
+            return
+        # Cursor moves elsewhere (say search results rendering while typing) don't change what plays next
+        if event.data_table.id == self.prefetch["table_id"] and event.cursor_row != self.prefetch["from_row"]:
+            self.invalidate_prefetch()
 
     def action_save_song(self) -> None:
         active_table_id = self.query_one("#table_switcher").current
@@ -273,15 +710,13 @@ class TusicApp(App):
         if not table.has_focus:
             return
             
-        try:
-            row_key = table.coordinate_to_cell_key(table.cursor_coordinate).row_key
-            row_data = table.get_row(row_key)
-            video_id = row_key.value.split("||")[0]
-            
-            self.db.add_to_playlist(video_id, row_data[0], row_data[1], row_data[-1])
-            self.notify(f"Saved: {row_data[0]}")
-        except Exception:
-            pass
+        song = table.cursor_track()
+        if song is None:
+            return
+
+        self.db.add_to_playlist(song)
+        self.notify(f"Saved: {song.title}")
+
     def action_remove_song(self) -> None:
         active_table_id = self.query_one("#table_switcher").current
         table = self.query_one(f"#{active_table_id}")
@@ -290,26 +725,50 @@ class TusicApp(App):
             return
             
         try:
-            coord = table.cursor_coordinate
-            row_key = table.coordinate_to_cell_key(coord).row_key
-            row_data = table.get_row(row_key)
-            video_id = str(row_key.value).split("||")[0]
+            row_key = table.coordinate_to_cell_key(table.cursor_coordinate).row_key
+            song = table.track_for(row_key)
             
             # Use the consolidated removal logic
-            res1 = self.db.remove_song_completely(video_id)
-            res2 = self.db.remove_by_title(row_data[0], row_data[1])
+            res1 = self.db.remove_song_completely(song.id)
+            res2 = self.db.remove_by_title(song.title, song.artist)
             
             if res1 or res2:
-                self.notify(f"Permanently Removed: {row_data[0]}")
-                table.remove_row(row_key)
+                if self.audio_cache is not None:
+                    self.audio_cache.remove(song.id)
+                self.notify(f"Permanently Removed: {song.title}")
+                table.remove_track(row_key)
             else:
                 self.notify("Could not find record in DB", severity="error")
                 
         except Exception as e:
             self.notify(f"Error: {e}", severity="error")
-                
-        except Exception as e:
-            self.notify(f"Error: {e}", severity="error")
+
+    def on_input_changed(self, event: Input.Changed) -> None:
+        # Instant results from the local library while typing, no network involved
+        text = event.value.strip()
+        if len(text) < 2:
+            return
+        self.search_library(text)
+
+    @work(exclusive=True, thread=True, group="library_search")
+    def search_library(self, text: str) -> None:
+        # Every keystroke replaces this worker, so only the text typing paused on gets queried
+        time.sleep(self.typing_debounce)
+        if get_current_worker().is_cancelled:
+            return
+        local = self.db.search_local(text)
+        if local:
+            self.call_from_thread(self._show_library_hits, text, local)
+
+    def _show_library_hits(self, text: str, local: list) -> None:
+        # The search bar moved on (more typing, or submitted and cleared) while the query ran
+        if self.query_one("#search_input").value.strip() != text:
+            return
+        self.search_query = None
+        # Typing shouldn't pull the view away from Up Next, the hits are there once search view is opened
+        self.update_search_table(local, reset_title=False, focus=False, show=False)
+        if self.query_one("#table_switcher").current == "search_table":
+            self.query_one("#main_content").border_title = f"Library: {text}"
 
     def on_input_submitted(self, event: Input.Submitted) -> None:
         query = event.value
@@ -321,97 +780,322 @@ class TusicApp(App):
         self.notify(f"Searching for: {query}...")
         event.input.value = ""
         self.action_blur_search() 
-        self.fetch_results(query)
+
+        local = self.db.search_local(query)
+        if local:
+            self.update_search_table(local, reset_title=False)
+        self.fetch_results(query, local)
 
     @work(exclusive=True, thread=True)
-    def fetch_results(self, query: str) -> None:
-        results = self.api.search_songs(query)
-        self.call_from_thread(self.update_search_table, results)
+    def fetch_results(self, query: str, local: list = None, made_for_you: bool = False) -> None:
+        self.search_query = query
+        results = self.api.search_songs(
+            query, on_update=lambda fresh: self.call_from_thread(self._on_search_refreshed, query, self.merge_results(local, fresh))
+        )
+        if made_for_you:
+            if not results and self.made_for_you:
+                # Offline or YouTube hiccup, keep showing the local mix or last session's one
+                self.call_from_thread(self.mark_startup, "interactive")
+                return
+            self.made_for_you = self.merge_results(local, results)
+        self.call_from_thread(self._on_search_refreshed, query, self.merge_results(local, results), True)
+        self.call_from_thread(self.mark_startup, "interactive")
 
-    def update_search_table(self, results: list, reset_title: bool = True) -> None:
-        # Only switch to search view if we aren't already there
-        self.query_one("#table_switcher").current = "search_table"
+    @staticmethod
+    def merge_results(local: list, remote: list) -> list:
+        # Library hits stay on top, remote results fill in below without repeating them
+        if not local:
+            return remote
+        seen = {song.id for song in local}
+        return local + [song for song in remote if song.id not in seen]
+
+    def _on_search_refreshed(self, query: str, results: list, reset_title: bool = False) -> None:
+        # The user moved on to another view or search while this was loading
+        if self.search_query == query:
+            self.update_search_table(results, reset_title=reset_title)
+
+    def update_search_table(self, results: list, reset_title: bool = True, focus: bool = True, show: bool = True) -> None:
+        table = self.query_one("#search_table")
+        # The next song queued in mpv only goes if it came from these rows and they changed,
+        # a refresh that returns the same tracks keeps it
+        from_here = self.prefetch is not None and self.prefetch["table_id"] == "search_table"
+        if from_here and [song.id for song in table.tracks[:len(results) + 1]] != [song.id for song in results]:
+            self.invalidate_prefetch()
+        if show:
+            self.query_one("#table_switcher").current = "search_table"
         
         if reset_title:
             self.query_one("#main_content").border_title = "Search Results"
             
-        table = self.query_one("#search_table")
-        table.clear()
-        for idx, song in enumerate(results):
-            unique_key = f"{song['id']}||{idx}"
-            table.add_row(song['title'], song['artist'], "Unknown", song['duration'], key=unique_key)
-        self.action_focus_table()
+        # Rows that didn't change (e.g. a background refresh of the same search) are left alone
+        table.set_tracks(results)
+        if focus:
+            self.action_focus_table()
 
     def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
-        self.player.auto_play_enabled = False
-        video_id = event.row_key.value.split("||")[0]
-        row_data = event.control.get_row(event.row_key)
-        song_title = f"{row_data[0]} - {row_data[1]}"
-        self.current_track = song_title
-        
-        self.db.add_to_history(video_id, row_data[0], row_data[1], row_data[-1])
-        self.query_one("#track_info").update(f"⏳ Loading: {song_title}")
+        self.invalidate_prefetch()
+        song = event.control.track_for(event.row_key)
 
         should_fetch_radio = (event.control.id == "search_table")
-        self.play_track(video_id, song_title, manual_interrupt=True, fetch_radio=should_fetch_radio)
+        request = PlaybackRequest(song, fetch_radio=should_fetch_radio)
+        self.play_track(request, manual_interrupt=True)
 
-    @work(exclusive=True, thread=True)
-    def play_track(self, video_id: str, song_title: str, manual_interrupt: bool = True, fetch_radio: bool = False) -> None:
-        self.player.auto_play_enabled = False
-        
-        try:
-            if manual_interrupt:
-                self.player.stop()
-                
-            stream_url = self.resolver.get_stream_url(video_id)
-            
-            if stream_url:
-                self.player.play(stream_url)
-                self.call_from_thread(self.set_now_playing, song_title)
-                
-                if fetch_radio:
-                    self.call_from_thread(self.fetch_radio, video_id)
-            else:
-                self.call_from_thread(self.notify, "Failed to resolve stream.", severity="error")
-        finally:
-            time.sleep(1.0)
-            self.player.auto_play_enabled = True
+    def play_track(self, request: PlaybackRequest, manual_interrupt: bool = True) -> None:
+        if manual_interrupt:
+            self.player.stop()
+
+        self.query_one("#track_info").update(f"⏳ Loading: {request.track.title} - {request.track.display_artist}")
+        # Only manual skips come in bursts worth debouncing, a track ending is a single event
+        self.scheduler.submit(request, immediate=not manual_interrupt)
+
+    def _start_stream(self, request: PlaybackRequest, stream_url: str) -> None:
+        # Another request may have been submitted while this one hopped back to the UI thread
+        if not self.scheduler.is_current(request.generation):
+            return
+
+        if not stream_url:
+            self.notify("Failed to resolve stream.", severity="error")
+            return
+
+        start = self.resume_position(request.video_id)
+        self.player.play(stream_url, start=start, track=request.track)
+        if start:
+            self.notify(f"Resuming at {format_duration(int(start))}")
+
+        song_title = f"{request.track.title} - {request.track.display_artist}"
+        self.current_track = song_title
+        self.current_video_id = request.video_id
+        self.current_request = request
+
+        # Only the track that actually starts playing goes into history, not every row skipped past
+        plays = self.db.play_count(request.video_id)
+        if not request.is_retry:
+            self.stream_retried = False
+            plays += 1
+            self.db.add_to_history(request.track)
+
+        self.set_now_playing(song_title)
+        self.track_started(request.video_id, stream_url)
+        self.maybe_cache_audio(request.video_id, stream_url, plays)
+        if request.fetch_radio:
+            self.fetch_radio(request.video_id)
+
+    def maybe_cache_audio(self, video_id: str, stream_url: str, plays: int) -> None:
+        # Local files come back as plain paths, those are already cached
+        if self.audio_cache is None or not stream_url.startswith("http"):
+            return
+        if self.audio_cache.is_pinned(video_id) or plays >= self.audio_cache_min_plays:
+            self.audio_cache.store_in_background(video_id, stream_url)
+
+    def action_warm_streams(self) -> None:
+        if self.preresolver.running:
+            self.preresolver.cancel()
+            return
+
+        # Whatever plays next goes first, then the rest of My Playlist
+        up_next = self.query_one("#up_next_table")
+        video_ids = [song.id for song in up_next.tracks[up_next.cursor_coordinate.row + 1:]] if up_next.row_count else []
+        video_ids += [song.id for song in iter_playlist(self.db)]
+        if not video_ids:
+            self.notify("Nothing to warm, Up Next and My Playlist are empty.", severity="warning")
+            return
+
+        self.preresolver.start(video_ids)
+        self.notify("Resolving streams in the background. Press w again to stop.")
+
+    def _on_preresolve_progress(self, stats: dict) -> None:
+        player_bar = self.query_one("#player_bar")
+        if not stats["finished"]:
+            player_bar.border_subtitle = f"Warming {stats['done'] + stats['failed']}/{stats['total']}"
+            return
+
+        # A run that was replaced by a newer one has nothing left to say
+        if self.preresolver.running:
+            return
+        player_bar.border_subtitle = ""
+        if stats["cancelled"]:
+            self.notify(f"Stopped warming after {stats['done']} of {stats['total']} streams.")
+        else:
+            failed = f", {stats['failed']} failed" if stats["failed"] else ""
+            self.notify(f"Warmed {stats['done']} streams{failed}.")
+
+    def action_pin_song(self) -> None:
+        if self.audio_cache is None:
+            self.notify("Audio cache is disabled (audio_cache_mb = 0)", severity="warning")
+            return
+
+        active_table_id = self.query_one("#table_switcher").current
+        table = self.query_one(f"#{active_table_id}")
+        if not table.has_focus or not table.row_count:
+            return
+
+        song = table.cursor_track()
+        video_id = song.id
+
+        if not self.db.in_playlist(video_id):
+            self.notify("Only songs in My Playlist can be pinned. Press s to save it first.", severity="warning")
+            return
+
+        if self.audio_cache.is_pinned(video_id):
+            self.audio_cache.pin(video_id, False)
+            self.notify(f"Unpinned: {song.title}")
+        else:
+            self.audio_cache.pin(video_id)
+            self.notify(f"Pinned for offline: {song.title}")
+            self.download_pinned([video_id])
+
+    def restore_pinned_audio(self) -> None:
+        # Pinned files can vanish (cache dir wiped, failed download), fetch them again. An attached daemon does this itself.
+        if self.audio_cache is not None and self.remote is None:
+            missing = self.db.get_pinned_missing_audio()
+            if missing:
+                self.download_pinned(missing)
+
+    @work(thread=True, group="pinned")
+    def download_pinned(self, video_ids: list) -> None:
+        for video_id in video_ids:
+            try:
+                stream_url = self.resolver.get_stream_url(video_id)
+            except Exception:
+                continue
+            if stream_url.startswith("http"):
+                self.audio_cache.store_in_background(video_id, stream_url)
+
+    def _on_stream_error(self, request: PlaybackRequest, error: Exception) -> None:
+        self.notify(f"Failed to resolve stream: {error}", severity="error")
+
+    def track_started(self, video_id: str, stream_url: str) -> None:
+        self.played_ids.add(video_id)
+        self.resume_saved_at = None
+        self.resume_cleared = False
+        self.finish_play_record()
+        self.play_record = {
+            "video_id": video_id,
+            "format": self.resolver.stream_format(stream_url),
+            "throughput": self.throughput.estimate(),
+            "stalls": self.player.stall_count,
+            "position": 0.0,
+        }
+        self.check_queue_lookahead()
+
+    def finish_play_record(self) -> None:
+        record, self.play_record = self.play_record, None
+        if record is None or record["position"] <= 0:
+            return
+        self.db.add_play_quality(
+            record["video_id"], record["format"], record["throughput"],
+            record["position"], self.player.stall_count - record["stalls"],
+        )
+
+    def check_queue_lookahead(self) -> None:
+        table = self.query_one("#up_next_table")
+        if not table.row_count:
+            return
+
+        remaining = len(table.tracks) - 1 - table.cursor_coordinate.row
+        if remaining >= self.queue_lookahead:
+            return
+
+        # Seed from the tail, walking backwards in case a seed only yields duplicates.
+        # A seed is only ever used once, its mix would just repeat.
+        seeds = []
+        for song in reversed(table.tracks):
+            if song.id not in self.used_seeds:
+                seeds.append(song.id)
+                if len(seeds) == 3:
+                    break
+        if not seeds:
+            return
+        self.used_seeds.update(seeds)
+        self.extend_radio(seeds, self.played_ids | self.queued_ids)
 
     @work(exclusive=True, thread=True)
     def fetch_radio(self, video_id: str) -> None:
+        self.radio_seed = video_id
         self.call_from_thread(self.notify, "Generating Up Next radio...")
-        results = self.api.get_radio_songs(video_id)
+        results = self.api.get_radio_songs(
+            video_id, on_update=lambda fresh: self.call_from_thread(self._on_radio_refreshed, video_id, fresh)
+        )
         self.call_from_thread(self.populate_up_next, results)
 
-    def populate_up_next(self, results: list) -> None:
-        table = self.query_one("#up_next_table")
-        table.clear()
-        
+    @work(exclusive=True, thread=True, group="radio_extend")
+    def extend_radio(self, seeds: list, exclude: set) -> None:
+        for seed in seeds:
+            results = self.api.get_radio_songs(seed)
+            if api_error(results):
+                continue
+            fresh = [song for song in results if song.id not in exclude]
+            if fresh:
+                self.call_from_thread(self.extend_up_next, fresh)
+                return
+
+    def _on_radio_refreshed(self, video_id: str, results: list) -> None:
+        # Never reshuffle a queue the user is already listening through, just top it up
+        if self.radio_seed == video_id:
+            self.extend_up_next(results)
+
+    def populate_up_next(self, results: list, show: bool = True) -> None:
         if not results:
             self.notify("YouTube could not generate a radio for this track.", severity="warning")
             return
             
-        if len(results) == 1 and "error" in results[0]:
-            self.notify(f"API Error: {results[0]['error']}", severity="error")
+        error = api_error(results)
+        if error:
+            self.notify(f"API Error: {error}", severity="error")
             return
-            
-        for idx, song in enumerate(results):
-            unique_key = f"{song['id']}||{idx}"
-            table.add_row(song['title'], song['artist'], song['duration'], key=unique_key)
+
+        # A new seed means a new station, everything else only ever appends
+        self.invalidate_prefetch()
+        self.query_one("#up_next_table").set_tracks([])
+        self.queued_ids = set()
+        self.used_seeds = set()
+        # Only what played on this station is kept out of it, apart from the seed playing now
+        self.played_ids = {self.current_video_id} if self.current_video_id else set()
+        self.play_when_extended = False
+        self.extend_up_next(results)
         
-        self.action_show_up_next_view()
+        if show:
+            self.action_show_up_next_view()
+
+    def extend_up_next(self, results: list) -> None:
+        if api_error(results):
+            return
+
+        fresh = []
+        for song in results:
+            if song.id in self.queued_ids or song.id in self.played_ids:
+                continue
+            self.queued_ids.add(song.id)
+            fresh.append(song)
+        self.query_one("#up_next_table").append_tracks(fresh)
+
+        if fresh and self.play_when_extended and self.query_one("#table_switcher").current == "up_next_table":
+            self.play_when_extended = False
+            self._do_play_next(is_auto_play=True)
 
     def on_option_list_option_selected(self, event: OptionList.OptionSelected) -> None:
         selected_menu = str(event.option.prompt)
+        if selected_menu != "Made For You":
+            self.search_query = None
         self.query_one("#main_content").border_title = selected_menu
         
         if selected_menu == "Made For You":
             # Just switch the view, don't trigger a new fetch
+            if self.made_for_you:
+                self.update_search_table(self.made_for_you, reset_title=False)
             self.action_show_search_view()
         elif selected_menu == "Recently Played":
-            self.update_search_table(self.db.get_history(), reset_title=False)
+            self.show_paged(self.db.get_history_page)
         elif selected_menu == "My Playlist":
-            self.update_search_table(self.db.get_playlist(), reset_title=False)
+            self.show_paged(self.db.get_playlist_page)
+
+    def show_paged(self, loader) -> None:
+        # Library views page straight out of SQLite as the user scrolls, however long they get
+        self.invalidate_prefetch()
+        self.query_one("#table_switcher").current = "search_table"
+        table = self.query_one("#search_table")
+        table.set_loader(loader)
+        table.focus()
 
     def action_refresh_recommendations(self) -> None:
         # This is the ONLY place that triggers a new 'Made For You' fetch
@@ -423,37 +1107,145 @@ class TusicApp(App):
         self.query_one("#track_info").update(f"▶️ Playing: {song_title}")
         self.query_one("#player_bar").border_title = "Playing"
 
+    def on_player_events_ready(self, message: PlayerEventsReady) -> None:
+        self.update_progress()
+
     def update_progress(self) -> None:
-        if not hasattr(self, "current_track"):
+        # Everything here comes from the player's event queue, nothing blocks on mpv
+        progress = None
+        for event in self.player.poll_events():
+            if isinstance(event, Progress):
+                progress = event
+            elif isinstance(event, PauseChanged):
+                self.render_progress(self.last_progress)
+            elif isinstance(event, TrackStarted):
+                # Progress queued before this belongs to the previous track
+                progress = None
+                self.handle_track_started(event)
+            elif isinstance(event, TrackEnded):
+                progress = None
+                self.handle_track_ended(event)
+
+        if progress is not None:
+            self.last_progress = progress
+            if self.play_record is not None:
+                self.play_record["position"] = max(self.play_record["position"], progress.position)
+            self.save_resume_position(progress)
+            self.render_progress(progress)
+            self.check_prefetch(progress)
+
+    def render_progress(self, progress) -> None:
+        if not hasattr(self, "current_track") or progress is None or progress.duration <= 0:
             return
-            
-        try:
-            current_time = self.player.time_pos
-            duration = self.player.duration
-            
-            if duration > 0:
-                progress_widget = self.query_one("#progress_bar")
-                progress_widget.update(total=duration, progress=current_time)
-                
-                cur_m, cur_s = divmod(int(current_time), 60)
-                dur_m, dur_s = divmod(int(duration), 60)
-                time_str = f"[{cur_m:02d}:{cur_s:02d} / {dur_m:02d}:{dur_s:02d}]"
-                
-                status = "⏸️ Paused" if self.player.mpv.pause else "▶️ Playing"
-                self.query_one("#track_info").update(f"{status} {time_str} : {self.current_track}")
-            
-            # Check if the player is permanently idle, not just a split-second EOF flash
-            if self.player.is_idle and self.player.auto_play_enabled:
-                # Immediately disarm the tripwire so it doesn't double-skip
-                self.player.auto_play_enabled = False 
-                
-                # Trigger the next song internally, passing True for auto-play!
+
+        progress_widget = self.query_one("#progress_bar")
+        progress_widget.update(total=progress.duration, progress=progress.position)
+
+        cur_m, cur_s = divmod(int(progress.position), 60)
+        dur_m, dur_s = divmod(int(progress.duration), 60)
+        time_str = f"[{cur_m:02d}:{cur_s:02d} / {dur_m:02d}:{dur_s:02d}]"
+
+        status = "⏸️ Paused" if self.player.paused else "▶️ Playing"
+        self.query_one("#track_info").update(f"{status} {time_str} : {self.current_track}")
+
+    def check_prefetch(self, progress: Progress) -> None:
+        if self.prefetch is not None:
+            if self.prefetch["table_id"] != self.query_one("#table_switcher").current:
+                self.invalidate_prefetch()
+        elif progress.duration > 0 and progress.duration - progress.position <= self.prefetch_seconds:
+            self.start_prefetch()
+
+    def handle_track_started(self, event: TrackStarted) -> None:
+        # mpv moved on to the entry we appended, so the UI has to follow
+        if self.prefetch is not None and self.prefetch["queue_pos"] is not None and event.playlist_pos > self.prefetch["queue_pos"]:
+            self._commit_prefetch()
+
+    def handle_track_ended(self, event: TrackEnded) -> None:
+        self.last_progress = None
+        if event.reason == "error":
+            self._retry_stream()
+        elif event.reason == "eof":
+            # With a queued prefetch mpv rolls over by itself and TrackStarted follows
+            if self.prefetch is None or self.prefetch["queue_pos"] is None:
                 self._do_play_next(is_auto_play=True)
-                
-        except Exception:
-            pass
+
+def load_config() -> dict:
+    config_path = Path.home() / ".config" / "tusic" / "config.json"
+    if config_path.exists():
+        with open(config_path, "r") as f:
+            return json.load(f)
+    return {}
+
+def transfer_playlist(args) -> None:
+    # Runs without the TUI, a progress line on stderr is all the feedback a bulk import needs
+    from core.playlist_io import PlaylistImporter, export_playlist
+
+    db = Database()
+    http = HttpClient.from_config(load_config())
+    try:
+        if args.import_source:
+            def progress(stats):
+                print(f"\rRead {stats['read']}, added {stats['added']}, looked up {stats['resolved']}, not found {stats['failed']}, unreadable {stats['unreadable']}",
+                      end="", file=sys.stderr, flush=True)
+
+            PlaylistImporter(db, TusicAPI(db, http=http), on_progress=progress).run(args.import_source)
+            print(file=sys.stderr)
+        if args.export_path:
+            count = export_playlist(db, args.export_path)
+            print(f"Exported {count} tracks to {args.export_path}", file=sys.stderr)
+    finally:
+        db.close()
+        http.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="tusic")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report time to first paint and time to interactive, then exit")
+    parser.add_argument("--import", dest="import_source", metavar="SOURCE",
+                        help="add an .m3u/.json/.csv file or a YouTube playlist id/URL to My Playlist, then exit")
+    parser.add_argument("--export", dest="export_path", metavar="FILE",
+                        help="write My Playlist to an .m3u/.json/.csv file, then exit")
+    parser.add_argument("--daemon", action="store_true",
+                        help="play headless and take commands on a Unix socket, the TUI and tusicctl.py attach to it")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="compact a library from an older version so it can shrink as history ages out, then exit")
+    args = parser.parse_args()
+
+    if args.vacuum:
+        # A full VACUUM locks the database for as long as it runs, so nothing else may have it open
+        if DaemonClient.connect() is not None:
+            sys.exit("tusic: stop the daemon (tusicctl.py shutdown) before --vacuum")
+        try:
+            converted = Database.enable_incremental_vacuum()
+        except sqlite3.Error as e:
+            sys.exit(f"tusic: {e}")
+        print("Library compacted." if converted else "Nothing to do, the library is already set up for it.")
+        sys.exit(0)
+
+    if args.daemon:
+        from core.daemon import TusicDaemon
+
+        daemon = TusicDaemon(load_config())
+        signal.signal(signal.SIGTERM, lambda *_: daemon.shutdown())
+        try:
+            daemon.serve()
+        except RuntimeError as e:
+            sys.exit(f"tusic: {e}")
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.import_source or args.export_path:
+        try:
+            transfer_playlist(args)
+        except Exception as e:
+            sys.exit(f"tusic: {e}")
+        sys.exit(0)
+
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    app = TusicApp()
+    app = TusicApp(profile_startup=args.profile_startup)
     app.run()
+
+    if args.profile_startup:
+        for name, seconds in app.startup_marks.items():
+            print(f"{name:>12}: {seconds * 1000:7.1f} ms")
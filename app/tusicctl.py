@@ -0,0 +1,140 @@
+import re
+import sys
+import json
+import argparse
+
+# Only the socket client is imported, so a status bar polling this pays for Python start-up and little else
+from core.remote import DaemonClient, DaemonError, socket_path
+from core.track import Track
+
+COMMANDS = {
+    "status": "what is playing, as one line",
+    "watch": "print the status line again whenever it changes (for status bars)",
+    "play": "ID|QUERY  play a video id, or the top search result",
+    "toggle": "pause / unpause",
+    "pause": "pause",
+    "resume": "unpause",
+    "next": "skip to the next queued track",
+    "stop": "stop playback",
+    "seek": "SECONDS  seek by an offset, negative goes back",
+    "add": "ID...  queue video ids",
+    "queue": "list the queue",
+    "clear": "empty the queue",
+    "search": "QUERY  search YouTube Music",
+    "radio": "ID  the radio for a video id",
+    "mix": "a Made For You selection from the local history",
+    "save": "save the current track to My Playlist",
+    "shutdown": "stop the daemon",
+}
+
+VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+
+def status_line(status: dict) -> str:
+    if not status.get("track"):
+        return "Nothing playing"
+    song = Track.from_json(status["track"])
+    # Same shape as the TUI's player bar
+    status_text = "⏸️ Paused" if status["state"] == "paused" else "▶️ Playing"
+    cur_m, cur_s = divmod(int(status.get("position") or 0), 60)
+    dur_m, dur_s = divmod(int(status.get("duration") or 0), 60)
+    return f"{status_text} [{cur_m:02d}:{cur_s:02d} / {dur_m:02d}:{dur_s:02d}] : {song.title} - {song.display_artist}"
+
+
+def print_tracks(tracks: list) -> None:
+    for item in tracks:
+        song = Track.from_json(item)
+        print(f"{song.id}  {song.title} - {song.display_artist}  {song.length}")
+
+
+def watch(client: DaemonClient, as_json: bool) -> None:
+    status = client.request("status")
+    last = None
+    for message in client.events():
+        if as_json:
+            print(json.dumps(message), flush=True)
+            continue
+
+        event = message["event"]
+        if event == "Progress":
+            status["position"], status["duration"] = message["position"], message["duration"]
+        elif event == "PauseChanged":
+            status["state"] = "paused" if message["paused"] else "playing"
+        elif event == "TrackStarted":
+            status["track"] = message.get("track")
+            status["state"] = "playing"
+            status["position"] = 0.0
+        elif event == "TrackEnded" and message["reason"] != "eof":
+            status["track"] = None
+
+        line = status_line(status)
+        if line != last:
+            print(line, flush=True)
+            last = line
+
+
+def run(client: DaemonClient, command: str, args: list, as_json: bool):
+    if command == "watch":
+        return watch(client, as_json)
+
+    if command == "play":
+        if not args:
+            sys.exit("tusicctl: play needs a video id or a search query")
+        if len(args) == 1 and VIDEO_ID.match(args[0]):
+            result = client.request("play", video_id=args[0])
+        else:
+            result = client.request("play", query=" ".join(args))
+    elif command == "seek":
+        if len(args) != 1:
+            sys.exit("tusicctl: seek needs an offset in seconds")
+        result = client.request("seek", offset=float(args[0]))
+    elif command == "add":
+        result = client.request("enqueue", video_ids=args)
+    elif command in ("search", "radio"):
+        if not args:
+            sys.exit(f"tusicctl: {command} needs an argument")
+        result = client.request(command, **({"query": " ".join(args)} if command == "search" else {"video_id": args[0]}))
+    elif command == "mix":
+        result = client.request("mix", limit=int(args[0]) if args else 25)
+    elif command == "clear":
+        result = client.request("queue.clear")
+    else:
+        result = client.request(command)
+
+    if as_json:
+        print(json.dumps(result))
+    elif command == "status":
+        print(status_line(result))
+    elif command in ("queue", "search", "radio", "mix"):
+        print_tracks(result)
+    elif command in ("play", "next", "save") and result:
+        song = Track.from_json(result)
+        print(f"{song.title} - {song.display_artist}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="tusicctl",
+        description="Control a running tusic daemon (python app/main.py --daemon).",
+        epilog="commands:\n" + "\n".join(f"  {name:<9} {help}" for name, help in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=COMMANDS, metavar="command")
+    parser.add_argument("args", nargs="*")
+    parser.add_argument("--json", action="store_true", help="print the raw reply (or raw events for watch)")
+    parser.add_argument("--socket", help=f"daemon socket (default: {socket_path()})")
+    args = parser.parse_args()
+
+    client = DaemonClient.connect(args.socket)
+    if client is None:
+        sys.exit(f"tusicctl: no tusic daemon on {args.socket or socket_path()}, start one with: python app/main.py --daemon")
+    try:
+        run(client, args.command, args.args, args.json)
+    except DaemonError as e:
+        sys.exit(f"tusicctl: {e}")
+    except OSError as e:
+        sys.exit(f"tusicctl: lost the daemon: {e}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
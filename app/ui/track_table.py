@@ -0,0 +1,136 @@
+from textual.widgets import DataTable
+
+from core.track import Track
+
+class TrackTable(DataTable):
+    """DataTable that keeps its tracks in a model and only builds rows near the viewport.
+
+    Rows are added in pages as the cursor or scroll position gets close to the
+    last built row. A table can also be backed by a paged loader (e.g. a keyset
+    cursor on Database), in which case tracks themselves are fetched on demand.
+    Every row key maps straight to its track, so nothing has to be parsed back
+    out of the cells.
+    """
+
+    PAGE_SIZE = 100
+    # Build the next page once the cursor is this close to the last built row
+    MARGIN = 30
+
+    def __init__(self, *args, album_column: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.album_column = album_column
+        self.tracks = []
+        self._row_tracks = {}
+        self._serial = 0
+        self._loader = None
+        self._next_token = None
+
+    def _cells(self, song: Track) -> tuple:
+        if self.album_column:
+            return (song.title, song.display_artist, "Unknown", song.length)
+        return (song.title, song.display_artist, song.length)
+
+    @property
+    def built(self) -> int:
+        return self.row_count
+
+    def _build(self, count: int):
+        """Materializes up to count more rows from the model, pulling another page from the loader if needed."""
+        while self.built + count > len(self.tracks) and self._loader is not None:
+            if not self._load_page():
+                break
+
+        end = min(len(self.tracks), self.built + count)
+        for song in self.tracks[self.built:end]:
+            key = str(self._serial)
+            self._serial += 1
+            self._row_tracks[key] = song
+            self.add_row(*self._cells(song), key=key)
+
+    def _load_page(self) -> bool:
+        page, self._next_token = self._loader(self._next_token, self.PAGE_SIZE)
+        if self._next_token is None:
+            self._loader = None
+        self.tracks.extend(page)
+        return bool(page)
+
+    def _maybe_extend(self, row: int):
+        if row >= self.built - self.MARGIN and (self.built < len(self.tracks) or self._loader is not None):
+            self._build(self.PAGE_SIZE)
+
+    def _reset(self):
+        self.clear()
+        self.tracks = []
+        self._row_tracks = {}
+        self._loader = None
+        self._next_token = None
+
+    def set_tracks(self, tracks: list):
+        """Shows tracks, only rebuilding rows from the first one that differs from what is on screen."""
+        common = 0
+        limit = min(self.built, len(tracks))
+        while common < limit and self.tracks[common].id == tracks[common].id:
+            common += 1
+
+        if common == 0:
+            self._reset()
+        else:
+            # Only rows past the shared prefix change, drop them from the bottom up
+            for row in range(self.built - 1, common - 1, -1):
+                key = self.coordinate_to_cell_key((row, 0)).row_key
+                self._row_tracks.pop(key.value, None)
+                self.remove_row(key)
+            self._loader = None
+            self._next_token = None
+
+        self.tracks = list(tracks)
+        self._build(max(self.PAGE_SIZE - self.built, 0))
+
+    def set_loader(self, loader):
+        """Backs the table with loader(token, limit) -> (tracks, next_token). next_token None means done."""
+        self._reset()
+        self._loader = loader
+        self._build(self.PAGE_SIZE)
+
+    def append_tracks(self, tracks: list):
+        self.tracks.extend(tracks)
+        # Rows only get built right away if the viewport is already near the end
+        if self.built == 0 or self.cursor_coordinate.row >= self.built - self.MARGIN:
+            self._build(len(tracks))
+
+    def track_for(self, row_key) -> Track:
+        return self._row_tracks[row_key.value]
+
+    def cursor_track(self):
+        if not self.row_count:
+            return None
+        return self.track_for(self.coordinate_to_cell_key(self.cursor_coordinate).row_key)
+
+    def track_at(self, row: int) -> Track:
+        return self.track_for(self.coordinate_to_cell_key((row, 0)).row_key)
+
+    def remove_track(self, row_key):
+        # Built rows line up one to one with the front of the model
+        del self.tracks[self.get_row_index(row_key)]
+        self._row_tracks.pop(row_key.value)
+        self.remove_row(row_key)
+
+    def has_more(self) -> bool:
+        return self.built < len(self.tracks) or self._loader is not None
+
+    def ensure_row(self, row: int) -> bool:
+        """Builds rows until row exists. False if the model runs out first."""
+        while row >= self.built and self.has_more():
+            before = self.built
+            self._build(self.PAGE_SIZE)
+            if self.built == before:
+                break
+        return row < self.built
+
+    def on_data_table_row_highlighted(self, event: DataTable.RowHighlighted) -> None:
+        self._maybe_extend(event.cursor_row)
+
+    def watch_scroll_y(self, old_value: float, new_value: float) -> None:
+        super().watch_scroll_y(old_value, new_value)
+        # Mouse-wheel scrolling doesn't move the cursor, so follow the viewport too
+        self._maybe_extend(int(new_value) + self.size.height)
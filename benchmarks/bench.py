@@ -0,0 +1,392 @@
+"""Offline benchmarks for Tusic's hot paths.
+
+Usage: python benchmarks/bench.py [--only app,db,startup,components] [--runs N]
+                                  [--db-sizes 10000,100000,1000000] [--out results.json]
+
+YouTube Music, yt-dlp and mpv are replaced by the fakes in benchmarks/fakes.py, so
+nothing touches the network and runs are repeatable. Everything happens under a
+throwaway HOME, your real library and caches are never read.
+
+Results are written as JSON (stdout, or --out). Compare two runs with
+benchmarks/compare.py old.json new.json.
+
+The app timings include Tusic's own deliberate delays. The skip debounce
+(skip_debounce, 0.15 s by default) only holds back requests that follow another
+one within that window, so a single play or auto-advance isn't delayed by it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCH_DIR.parent / "app"
+
+# Set before any app module is imported, several of them resolve paths under HOME at import time
+BENCH_HOME = Path(os.environ.get("TUSIC_BENCH_HOME") or tempfile.mkdtemp(prefix="tusic-bench-"))
+os.environ["HOME"] = str(BENCH_HOME)
+# Nor is a tusic daemon you may have running, the app would attach to it instead of the fake mpv
+os.environ["TUSIC_SOCKET"] = str(BENCH_HOME / "tusic.sock")
+
+sys.path.insert(0, str(APP_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import fakes
+
+
+def log(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def summarize(samples: list) -> dict:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+    return {
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "runs": len(ordered),
+    }
+
+
+def timed(fn, runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def write_config(config: dict):
+    config_dir = BENCH_HOME / ".config" / "tusic"
+    config_dir.mkdir(parents=True, exist_ok=True)
+    with open(config_dir / "config.json", "w") as f:
+        json.dump(config, f)
+
+
+# --- components ------------------------------------------------------------
+
+def bench_components(runs: int) -> dict:
+    from core.api import TusicAPI
+    from core.resolver import StreamResolver
+
+    results = {}
+
+    api = TusicAPI(ytmusic=fakes.FakeYTMusic())
+    queries = iter(range(10 ** 9))
+    results["api.search_uncached"] = timed(lambda: api.search_songs(f"component query {next(queries)}"), runs)
+    api.search_songs("component query cached")
+    results["api.search_cached"] = timed(lambda: api.search_songs("component query cached"), runs)
+
+    resolver = StreamResolver(disk_cache=False, ydl_class=fakes.FakeYoutubeDL)
+    video_ids = iter(range(10 ** 9))
+    results["resolver.resolve_uncached"] = timed(lambda: resolver.get_stream_url(f"vid{next(video_ids)}"), runs)
+    resolver.get_stream_url("cached")
+    results["resolver.resolve_cached"] = timed(lambda: resolver.get_stream_url("cached"), runs)
+    resolver.close()
+    return results
+
+
+# --- app -------------------------------------------------------------------
+
+async def wait_until(condition, timeout: float = 10.0) -> float:
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("benchmark condition never became true")
+        await asyncio.sleep(0.0005)
+    return time.perf_counter()
+
+
+async def run_app_benchmarks(runs: int) -> dict:
+    import main
+
+    os.chdir(APP_DIR)
+    app = main.TusicApp()
+    samples = {"app.search_to_render": [], "app.select_to_play": [], "app.next_track": [],
+               "app.auto_advance": [], "app.gapless_handoff": []}
+
+    async with app.run_test(size=(120, 40)) as pilot:
+        await wait_until(lambda: "interactive" in app.startup_marks)
+        search_input = app.query_one("#search_input")
+        search_table = app.query_one("#search_table")
+        up_next_table = app.query_one("#up_next_table")
+        mpv = app.player.mpv
+
+        # Search: enter in the search bar until the first remote result is in the table
+        for i in range(runs):
+            query = f"bench query {i}"
+            search_input.focus()
+            search_input.value = query
+            await pilot.pause()
+            expected = fakes.video_id_for(f"{query}/0")
+            start = time.perf_counter()
+            await pilot.press("enter")
+            end = await wait_until(lambda: search_table.tracks and search_table.tracks[0].id == expected)
+            samples["app.search_to_render"].append(end - start)
+
+        # Select: enter on a search row until mpv is asked to play it
+        for i in range(runs):
+            app.action_show_search_view()
+            search_table.move_cursor(row=i % search_table.row_count)
+            await pilot.pause()
+            loaded = len(mpv.loaded)
+            start = time.perf_counter()
+            await pilot.press("enter")
+            end = await wait_until(lambda: len(mpv.loaded) > loaded)
+            samples["app.select_to_play"].append(end - start)
+            # Let the radio for this track land before the next selection
+            await wait_until(lambda: up_next_table.row_count > 0)
+            await pilot.pause()
+
+        app.action_show_up_next_view()
+        up_next_table.move_cursor(row=0)
+        await pilot.pause()
+
+        # Skip: n until mpv is asked to play the next row
+        for _ in range(runs):
+            loaded = len(mpv.loaded)
+            start = time.perf_counter()
+            await pilot.press("n")
+            end = await wait_until(lambda: len(mpv.loaded) > loaded)
+            samples["app.next_track"].append(end - start)
+
+        # Auto-advance without a prefetch: end of file until the next play
+        for _ in range(runs):
+            app.invalidate_prefetch()
+            await pilot.pause()
+            loaded = len(mpv.loaded)
+            start = time.perf_counter()
+            mpv.finish()
+            end = await wait_until(lambda: len(mpv.loaded) > loaded)
+            samples["app.auto_advance"].append(end - start)
+
+        # Gapless: with the next track already queued in mpv, end of file until the UI shows it
+        for _ in range(runs):
+            app.invalidate_prefetch()
+            # Cursor moves from the last track change must land first, they would cancel the prefetch
+            await pilot.pause()
+            loaded = len(mpv.loaded)
+            mpv.progress(179.0)
+            await wait_until(lambda: app.prefetch is not None and app.prefetch["queue_pos"] is not None and len(mpv.loaded) > loaded)
+            expected = app.prefetch["video_id"]
+            start = time.perf_counter()
+            mpv.finish()
+            end = await wait_until(lambda: app.current_video_id == expected)
+            samples["app.gapless_handoff"].append(end - start)
+
+        await pilot.press("q")
+
+    return {name: summarize(values) for name, values in samples.items()}
+
+
+def bench_app(runs: int) -> dict:
+    # Background audio downloads would go to the network
+    write_config({"audio_cache_mb": 0})
+    return asyncio.run(run_app_benchmarks(runs))
+
+
+# --- database --------------------------------------------------------------
+
+def seed_database(db_dir: Path, rows: int):
+    """Fills history (and the tracks/artists counters that go with it) straight through executemany."""
+    from core.database import Database
+
+    Database(db_dir).close()
+
+    rng = random.Random(rows)
+    video_count = max(rows // 5, 1)
+    artist_names = [f"Artist {i}" for i in range(max(video_count // 20, 1))]
+    videos = []
+    for i in range(video_count):
+        names = rng.sample(artist_names, min(len(artist_names), 1 + (i % 4 == 0)))
+        videos.append((f"seed{i:09d}", f"Track {i} {rng.choice(['Remix', 'Live', 'Edit', 'Mix'])}", names, rng.randint(90, 420)))
+
+    plays = [0] * video_count
+    history = []
+    for _ in range(rows):
+        index = rng.randrange(video_count)
+        plays[index] += 1
+        video_id, title, names, duration = videos[index]
+        history.append((video_id, title, ", ".join(names), duration))
+
+    artist_plays = {}
+    for (video_id, title, names, duration), count in zip(videos, plays):
+        for name in names:
+            artist_plays[name] = artist_plays.get(name, 0) + count
+
+    conn = sqlite3.connect(db_dir / "tusic.db")
+    with conn:
+        conn.executemany("INSERT INTO artists (id, name, play_count) VALUES (?, ?, ?)",
+                         [(i + 1, name, artist_plays.get(name, 0)) for i, name in enumerate(artist_names)])
+        conn.executemany("INSERT INTO tracks (video_id, title, artist, duration, play_count) VALUES (?, ?, ?, ?, ?)",
+                         [(v[0], v[1], ", ".join(v[2]), v[3], count) for v, count in zip(videos, plays)])
+        artist_ids = {name: i + 1 for i, name in enumerate(artist_names)}
+        conn.executemany("INSERT INTO track_artists (video_id, artist_id) VALUES (?, ?)",
+                         [(v[0], artist_ids[name]) for v in videos for name in v[2]])
+        conn.executemany("INSERT INTO history (video_id, title, artist, duration) VALUES (?, ?, ?, ?)", history)
+        conn.executemany("INSERT INTO playlist (video_id, title, artist, duration) VALUES (?, ?, ?, ?)",
+                         [(v[0], v[1], ", ".join(v[2]), v[3]) for v in videos[::10]])
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def bench_db(sizes: list, runs: int) -> dict:
+    from core.database import Database
+    from core.recommender import Recommender
+    from core.track import Track
+
+    results = {}
+    for rows in sizes:
+        db_dir = BENCH_HOME / f"db-{rows}"
+        log(f"  seeding {rows} history rows...")
+        seed_database(db_dir, rows)
+
+        db = Database(db_dir)
+        prefix = f"db[{rows}]"
+        middle = db.conn.execute("SELECT MAX(id) FROM history").fetchone()[0] // 2
+        query_runs = max(runs, 20)
+
+        results[f"{prefix}.history_first_page"] = timed(lambda: db.get_history_page(None, 100), query_runs)
+        results[f"{prefix}.history_deep_page"] = timed(lambda: db.get_history_page(middle, 100), query_runs)
+        results[f"{prefix}.playlist_first_page"] = timed(lambda: db.get_playlist_page(None, 100), query_runs)
+        results[f"{prefix}.search_local"] = timed(lambda: db.search_local("track 12"), query_runs)
+        results[f"{prefix}.top_artists"] = timed(lambda: db.get_top_artists(3), query_runs)
+        results[f"{prefix}.most_played"] = timed(lambda: db.get_most_played(50), query_runs)
+        results[f"{prefix}.play_count"] = timed(lambda: db.play_count("seed000000001"), query_runs)
+        recommender = Recommender(db)
+        results[f"{prefix}.local_mix"] = timed(lambda: recommender.mix(25), query_runs)
+
+        # 1000 plays through the writer thread, committed
+        batches = iter(range(10 ** 9))
+
+        def insert_batch():
+            batch = next(batches)
+            for i in range(1000):
+                db.add_to_history(Track.create(f"new{batch}-{i % 200}", f"New {i}", ["Artist 1"], 200))
+            db.flush()
+
+        results[f"{prefix}.insert_1k_plays"] = timed(insert_batch, runs)
+        db.close()
+    return results
+
+
+# --- startup ---------------------------------------------------------------
+
+def startup_child():
+    # Runs in a fresh interpreter, so the import cost of the app is part of what gets measured
+    fakes.install()
+    os.chdir(APP_DIR)
+    import main
+
+    app = main.TusicApp(profile_startup=True)
+    app.run(headless=True)
+    print(json.dumps(app.startup_marks))
+
+
+def bench_startup(runs: int) -> dict:
+    write_config({"audio_cache_mb": 0})
+    env = dict(os.environ, TUSIC_BENCH_HOME=str(BENCH_HOME))
+    samples = {"startup.process": [], "startup.first_paint": [], "startup.interactive": []}
+
+    # The first launch builds the database and the snapshot, it isn't counted
+    for run in range(runs + 1):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, __file__, "--startup-child"], env=env,
+                                capture_output=True, text=True, check=True).stdout
+        elapsed = time.perf_counter() - start
+        if run == 0:
+            continue
+        marks = json.loads(output.strip().splitlines()[-1])
+        samples["startup.process"].append(elapsed)
+        samples["startup.first_paint"].append(marks["first_paint"])
+        samples["startup.interactive"].append(marks["interactive"])
+
+    return {name: summarize(values) for name, values in samples.items()}
+
+
+# ---------------------------------------------------------------------------
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Tusic benchmarks")
+    parser.add_argument("--only", default="components,app,db,startup",
+                        help="comma separated groups to run (components, app, db, startup)")
+    parser.add_argument("--runs", type=int, default=15, help="samples per benchmark")
+    parser.add_argument("--db-sizes", default="10000,100000,1000000", help="history sizes for the db group")
+    parser.add_argument("--out", help="write the JSON results here instead of stdout")
+    parser.add_argument("--startup-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_child:
+        startup_child()
+        return
+
+    try:
+        run(parser, args)
+    finally:
+        if "TUSIC_BENCH_HOME" not in os.environ:
+            shutil.rmtree(BENCH_HOME, ignore_errors=True)
+
+
+def run(parser, args):
+    groups = [group.strip() for group in args.only.split(",") if group.strip()]
+    results = {}
+    for group in groups:
+        log(f"running {group}...")
+        if group == "components":
+            results.update(bench_components(args.runs))
+        elif group == "app":
+            fakes.install()
+            results.update(bench_app(args.runs))
+        elif group == "db":
+            results.update(bench_db([int(size) for size in args.db_sizes.split(",")], args.runs))
+        elif group == "startup":
+            results.update(bench_startup(args.runs))
+        else:
+            parser.error(f"unknown group: {group}")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlite": sqlite3.sqlite_version,
+            "runs": args.runs,
+            "timestamp": int(time.time()),
+        },
+        "results": results,
+    }
+
+    for name, stats in results.items():
+        log(f"{name:>36}: median {stats['median_ms']:9.3f} ms   p95 {stats['p95_ms']:9.3f} ms")
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
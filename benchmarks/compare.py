@@ -0,0 +1,52 @@
+"""Compares two bench.py result files.
+
+Usage: python benchmarks/compare.py old.json new.json [--threshold 10]
+
+Prints the median of every benchmark in both runs and the change between them.
+Anything slower by more than the threshold (percent) is flagged, and the exit
+status is 1 if there was at least one such regression.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two Tusic benchmark runs")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    old, new = load(args.old), load(args.new)
+    print(f"{'benchmark':>36}  {old['meta']['commit']:>10}  {new['meta']['commit']:>10}  change")
+
+    regressions = 0
+    for name in sorted(set(old["results"]) | set(new["results"])):
+        before = old["results"].get(name, {}).get("median_ms")
+        after = new["results"].get(name, {}).get("median_ms")
+        if before is None or after is None:
+            shown = f"{before:10.3f}" if before is not None else f"{'-':>10}"
+            shown_after = f"{after:10.3f}" if after is not None else f"{'-':>10}"
+            print(f"{name:>36}  {shown}  {shown_after}")
+            continue
+
+        change = (after - before) / before * 100 if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "  << slower"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "  faster"
+        print(f"{name:>36}  {before:10.3f}  {after:10.3f}  {change:+6.1f}%{flag}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
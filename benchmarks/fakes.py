@@ -0,0 +1,226 @@
+"""Local stand-ins for YouTube Music, yt-dlp and mpv, so the benchmarks never touch the network or a sound card.
+
+They can be passed straight to TusicAPI(ytmusic=...), StreamResolver(ydl_class=...)
+and Player(backend=...), or installed into sys.modules with install() so a whole
+TusicApp picks them up through its lazy imports.
+
+Everything is deterministic: the same query or video id always gives the same answer.
+"""
+import hashlib
+import sys
+import threading
+import time
+import types
+
+ARTISTS = ["Daft Punk", "Justice", "Kavinsky", "Carpenter Brut", "Perturbator", "The Midnight", "FM-84", "Gunship"]
+
+
+def _seed(text: str) -> int:
+    return int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+
+
+def video_id_for(text: str) -> str:
+    # search() names result i of a query video_id_for(f"{query}/{i}")
+    return hashlib.md5(text.encode()).hexdigest()[:11]
+
+
+def _song(video_id: str, seed: int) -> dict:
+    artists = [ARTISTS[seed % len(ARTISTS)]]
+    if seed % 3 == 0:
+        artists.append(ARTISTS[(seed // 7) % len(ARTISTS)])
+    seconds = 120 + seed % 240
+    return {
+        'videoId': video_id,
+        'title': f"Track {video_id}",
+        'artists': [{'name': name, 'id': None} for name in artists],
+        'duration': f"{seconds // 60}:{seconds % 60:02d}",
+        'duration_seconds': seconds,
+        'length': f"{seconds // 60}:{seconds % 60:02d}",
+    }
+
+
+class FakeYTMusic:
+    """Answers search() and get_watch_playlist() like ytmusicapi does, after an optional fixed delay."""
+
+    def __init__(self, *args, latency: float = 0.0, **kwargs):
+        self.latency = latency
+        self.calls = 0
+
+    def _wait(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def search(self, query: str, filter: str = None, limit: int = 20, **kwargs) -> list:
+        self._wait()
+        base = _seed(query)
+        return [_song(video_id_for(f"{query}/{i}"), base + i) for i in range(limit)]
+
+    def get_watch_playlist(self, videoId: str = None, playlistId: str = None, limit: int = 25, **kwargs) -> dict:
+        self._wait()
+        base = _seed(videoId)
+        # The seed comes first, like the real radio
+        tracks = [_song(videoId, base)] + [_song(video_id_for(f"{videoId}/{i}"), base + i) for i in range(limit - 1)]
+        return {'tracks': tracks}
+
+    def get_song(self, videoId: str, **kwargs) -> dict:
+        self._wait()
+        song = _song(videoId, _seed(videoId))
+        return {'videoDetails': {
+            'videoId': videoId,
+            'title': song['title'],
+            'author': f"{song['artists'][0]['name']} - Topic",
+            'lengthSeconds': str(song['duration_seconds']),
+        }}
+
+    def get_playlist(self, playlistId: str, limit: int = 100, **kwargs) -> dict:
+        self._wait()
+        base = _seed(playlistId)
+        count = 300 if limit is None else limit
+        return {'id': playlistId, 'tracks': [_song(video_id_for(f"{playlistId}/{i}"), base + i) for i in range(count)]}
+
+
+class FakeYoutubeDL:
+    """Returns a googlevideo-looking URL with an expire parameter, after an optional fixed delay."""
+
+    latency = 0.0
+
+    def __init__(self, opts: dict = None):
+        self.params = dict(opts or {})
+
+    def extract_info(self, url: str, download: bool = False) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        video_id = url.rsplit("v=", 1)[-1]
+        expire = int(time.time()) + 6 * 3600
+        return {'id': video_id, 'url': f"https://rr1---sn-fake.googlevideo.com/videoplayback?id={video_id}&expire={expire}&mime=audio%2Fwebm"}
+
+    def close(self):
+        pass
+
+
+class MpvEventEndFile:
+    EOF = 0
+    RESTARTED = 1
+    ABORTED = 2
+    QUIT = 3
+    ERROR = 4
+    REDIRECT = 5
+
+
+class _Event:
+    def __init__(self, reason=None):
+        self.data = types.SimpleNamespace(reason=reason)
+
+
+class FakeMPV:
+    """Plays nothing, but fires the same property changes and start/end-file events python-mpv would.
+
+    Events fire synchronously from the calling thread. Every play/append is
+    timestamped in self.loaded so a benchmark can tell when playback was requested.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._observers = {}
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self.playlist = []
+        self.playlist_pos = None
+        self.pause = False
+        self.loaded = []
+
+    def observe_property(self, name: str, handler):
+        self._observers.setdefault(name, []).append(handler)
+
+    def event_callback(self, *event_types):
+        def register(fn):
+            for event_type in event_types:
+                self._callbacks.setdefault(event_type, []).append(fn)
+            return fn
+        return register
+
+    def _property(self, name: str, value):
+        for handler in self._observers.get(name, []):
+            handler(name, value)
+
+    def _event(self, event_type: str, reason=None):
+        for fn in self._callbacks.get(event_type, []):
+            fn(_Event(reason))
+
+    def _start(self, index: int):
+        self.playlist_pos = index
+        self._event('start-file')
+        self._property('idle-active', False)
+        self._property('duration', 180.0)
+        self._property('time-pos', 0.0)
+
+    def play(self, url: str):
+        with self._lock:
+            self.loaded.append((time.perf_counter(), url))
+            if self.playlist_pos is not None:
+                self._event('end-file', MpvEventEndFile.ABORTED)
+            self.playlist = [url]
+            self._start(0)
+
+    def playlist_append(self, url: str, **options):
+        with self._lock:
+            self.loaded.append((time.perf_counter(), url))
+            self.playlist.append(url)
+
+    def loadfile(self, url: str, mode: str = 'replace', **options):
+        if mode == 'append':
+            self.playlist_append(url, **options)
+        else:
+            self.play(url)
+
+    def seek(self, amount: float, reference: str = 'relative', precision: str = 'keyframes'):
+        self._property('time-pos', amount)
+
+    def playlist_clear(self):
+        with self._lock:
+            if self.playlist_pos is not None:
+                self.playlist = [self.playlist[self.playlist_pos]]
+                self.playlist_pos = 0
+
+    def progress(self, position: float):
+        """Pretends playback reached position seconds."""
+        self._property('time-pos', position)
+
+    def finish(self):
+        """Pretends the current track played to the end, rolling into the next entry if there is one."""
+        with self._lock:
+            self._event('end-file', MpvEventEndFile.EOF)
+            if self.playlist_pos is not None and self.playlist_pos + 1 < len(self.playlist):
+                self._start(self.playlist_pos + 1)
+            else:
+                self.playlist_pos = None
+                self._property('idle-active', True)
+
+    def command(self, name: str, *args):
+        if name == 'stop':
+            with self._lock:
+                if self.playlist_pos is not None:
+                    self._event('end-file', MpvEventEndFile.ABORTED)
+                self.playlist = []
+                self.playlist_pos = None
+
+    def terminate(self):
+        pass
+
+
+def fake_mpv_module():
+    module = types.ModuleType("mpv")
+    module.MPV = FakeMPV
+    module.MpvEventEndFile = MpvEventEndFile
+    return module
+
+
+def install():
+    """Registers the fakes as ytmusicapi, yt_dlp and mpv, must run before anything imports them."""
+    ytmusicapi = types.ModuleType("ytmusicapi")
+    ytmusicapi.YTMusic = FakeYTMusic
+    yt_dlp = types.ModuleType("yt_dlp")
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+    sys.modules["ytmusicapi"] = ytmusicapi
+    sys.modules["yt_dlp"] = yt_dlp
+    sys.modules["mpv"] = fake_mpv_module()
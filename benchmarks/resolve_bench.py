@@ -0,0 +1,57 @@
+"""Compares cold (new YoutubeDL per call) and warm (pooled) stream resolves.
+
+Usage: python benchmarks/resolve_bench.py [video_id ...]
+
+Needs network access. The URL cache is bypassed so every run measures a real extraction.
+"""
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+import yt_dlp
+
+from core.resolver import StreamResolver
+
+DEFAULT_IDS = ["dQw4w9WgXcQ", "kJQP7kiw5Fk", "fJ9rUzIMcZQ"]
+
+
+def cold_resolve(opts: dict, video_id: str) -> float:
+    start = time.perf_counter()
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
+    return time.perf_counter() - start
+
+
+def warm_resolve(resolver: StreamResolver, video_id: str) -> float:
+    start = time.perf_counter()
+    resolver._extract(video_id)
+    return time.perf_counter() - start
+
+
+def report(label: str, timings: list):
+    print(f"{label:>5}: median {statistics.median(timings) * 1000:7.0f} ms   "
+          f"min {min(timings) * 1000:7.0f} ms   max {max(timings) * 1000:7.0f} ms")
+
+
+def main():
+    video_ids = sys.argv[1:] or DEFAULT_IDS
+    resolver = StreamResolver(pool_size=1)
+
+    # Fresh options without the disk cache, so cold really is cold
+    cold_opts = dict(resolver.ydl_opts, cachedir=False)
+    cold = [cold_resolve(cold_opts, vid) for vid in video_ids]
+
+    # First call warms the pooled extractor, it isn't counted
+    resolver._extract(video_ids[0])
+    warm = [warm_resolve(resolver, vid) for vid in video_ids]
+    resolver.close()
+
+    report("cold", cold)
+    report("warm", warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import sqlite3
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from core.cache import ResponseCache
+from core.database import Database
+from core.trace import tracer
+from core.track import Track
+
+SONG = Track.create("aaaaaaaaaaa", "Song", ("Artist",), "3:45")
+
+
+def make_legacy_db(db_dir):
+    # The schema and data the first release wrote, before tracks/artists or incremental vacuum
+    conn = sqlite3.connect(db_dir / "tusic.db")
+    conn.execute("CREATE TABLE history (id INTEGER PRIMARY KEY AUTOINCREMENT, video_id TEXT, title TEXT, "
+                 "artist TEXT, duration INTEGER, played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute("CREATE TABLE playlist (video_id TEXT PRIMARY KEY, title TEXT, artist TEXT, duration INTEGER)")
+    conn.executemany("INSERT INTO history (video_id, title, artist, duration, played_at) VALUES (?, ?, ?, ?, ?)", [
+        ("aaaaaaaaaaa", "Song", "Artist, Guest", "3:45", "2020-01-01 10:00:00"),
+        ("aaaaaaaaaaa", "Song", "Artist, Guest", "3:45", "2020-01-02 10:00:00"),
+        ("bbbbbbbbbbb", "Other", "", "1:02:03", "2020-01-02 11:00:00"),
+    ])
+    conn.execute("INSERT INTO playlist VALUES ('ccccccccccc', 'Saved', 'Artist', '2:00')")
+    conn.commit()
+    conn.close()
+
+
+def test_legacy_database_is_migrated(tmp_path):
+    make_legacy_db(tmp_path)
+    db = Database(tmp_path)
+    try:
+        assert db.play_count("aaaaaaaaaaa") == 2
+        assert db.play_count("ccccccccccc") == 0
+        assert set(db.get_top_artists(2)) == {"Artist", "Guest"}
+        durations = dict(db.conn.execute("SELECT video_id, duration FROM tracks"))
+        assert durations == {"aaaaaaaaaaa": 225, "bbbbbbbbbbb": 3723, "ccccccccccc": 120}
+    finally:
+        db.close()
+
+
+def test_only_new_databases_start_with_incremental_vacuum(tmp_path):
+    fresh = Database(tmp_path / "fresh")
+    assert fresh.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    fresh.close()
+
+    make_legacy_db(tmp_path)
+    db = Database(tmp_path)
+    try:
+        assert db.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+        # Housekeeping never runs the full VACUUM the switch takes
+        assert db.reclaim_space() == 0
+        assert db.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    finally:
+        db.close()
+
+    assert Database.enable_incremental_vacuum(tmp_path)
+    assert not Database.enable_incremental_vacuum(tmp_path)
+    db = Database(tmp_path)
+    try:
+        assert db.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    finally:
+        db.close()
+
+
+def test_compaction_rolls_up_without_losing_plays(tmp_path):
+    make_legacy_db(tmp_path)
+    db = Database(tmp_path)
+    try:
+        db.add_to_history(SONG)
+        db.flush()
+        # Batches smaller than the backlog, every old play lands in history_daily exactly once
+        while db.compact_history("2021-01-01 00:00:00", batch_size=2):
+            pass
+        assert db.conn.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 1
+        daily = db.conn.execute("SELECT day, video_id, plays FROM history_daily ORDER BY day, video_id").fetchall()
+        assert daily == [("2020-01-01", "aaaaaaaaaaa", 1), ("2020-01-02", "aaaaaaaaaaa", 1), ("2020-01-02", "bbbbbbbbbbb", 1)]
+        assert db.play_count("aaaaaaaaaaa") == 3
+        assert db.has_history()
+    finally:
+        db.close()
+
+
+def test_expired_responses_are_pruned_on_open(tmp_path):
+    db = Database(tmp_path)
+    now = time.time()
+    db.set_cached_response("search", "recent", [SONG.to_json()], now - 3600)
+    db.set_cached_response("search", "ancient", [SONG.to_json()], now - ResponseCache.STALE_LIMIT - 60)
+    db.close()
+
+    db = Database(tmp_path)
+    try:
+        assert db.get_cached_response("search", "recent") is not None
+        assert db.get_cached_response("search", "ancient") is None
+    finally:
+        db.close()
+
+
+# --- the writer thread ---
+
+def commits() -> int:
+    return next((row["count"] for row in tracer.stats() if row["span"] == "db.commit"), 0)
+
+
+def test_writes_queued_together_share_a_commit(tmp_path):
+    db = Database(tmp_path)
+    try:
+        before = commits()
+        for i in range(200):
+            db.add_to_history(Track.create(f"v{i:010d}", f"Song {i}", ("Artist",), 180))
+        db.flush()
+        assert db.conn.execute("SELECT COUNT(*) FROM history").fetchone()[0] == 200
+        # Nothing waited on them one by one, so they went out in a handful of group commits
+        assert commits() - before < 20
+    finally:
+        db.close()
+
+
+def test_failing_write_only_loses_itself(tmp_path):
+    db = Database(tmp_path)
+
+    def broken(cursor):
+        cursor.execute("INSERT INTO playlist (video_id, title, artist, duration) VALUES ('zzzzzzzzzzz', 'x', '', 0)")
+        raise ValueError("broken write")
+
+    try:
+        # Queued back to back so they land in one batch
+        db.add_to_playlist(SONG)
+        failed = Future()
+        db._writes.put((broken, failed, True))
+        db.add_to_playlist(Track.create("bbbbbbbbbbb", "Other", ("Artist",), 60))
+        db.flush()
+
+        with pytest.raises(ValueError):
+            failed.result(timeout=5)
+        saved = {row[0] for row in db.conn.execute("SELECT video_id FROM playlist")}
+        assert saved == {SONG.id, "bbbbbbbbbbb"}
+        # And the writer is still there for the next one
+        assert db._write(lambda cursor: "still here", wait=True) == "still here"
+    finally:
+        db.close()
+
+
+def test_writes_after_close_are_refused(tmp_path):
+    db = Database(tmp_path)
+    db.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.add_to_history(SONG)
@@ -0,0 +1,59 @@
+import json
+
+from core.database import Database
+from core.playlist_io import PlaylistImporter, read_json, read_m3u
+
+
+def test_read_m3u_extinf_variants(tmp_path):
+    path = tmp_path / "list.m3u"
+    path.write_text(
+        "#EXTM3U\n"
+        '#EXTINF:-1 tvg-id="x" tvg-name="a, b",Artist - Title\n'
+        "https://youtu.be/dQw4w9WgXcQ\n"
+        "#EXTINF:213.5,Foo - Bar\n"
+        "https://www.youtube.com/watch?v=aaaaaaaaaaa\n"
+        "#EXTINF:abc,Just Title\n"
+        "https://www.youtube.com/watch?v=bbbbbbbbbbb\n",
+        encoding="utf-8",
+    )
+    tracks = list(read_m3u(path))
+    assert [(t.title, t.artists, t.duration) for t in tracks] == [
+        ("Title", ("Artist",), 0),
+        ("Bar", ("Foo",), 213),
+        ("Just Title", (), 0),
+    ]
+
+
+def test_read_json_skips_items_that_are_not_tracks(tmp_path):
+    path = tmp_path / "list.json"
+    path.write_text(json.dumps([
+        {"id": "aaaaaaaaaaa", "title": "Song", "artist": "Artist", "duration": "3:00"},
+        "bbbbbbbbbbb",
+        42,
+        {"title": "no id"},
+        ["ccccccccccc", "Listed", ["Someone"], 60],
+    ]), encoding="utf-8")
+    tracks = list(read_json(path))
+    assert [track and track.id for track in tracks] == ["aaaaaaaaaaa", None, None, None, "ccccccccccc"]
+
+
+class NoLookups:
+    def get_track(self, video_id):
+        return None
+
+
+def test_importer_counts_unreadable_entries(tmp_path):
+    path = tmp_path / "list.m3u"
+    path.write_text(
+        "#EXTINF:200,Artist - Song\n"
+        "https://www.youtube.com/watch?v=aaaaaaaaaaa\n"
+        "/home/me/music/local.mp3\n"
+        "https://example.com/stream\n",
+        encoding="utf-8",
+    )
+    db = Database(tmp_path)
+    try:
+        stats = PlaylistImporter(db, api=NoLookups()).run(str(path))
+    finally:
+        db.close()
+    assert stats == {"read": 3, "added": 1, "resolved": 0, "failed": 0, "unreadable": 2}
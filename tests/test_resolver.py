@@ -0,0 +1,144 @@
+import copy
+import threading
+import time
+
+import pytest
+
+from core.bandwidth import FormatPolicy, ThroughputMeter
+from core.resolver import StreamResolver, Superseded
+
+yt_dlp = pytest.importorskip("yt_dlp")
+
+# What YouTube lists for a song, cut down to the audio-only formats
+INFO = {
+    "id": "dQw4w9WgXcQ",
+    "title": "Synthetic",
+    "extractor": "youtube",
+    "extractor_key": "Youtube",
+    "webpage_url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "formats": [
+        {"format_id": itag, "url": f"https://rr1---sn-test.googlevideo.com/videoplayback?itag={itag}",
+         "ext": ext, "acodec": acodec, "vcodec": "none", "abr": abr, "tbr": abr}
+        for itag, ext, acodec, abr in (
+            ("249", "webm", "opus", 50),
+            ("250", "webm", "opus", 70),
+            ("140", "m4a", "mp4a.40.2", 128),
+            ("251", "webm", "opus", 160),
+        )
+    ],
+}
+
+
+class SyntheticYoutubeDL(yt_dlp.YoutubeDL):
+    """A real YoutubeDL, only the network half of extract_info is skipped."""
+
+    def extract_info(self, url, download=False, **kwargs):
+        return self.process_ie_result(copy.deepcopy(INFO), download=download)
+
+
+def make_resolver(quality: str):
+    policy = FormatPolicy(ThroughputMeter(), quality=quality)
+    resolver = StreamResolver(disk_cache=False, ydl_class=SyntheticYoutubeDL, strategies=["default"], format_policy=policy)
+    return resolver, policy
+
+
+def test_fresh_extractor_follows_tier():
+    resolver, _ = make_resolver("low")
+    url = resolver._extract(INFO["id"])
+    assert url.endswith("itag=250")
+    assert resolver.stream_format(url)["tier"] == "low"
+
+
+def test_pooled_extractor_switches_tier():
+    resolver, policy = make_resolver("high")
+    assert resolver._extract(INFO["id"]).endswith("itag=251")
+
+    # Same pooled YoutubeDL instance, the new tier has to reach its format selector
+    policy.quality = "low"
+    assert resolver._created["default"] == 1
+    assert resolver._extract(INFO["id"]).endswith("itag=250")
+
+    policy.quality = "lowest"
+    assert resolver._extract(INFO["id"]).endswith("itag=249")
+    assert resolver._created["default"] == 1
+
+
+def test_superseded_resolve_stops_waiting_for_extractor():
+    release = threading.Event()
+
+    class BlockingYoutubeDL(SyntheticYoutubeDL):
+        def extract_info(self, url, download=False, **kwargs):
+            release.wait(5)
+            return super().extract_info(url, download=download, **kwargs)
+
+    resolver = StreamResolver(disk_cache=False, ydl_class=BlockingYoutubeDL, strategies=["default"], pool_size=1)
+    busy = threading.Thread(target=resolver.get_stream_url, args=(INFO["id"],))
+    busy.start()
+    try:
+        # The only extractor is taken, a request that is no longer wanted gives up instead of queueing for it
+        with pytest.raises(Superseded):
+            resolver.get_stream_url("other", wanted=lambda: False)
+        assert resolver.strategy_stats()["default"]["failures"] == 0
+    finally:
+        release.set()
+        busy.join()
+
+
+def test_attempt_timeout_starts_at_checkout():
+    class SlowYoutubeDL(SyntheticYoutubeDL):
+        def extract_info(self, url, download=False, **kwargs):
+            time.sleep(0.3)
+            return super().extract_info(url, download=download, **kwargs)
+
+    resolver = StreamResolver(disk_cache=False, ydl_class=SlowYoutubeDL, strategies=["default"], pool_size=1,
+                              hedge_after=None, attempt_timeout=0.5)
+    first = threading.Thread(target=resolver.get_stream_url, args=("first",))
+    first.start()
+    time.sleep(0.05)
+    # Waits about 0.25s for the only extractor, then extracts for 0.3s: over 0.5s in total, but not once it started
+    assert resolver.get_stream_url(INFO["id"]).endswith("itag=251")
+    first.join()
+    assert resolver.strategy_stats()["default"]["timeouts"] == 0
+
+
+def test_waiting_for_an_extractor_is_not_a_strategy_failure():
+    release = threading.Event()
+
+    class BlockingYoutubeDL(SyntheticYoutubeDL):
+        def extract_info(self, url, download=False, **kwargs):
+            release.wait(5)
+            return super().extract_info(url, download=download, **kwargs)
+
+    resolver = StreamResolver(disk_cache=False, ydl_class=BlockingYoutubeDL, strategies=["default"], pool_size=1,
+                              hedge_after=None, attempt_timeout=0.2)
+    busy = threading.Thread(target=lambda: pytest.raises(TimeoutError, resolver.get_stream_url, "busy"))
+    busy.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(TimeoutError, match="came free"):
+            resolver.get_stream_url(INFO["id"])
+        busy.join()
+        # Only the attempt that actually held the extractor counts against the strategy
+        assert resolver.strategy_stats()["default"]["timeouts"] == 1
+    finally:
+        release.set()
+
+
+def test_failed_extractor_construction_frees_its_slot():
+    attempts = []
+
+    class FlakyYoutubeDL(SyntheticYoutubeDL):
+        def __init__(self, params=None, **kwargs):
+            attempts.append(1)
+            if len(attempts) <= 2:
+                raise ValueError("bad options")
+            super().__init__(params, **kwargs)
+
+    resolver = StreamResolver(disk_cache=False, ydl_class=FlakyYoutubeDL, strategies=["default"], pool_size=1,
+                              hedge_after=None)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            resolver.get_stream_url(INFO["id"])
+    assert resolver._created["default"] == 0
+    # Would block forever on an empty pool if the failed constructions still held the slot
+    assert resolver.get_stream_url(INFO["id"]).endswith("itag=251")
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from core.scheduler import PlaybackRequest, PlaybackScheduler
+from core.track import Track
+
+
+def request(n: int) -> PlaybackRequest:
+    return PlaybackRequest(Track.create(f"v{n:010d}", f"Song {n}", ("Artist",), 180))
+
+
+class Recorder:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.resolved = []
+        self.ready = []
+        self.done = threading.Event()
+
+    def resolve(self, video_id, wanted=None):
+        self.resolved.append((video_id, time.monotonic()))
+        time.sleep(self.delay)
+        return f"https://example.com/{video_id}"
+
+    def on_ready(self, request, url):
+        self.ready.append(request.video_id)
+        self.done.set()
+
+
+def test_lone_request_is_not_delayed():
+    recorder = Recorder()
+    scheduler = PlaybackScheduler(recorder.resolve, recorder.on_ready, debounce=0.5)
+    submitted = time.monotonic()
+    scheduler.submit(request(1))
+    assert recorder.done.wait(2)
+    assert recorder.resolved[0][1] - submitted < 0.2
+
+
+def test_burst_collapses_to_first_and_last():
+    recorder = Recorder()
+    scheduler = PlaybackScheduler(recorder.resolve, recorder.on_ready, debounce=0.2)
+    for n in range(5):
+        scheduler.submit(request(n))
+    time.sleep(0.5)
+    # The first goes out straight away, the ones queued behind it within the window collapse into the last
+    assert [video_id for video_id, _ in recorder.resolved] == [request(0).video_id, request(4).video_id]
+    assert recorder.ready == [request(4).video_id]
+
+
+def test_immediate_request_skips_the_window():
+    recorder = Recorder()
+    scheduler = PlaybackScheduler(recorder.resolve, recorder.on_ready, debounce=1.0)
+    scheduler.submit(request(1))
+    submitted = time.monotonic()
+    scheduler.submit(request(2), immediate=True)
+    time.sleep(0.2)
+    assert [video_id for video_id, _ in recorder.resolved] == [request(1).video_id, request(2).video_id]
+    assert recorder.resolved[1][1] - submitted < 0.2
+
+
+def test_stale_result_is_dropped():
+    recorder = Recorder(delay=0.2)
+    scheduler = PlaybackScheduler(recorder.resolve, recorder.on_ready, debounce=0.0)
+    first = scheduler.submit(request(1))
+    scheduler.submit(request(2), immediate=True)
+    assert not scheduler.is_current(first)
+    time.sleep(0.5)
+    assert recorder.ready == [request(2).video_id]
+
+
+def test_cancel_drops_everything_in_flight():
+    recorder = Recorder(delay=0.1)
+    scheduler = PlaybackScheduler(recorder.resolve, recorder.on_ready, debounce=0.0)
+    scheduler.submit(request(1))
+    scheduler.cancel()
+    time.sleep(0.3)
+    assert recorder.ready == []
+
+
+def test_resolve_is_told_when_it_stops_being_wanted():
+    checks = []
+    started = threading.Event()
+
+    def resolve(video_id, wanted=None):
+        checks.append(wanted)
+        started.set()
+        return video_id
+
+    scheduler = PlaybackScheduler(resolve, lambda request, url: None, debounce=0.0)
+    scheduler.submit(request(1))
+    assert started.wait(2)
+    assert checks[0]()
+    scheduler.submit(request(2), immediate=True)
+    assert not checks[0]()
@@ -0,0 +1,54 @@
+from core.database import Database
+from core.track import Track, format_duration, parse_duration, split_artists
+
+
+def test_json_round_trip():
+    track = Track.create("aaaaaaaaaaa", "Song", ("Artist", "Guest"), "3:45")
+    assert Track.from_json(track.to_json()) == track
+    # Snapshots from before Track stored plain dicts
+    legacy = {"id": "aaaaaaaaaaa", "title": "Song", "artist": "Artist, Guest", "duration": "3:45"}
+    assert Track.from_json(legacy) == track
+
+
+def test_database_round_trip(tmp_path):
+    db = Database(tmp_path)
+    try:
+        for track in (Track.create("aaaaaaaaaaa", "Song", ("Artist", "Guest"), "1:02:03"),
+                      Track.create("bbbbbbbbbbb", "Nobody credited", (), 0)):
+            db.add_to_playlist(track)
+            db.flush()
+            assert db.get_known_tracks([track.id])[track.id] == track
+    finally:
+        db.close()
+
+
+def test_artist_stays_raw_and_only_display_falls_back():
+    anonymous = Track.create("aaaaaaaaaaa", "Song", split_artists("Unknown Artist"), 0)
+    assert anonymous.artists == ()
+    assert anonymous.artist == ""
+    assert anonymous.display_artist == "Unknown Artist"
+    assert Track.create("aaaaaaaaaaa", "Song", ("A", "B"), 0).display_artist == "A, B"
+
+
+def test_durations():
+    assert parse_duration("3:45") == 225
+    assert parse_duration("1:02:03") == 3723
+    assert parse_duration("Unknown") == 0
+    assert format_duration(3723) == "1:02:03"
+    assert format_duration(225) == "3:45"
+    assert format_duration(0) == "Unknown"
+
+
+def test_remove_by_title_finds_rows_with_no_artist(tmp_path):
+    db = Database(tmp_path)
+    try:
+        for artist in ("", "Unknown Artist"):
+            db._write(lambda cursor, artist=artist: cursor.execute(
+                "INSERT INTO playlist (video_id, title, artist, duration) VALUES (?, ?, ?, 0)",
+                (f"id{len(artist):09d}", f"Song {artist!r}", artist)), wait=True)
+        for video_id, title, artist, duration in db.conn.execute("SELECT * FROM playlist").fetchall():
+            track = Track.from_row((video_id, title, artist, duration))
+            assert db.remove_by_title(track.title, track.artist)
+        assert db.conn.execute("SELECT COUNT(*) FROM playlist").fetchone()[0] == 0
+    finally:
+        db.close()